@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.core.metrics import write_behind_dropped
+from app.core.serialization import dumps
+
+
+logger = logging.getLogger(__name__)
+
+# Rejections caused by the content of some row (bad value, constraint); a
+# batch refused with one of these is bisected. Anything else (auth, missing
+# table) fails every row alike, so the batch is dropped whole.
+_ROW_ERRORS = {400, 409, 422}
+
+
+class WriteBehindQueue:
+    """Buffer rows in memory and insert them into a PostgREST table in batches.
+
+    Rows are flushed when `max_batch` rows are pending or `flush_interval`
+    seconds after the first row of a batch arrived, whichever comes first.
+    The queue is bounded: `put` waits up to `enqueue_timeout` for room and
+    then raises `asyncio.QueueFull` so the caller can fall back to a direct
+    write. Failed batches are retried with jittered exponential backoff on
+    5xx/429/transport errors. A batch rejected with a 4xx is split in halves
+    and resent, so only the rows PostgREST actually refuses are dropped.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        headers: Dict[str, str],
+        *,
+        name: str = "write-behind",
+        max_batch: int = 100,
+        flush_interval: float = 0.5,
+        max_pending: int = 5000,
+        enqueue_timeout: float = 2.0,
+        max_retries: int = 5,
+        retry_base: float = 0.5,
+        retry_max: float = 10.0,
+    ):
+        self.client = client
+        self.url = url
+        self.headers = {**headers, "Prefer": "return=minimal"}
+        self.name = name
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.flushed_rows = 0
+        self.flushed_batches = 0
+        self.dropped_rows = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_pending))
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def capacity(self) -> int:
+        return self._queue.maxsize
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=f"{self.name}-flusher")
+
+    async def put(self, row: Dict[str, Any]) -> None:
+        if self._closing or self._task is None:
+            raise asyncio.QueueFull()
+        try:
+            await asyncio.wait_for(self._queue.put(row), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            raise asyncio.QueueFull()
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait until every row put so far has been flushed (or dropped).
+
+        Returns False if rows were still pending after `timeout` seconds.
+        """
+        if self._task is None:
+            return self.depth == 0
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Stop accepting rows and flush whatever is still buffered."""
+        self._closing = True
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error("%s: shutdown drain timed out with %d rows pending", self.name, self.depth)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch: List[Dict[str, Any]] = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                # Anything _send doesn't expect (an unencodable row, a bug)
+                # costs this batch only; the flusher keeps running.
+                self._drop(batch, "error", f"{type(e).__name__}: {e}", exc_info=True)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        rejected = await self._send(batch)
+        if rejected is None:
+            return
+        status, error = rejected
+        if len(batch) > 1 and status in _ROW_ERRORS:
+            # One bad row fails the whole insert; bisect to find it rather
+            # than lose the other sessions' rows sharing the batch.
+            middle = len(batch) // 2
+            await self._flush(batch[:middle])
+            await self._flush(batch[middle:])
+            return
+        self._drop(batch, "rejected", error)
+
+    async def _send(self, batch: List[Dict[str, Any]]) -> Optional[Tuple[int, str]]:
+        """Insert one batch, retrying transient failures.
+
+        Returns (status, error) when PostgREST rejects it with a 4xx, else
+        None: the rows were written, or dropped after the last retry.
+        """
+        body = dumps(batch)  # encoded once, reused by every retry
+        for attempt in range(self.max_retries + 1):
+            retryable = True
+            try:
+                resp = await self.client.post(self.url, headers=self.headers, content=body)
+                if resp.status_code // 100 == 2:
+                    self.flushed_rows += len(batch)
+                    self.flushed_batches += 1
+                    return None
+                retryable = resp.status_code >= 500 or resp.status_code == 429
+                error = f"HTTP {resp.status_code}: {resp.text}"
+            except httpx.HTTPError as e:
+                error = f"{type(e).__name__}: {e}"
+            if not retryable:
+                return resp.status_code, error
+            if attempt == self.max_retries:
+                break
+            delay = random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt))
+            logger.warning("%s: flush of %d rows failed (%s), retrying in %.2fs", self.name, len(batch), error, delay)
+            await asyncio.sleep(delay)
+        self._drop(batch, "retries_exhausted", error)
+        return None
+
+    def _drop(self, batch: List[Dict[str, Any]], reason: str, error: str, exc_info: bool = False) -> None:
+        self.dropped_rows += len(batch)
+        write_behind_dropped.labels(self.name, reason).inc(len(batch))
+        logger.error("%s: dropping %d rows (%s): %s", self.name, len(batch), reason, error, exc_info=exc_info)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.depth,
+            "flushed_rows": self.flushed_rows,
+            "flushed_batches": self.flushed_batches,
+            "dropped_rows": self.dropped_rows,
+        }
@@ -0,0 +1,136 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from fastapi import Request
+
+from app.core.config import Settings
+
+
+class _LeaderCancelled(Exception):
+    """The caller running a shared load was cancelled before it finished."""
+
+
+class TTLCache:
+    """Bounded in-process LRU cache with per-entry expiry.
+
+    `get_or_load` adds single-flight semantics: concurrent misses for the same
+    key share one loader call instead of racing each other upstream.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value
+
+            pending = self._inflight.get(key)
+            if pending is None:
+                return await self._load(key, loader)
+            try:
+                return await asyncio.shield(pending)
+            except _LeaderCancelled:
+                continue  # the loading request went away; load (or join) again
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            # Only the caller that ran the loader was cancelled (e.g. its
+            # client disconnected); the others retry instead of failing too.
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a failure nobody else awaited isn't logged.
+            future.exception()
+            raise
+        else:
+            if value is not None:
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "inflight": len(self._inflight),
+        }
+
+
+@dataclass(frozen=True)
+class Caches:
+    """The per-process caches shared by routes and the dispatcher."""
+
+    # session_id -> latest AI request_id; /api/store-request refreshes entries
+    ai_sessions: TTLCache
+    # request_photos rows by (column, value) for /api/admin/photos
+    photo_rows: TTLCache
+    # storage path -> (signed URL, unix expiry) for /api/admin/photos
+    signed_urls: TTLCache
+    # Telegram file_id per stored object, backed by request_photos.telegram_file_id
+    telegram_file_ids: TTLCache
+
+
+def create_caches(settings: Settings) -> Caches:
+    photos = settings.photos
+    # Signed URLs leave the cache well before the signature runs out, so a URL
+    # handed out stays usable for a while.
+    margin = max(1, min(300, photos.signed_url_ttl // 10))
+    return Caches(
+        ai_sessions=TTLCache(settings.ai.session_cache_size, settings.ai.session_cache_ttl),
+        photo_rows=TTLCache(photos.row_cache_size, photos.row_cache_ttl),
+        signed_urls=TTLCache(photos.signed_url_cache_size, max(1, photos.signed_url_ttl - margin)),
+        telegram_file_ids=TTLCache(settings.telegram.file_id_cache_size, settings.telegram.file_id_cache_ttl),
+    )
+
+
+def get_caches(request: Request) -> Caches:
+    return request.app.state.caches
@@ -1,5 +1,8 @@
 import os
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
 
 
 def get_env(name: str, default: Optional[str] = None) -> str:
@@ -14,3 +17,702 @@ def get_env(name: str, default: Optional[str] = None) -> str:
     return value
 
 
+def get_int_env(name: str, default: int) -> int:
+    """Fetch an integer env var, failing fast on malformed values."""
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        raise RuntimeError(f"Env var {name} must be an integer, got {raw!r}")
+
+
+def get_float_env(name: str, default: float) -> float:
+    """Fetch a float env var, failing fast on malformed values."""
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        raise RuntimeError(f"Env var {name} must be a number, got {raw!r}")
+
+
+def get_bool_env(name: str, default: bool) -> bool:
+    """Fetch a boolean env var (1/true/yes/on vs 0/false/no/off)."""
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    value = raw.strip().lower()
+    if value in ("1", "true", "yes", "on"):
+        return True
+    if value in ("0", "false", "no", "off"):
+        return False
+    raise RuntimeError(f"Env var {name} must be a boolean, got {raw!r}")
+
+
+def _choice_env(name: str, choices: tuple, default: str) -> str:
+    value = get_env(name, default).strip().lower()
+    if value not in choices:
+        raise RuntimeError(f"Env var {name} must be one of {', '.join(choices)}, got {value!r}")
+    return value
+
+
+# Typed settings, built once at startup (see load_settings) and injected with
+# the get_settings dependency. Header dicts are prebuilt here so routes don't
+# rebuild them per request; treat them as read-only.
+
+INTEGRATIONS = ("supabase", "telegram", "telnyx")
+
+
+@dataclass(frozen=True)
+class SupabaseSettings:
+    url: str
+    service_role_key: str
+    storage_bucket: str
+    headers: Dict[str, str] = field(default_factory=dict)
+    json_headers: Dict[str, str] = field(default_factory=dict)
+    # json_headers plus `Prefer: return=representation` (inserts that need the id back)
+    returning_headers: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.url and self.service_role_key)
+
+    def table_url(self, table: str) -> str:
+        return f"{self.url}/rest/v1/{table}"
+
+    def object_url(self, path: str) -> str:
+        return f"{self.url}/storage/v1/object/{self.storage_bucket}/{path}"
+
+
+@dataclass(frozen=True)
+class TelegramSettings:
+    bot_token: str
+    chat_id: str
+    api_base: str
+    # Minimum spacing between sends to one chat
+    chat_min_interval: float
+    # Media groups uploaded at once for one chat
+    media_parallelism: int
+    # Lifetime of the signed storage URLs handed to Telegram
+    signed_url_ttl: int
+    file_id_cache_size: int
+    file_id_cache_ttl: float
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.bot_token and self.chat_id)
+
+    def method_url(self, method: str) -> str:
+        return f"{self.api_base}/bot{self.bot_token}/{method}"
+
+
+@dataclass(frozen=True)
+class TelnyxSettings:
+    api_key: str
+    from_number: str
+    profile_id: str
+    webhook_url: str
+    webhook_failover_url: str
+    api_base: str
+    headers: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key and self.profile_id)
+
+    @property
+    def messages_url(self) -> str:
+        return f"{self.api_base}/v2/messages"
+
+
+@dataclass(frozen=True)
+class ImageSettings:
+    format: str
+    quality: int
+    # The stored original is re-encoded too, capped at this size
+    original_max_side: int
+    preview_max_side: int
+    thumb_max_side: int
+    # Also keep the uploaded bytes as-is (with their EXIF/GPS metadata)
+    keep_raw: bool
+    # Decode/resize in a process pool; off processes inline
+    processing: bool
+    workers: int
+
+
+@dataclass(frozen=True)
+class OutboxSettings:
+    directory: str
+    max_attempts: int
+    batch_size: int
+    lease_seconds: float
+    poll_interval: float
+    backoff_base: float
+    backoff_max: float
+    retention_seconds: float
+    # ai_messages rows fetched per round trip while rendering a transcript
+    transcript_page_size: int
+    # How long /api/send-transcript waits for this worker's buffered ai_messages
+    transcript_drain_timeout: float
+
+
+@dataclass(frozen=True)
+class AISettings:
+    # session_id -> latest AI request_id
+    session_cache_size: int
+    session_cache_ttl: float
+    # Hedge the session lookup after this many seconds (0 = off)
+    lookup_hedge_delay: float
+    write_behind: bool
+    batch_size: int
+    flush_interval: float
+    max_pending: int
+    enqueue_timeout: float
+    max_retries: int
+
+
+@dataclass(frozen=True)
+class PhotoSettings:
+    # Lifetime of the signed URLs /api/admin/photos redirects to
+    signed_url_ttl: int
+    signed_url_cache_size: int
+    row_cache_size: int
+    row_cache_ttl: float
+    # Cache-Control max-age for content-addressed objects
+    cache_max_age: int
+
+
+# Upstreams that get their own long-lived connection pool. Supabase REST and
+# Storage share a host but have very different payload sizes and timeouts, so
+# they are pooled separately.
+UPSTREAMS = ("supabase", "storage", "telegram", "telnyx")
+
+_DEFAULT_TIMEOUTS = {
+    "supabase": 20.0,
+    "storage": 60.0,
+    "telegram": 60.0,
+    "telnyx": 20.0,
+}
+
+# Calls slower than this count as failures for the circuit breaker.
+_DEFAULT_SLOW_CALLS = {
+    "supabase": 5.0,
+    "storage": 30.0,
+    "telegram": 20.0,
+    "telnyx": 10.0,
+}
+
+
+@dataclass(frozen=True)
+class UpstreamSettings:
+    """Connection pool, timeouts and circuit breaker for one upstream."""
+
+    max_connections: int
+    max_keepalive: int
+    keepalive_expiry: float
+    timeout: float
+    connect_timeout: float
+    pool_timeout: float
+    http2: bool
+    breaker: bool
+    breaker_failure_rate: float
+    breaker_min_calls: int
+    breaker_window: float
+    # Calls slower than this count as failures
+    breaker_slow_call: float
+    breaker_open_seconds: float
+    breaker_half_open_calls: int
+
+
+MB = 1024 * 1024
+
+
+@dataclass
+class BodyLimit:
+    max_body: int
+    max_files: Optional[int] = None
+    max_file: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class BodyLimitSettings:
+    upload: BodyLimit
+    # One PUT /api/upload/sessions/{id} chunk
+    upload_chunk: BodyLimit
+    telegram_upload: BodyLimit
+    document: BodyLimit
+    # Every other route
+    default: BodyLimit
+
+
+@dataclass(frozen=True)
+class RateLimitSettings:
+    enabled: bool
+    # (pattern, tokens per second, burst), most specific pattern first
+    rules: Tuple[Tuple[str, float, int], ...]
+    # `memory`, `redis`, or `package.module:factory`
+    backend: str
+    max_keys: int
+    redis_url: str
+    # Trusted x-forwarded-for entries (our own proxies)
+    forwarded_hops: int
+    # Shed limited routes once this many upstream calls are in flight (0 = off)
+    shed_inflight: int
+
+
+@dataclass(frozen=True)
+class IdempotencySettings:
+    ttl: float
+    cache_size: int
+    lock_seconds: float
+    wait_timeout: float
+    # Also record keys in Supabase, so they hold across workers and restarts
+    persist: bool
+
+
+@dataclass(frozen=True)
+class ProbeSettings:
+    interval: float
+    timeout: float
+    # Consecutive failures before an upstream counts as down
+    failure_threshold: int
+
+
+@dataclass(frozen=True)
+class UploadSessionSettings:
+    directory: str
+    ttl: float
+    gc_interval: float
+    # Unfinished sessions one client IP may hold at once (0 = no cap)
+    max_per_ip: int
+
+
+@dataclass(frozen=True)
+class WorkerSettings:
+    # Shared by all workers (set by app.server); empty = single worker, no heartbeat
+    state_dir: str
+    heartbeat_interval: float
+
+
+@dataclass(frozen=True)
+class ServerSettings:
+    # 0 = one worker per available CPU
+    web_concurrency: int
+    host: str
+    port: int
+    loop: str
+    http: str
+    keep_alive_timeout: int
+    graceful_timeout: int
+    access_log: bool
+    # Seconds to keep serving (health 503) after SIGTERM
+    drain_delay: float
+
+
+@dataclass(frozen=True)
+class Settings:
+    supabase: SupabaseSettings
+    telegram: TelegramSettings
+    telnyx: TelnyxSettings
+    images: ImageSettings
+    outbox: OutboxSettings
+    ai: AISettings
+    photos: PhotoSettings
+    http: Dict[str, UpstreamSettings]
+    limits: BodyLimitSettings
+    rate_limits: RateLimitSettings
+    # (pattern, seconds) end-to-end upstream budgets, most specific pattern first
+    deadlines: Tuple[Tuple[str, float], ...]
+    idempotency: IdempotencySettings
+    probes: ProbeSettings
+    upload_sessions: UploadSessionSettings
+    workers: WorkerSettings
+    server: ServerSettings
+    required_integrations: Tuple[str, ...]
+    # Bearer token for /api/admin/*; empty disables the admin API
+    admin_token: str
+    store_request_rpc: bool
+    store_request_concurrency: int
+    upload_concurrency: int
+    upload_dedup_global: bool
+    admin_export_page_size: int
+    # Readiness fails once the ai_messages buffer is this full
+    ready_max_queue_fill: float
+
+
+def _supabase_settings() -> SupabaseSettings:
+    url = get_env("SUPABASE_URL", "").strip().rstrip("/")
+    key = get_env("SUPABASE_SERVICE_ROLE_KEY", "").strip()
+    if url and not url.startswith(("http://", "https://")):
+        raise RuntimeError(f"SUPABASE_URL must be an http(s) URL, got {url!r}")
+    headers = {"apikey": key, "Authorization": f"Bearer {key}"}
+    json_headers = {**headers, "Content-Type": "application/json"}
+    return SupabaseSettings(
+        url=url,
+        service_role_key=key,
+        storage_bucket=get_env("SUPABASE_STORAGE_BUCKET", "uploads"),
+        headers=headers,
+        json_headers=json_headers,
+        returning_headers={**json_headers, "Prefer": "return=representation"},
+    )
+
+
+def _telegram_settings() -> TelegramSettings:
+    return TelegramSettings(
+        bot_token=get_env("TELEGRAM_BOT_TOKEN", "").strip(),
+        chat_id=get_env("TELEGRAM_CHAT_ID", "").strip(),
+        api_base=get_env("TELEGRAM_API_BASE", "https://api.telegram.org").rstrip("/"),
+        chat_min_interval=get_float_env("TELEGRAM_CHAT_MIN_INTERVAL", 1.0),
+        media_parallelism=max(1, get_int_env("TELEGRAM_MEDIA_PARALLELISM", 2)),
+        signed_url_ttl=get_int_env("TELEGRAM_SIGNED_URL_TTL", 600),
+        file_id_cache_size=get_int_env("TELEGRAM_FILE_ID_CACHE_SIZE", 10000),
+        file_id_cache_ttl=get_float_env("TELEGRAM_FILE_ID_CACHE_TTL", 86400.0),
+    )
+
+
+def _telnyx_settings() -> TelnyxSettings:
+    api_key = get_env("TELNYX_API_KEY", "").strip()
+    return TelnyxSettings(
+        api_key=api_key,
+        from_number=get_env("TELNYX_FROM", "+19803167792"),
+        profile_id=get_env("TELNYX_PROFILE_ID", "").strip(),
+        webhook_url=get_env("TELNYX_WEBHOOK_URL", ""),
+        webhook_failover_url=get_env("TELNYX_WEBHOOK_FAILOVER_URL", ""),
+        api_base=get_env("TELNYX_API_BASE", "https://api.telnyx.com").rstrip("/"),
+        headers={
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}",
+        },
+    )
+
+
+def _outbox_settings() -> OutboxSettings:
+    return OutboxSettings(
+        directory=get_env("OUTBOX_DIR", "./data/outbox"),
+        max_attempts=get_int_env("OUTBOX_MAX_ATTEMPTS", 8),
+        batch_size=get_int_env("OUTBOX_BATCH_SIZE", 50),
+        lease_seconds=get_float_env("OUTBOX_LEASE_SECONDS", 120.0),
+        poll_interval=get_float_env("OUTBOX_POLL_INTERVAL", 1.0),
+        backoff_base=get_float_env("OUTBOX_BACKOFF_BASE", 2.0),
+        backoff_max=get_float_env("OUTBOX_BACKOFF_MAX", 300.0),
+        retention_seconds=get_float_env("OUTBOX_RETENTION_DAYS", 7.0) * 86400,
+        transcript_page_size=max(1, get_int_env("TRANSCRIPT_PAGE_SIZE", 500)),
+        transcript_drain_timeout=get_float_env("TRANSCRIPT_DRAIN_TIMEOUT", 2.0),
+    )
+
+
+def _ai_settings() -> AISettings:
+    return AISettings(
+        session_cache_size=get_int_env("AI_SESSION_CACHE_SIZE", 10000),
+        session_cache_ttl=get_float_env("AI_SESSION_CACHE_TTL", 900.0),
+        lookup_hedge_delay=get_float_env("AI_LOOKUP_HEDGE_DELAY", 0.0),
+        write_behind=get_bool_env("AI_MESSAGES_WRITE_BEHIND", True),
+        batch_size=get_int_env("AI_MESSAGES_BATCH_SIZE", 100),
+        flush_interval=get_float_env("AI_MESSAGES_FLUSH_INTERVAL", 0.5),
+        max_pending=get_int_env("AI_MESSAGES_MAX_PENDING", 5000),
+        enqueue_timeout=get_float_env("AI_MESSAGES_ENQUEUE_TIMEOUT", 2.0),
+        max_retries=get_int_env("AI_MESSAGES_MAX_RETRIES", 5),
+    )
+
+
+def _photo_settings() -> PhotoSettings:
+    return PhotoSettings(
+        signed_url_ttl=max(1, get_int_env("PHOTO_SIGNED_URL_TTL", 3600)),
+        signed_url_cache_size=get_int_env("PHOTO_SIGNED_URL_CACHE_SIZE", 10000),
+        row_cache_size=get_int_env("PHOTO_ROW_CACHE_SIZE", 10000),
+        row_cache_ttl=get_float_env("PHOTO_ROW_CACHE_TTL", 300.0),
+        cache_max_age=get_int_env("PHOTO_CACHE_MAX_AGE", 31536000),
+    )
+
+
+def _upstream_settings(upstream: str) -> UpstreamSettings:
+    """Per-upstream knobs (``SUPABASE_HTTP_MAX_CONNECTIONS``), falling back to global ones (``HTTP_MAX_CONNECTIONS``)."""
+    prefix = upstream.upper()
+
+    def _int(name: str, default: int) -> int:
+        return get_int_env(f"{prefix}_HTTP_{name}", get_int_env(f"HTTP_{name}", default))
+
+    def _float(name: str, default: float) -> float:
+        return get_float_env(f"{prefix}_HTTP_{name}", get_float_env(f"HTTP_{name}", default))
+
+    return UpstreamSettings(
+        max_connections=_int("MAX_CONNECTIONS", 50),
+        max_keepalive=_int("MAX_KEEPALIVE", 20),
+        keepalive_expiry=_float("KEEPALIVE_EXPIRY", 30.0),
+        timeout=_float("TIMEOUT", _DEFAULT_TIMEOUTS[upstream]),
+        connect_timeout=_float("CONNECT_TIMEOUT", 5.0),
+        pool_timeout=_float("POOL_TIMEOUT", 5.0),
+        http2=get_bool_env(f"{prefix}_HTTP2", get_bool_env("HTTP2", False)),
+        breaker=get_bool_env(f"{prefix}_HTTP_BREAKER", get_bool_env("HTTP_BREAKER", True)),
+        breaker_failure_rate=_float("BREAKER_FAILURE_RATE", 0.5),
+        breaker_min_calls=_int("BREAKER_MIN_CALLS", 20),
+        breaker_window=_float("BREAKER_WINDOW", 30.0),
+        breaker_slow_call=_float("BREAKER_SLOW_CALL", _DEFAULT_SLOW_CALLS[upstream]),
+        breaker_open_seconds=_float("BREAKER_OPEN_SECONDS", 15.0),
+        breaker_half_open_calls=_int("BREAKER_HALF_OPEN_CALLS", 3),
+    )
+
+
+def _body_limit(prefix: str, body_mb: float, files: int, file_mb: float) -> BodyLimit:
+    return BodyLimit(
+        max_body=int(get_float_env(f"{prefix}_MAX_BODY_MB", body_mb) * MB),
+        max_files=get_int_env(f"{prefix}_MAX_FILES", files),
+        max_file=int(get_float_env(f"{prefix}_MAX_FILE_MB", file_mb) * MB),
+    )
+
+
+def _limit_settings() -> BodyLimitSettings:
+    return BodyLimitSettings(
+        upload=_body_limit("UPLOAD", 100, 20, 25),
+        upload_chunk=BodyLimit(max_body=int(get_float_env("UPLOAD_CHUNK_MB", 4) * MB)),
+        # Telegram accepts documents up to 50 MB; bigger files can't be delivered anyway.
+        telegram_upload=_body_limit("TELEGRAM_UPLOAD", 200, 30, 50),
+        document=_body_limit("DOCUMENT", 51, 1, 50),
+        default=BodyLimit(max_body=int(get_float_env("REQUEST_MAX_BODY_MB", 1) * MB)),
+    )
+
+
+# Public endpoints that cost us provider quota or database writes. A pattern
+# may start with a method to limit only that method on the path.
+# Override or extend with RATE_LIMITS="/api/send-sms=3/min,/api/upload=off".
+DEFAULT_RATE_LIMITS = {
+    "/api/send-sms": "5/min",
+    "/api/send-telegram*": "20/min",
+    "/api/send-document": "10/min",
+    "/api/send-transcript": "10/min",
+    "/api/upload": "30/min",
+    # Creating a session reserves disk for a whole file; chunks are cheap.
+    "POST /api/upload/sessions": "30/min",
+    "/api/upload/sessions*": "600/min",
+    "/api/store-request": "10/min",
+    "/api/ai/*": "120/min",
+}
+
+_PERIODS = {"s": 1, "sec": 1, "second": 1, "m": 60, "min": 60, "minute": 60, "h": 3600, "hour": 3600, "d": 86400, "day": 86400}
+
+
+def parse_limit(spec: str) -> Optional[Tuple[float, int]]:
+    """`"20/min"` -> (rate per second, burst); `"off"` -> None."""
+    spec = spec.strip().lower()
+    if spec in ("off", "none", "0"):
+        return None
+    try:
+        count, period = spec.split("/", 1)
+        return int(count) / _PERIODS[period.strip()], int(count)
+    except (ValueError, KeyError):
+        raise RuntimeError(f"Invalid rate limit {spec!r} (expected e.g. 20/min or off)")
+
+
+def _rate_limit_rules() -> Tuple[Tuple[str, float, int], ...]:
+    specs = dict(DEFAULT_RATE_LIMITS)
+    for entry in get_env("RATE_LIMITS", "").split(","):
+        if not entry.strip():
+            continue
+        pattern, sep, spec = entry.partition("=")
+        if not sep:
+            raise RuntimeError(f"Invalid RATE_LIMITS entry {entry!r} (expected /path=N/period)")
+        specs[" ".join(pattern.split())] = spec
+    rules = []
+    for pattern, spec in specs.items():
+        method, _, path = pattern.rpartition(" ")
+        if not path.startswith("/") or method not in ("", method.upper()):
+            raise RuntimeError(f"Invalid RATE_LIMITS pattern {pattern!r} (expected [METHOD ]/path)")
+        limit = parse_limit(spec)
+        if limit is not None:
+            rules.append((pattern, *limit))
+
+    # Most specific pattern wins; a method-specific rule beats the same path without one.
+    def specificity(rule):
+        method, _, path = rule[0].rpartition(" ")
+        return path.endswith("*"), -len(path), not method
+
+    return tuple(sorted(rules, key=specificity))
+
+
+def _rate_limit_settings() -> RateLimitSettings:
+    backend = get_env("RATE_LIMIT_BACKEND", "memory").strip()
+    if backend not in ("memory", "redis") and not backend.partition(":")[2]:
+        raise RuntimeError(f"Unknown RATE_LIMIT_BACKEND {backend!r} (expected memory, redis or module:factory)")
+    return RateLimitSettings(
+        enabled=get_bool_env("RATE_LIMIT_ENABLED", True),
+        rules=_rate_limit_rules(),
+        backend=backend,
+        max_keys=get_int_env("RATE_LIMIT_MAX_KEYS", 100_000),
+        redis_url=get_env("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0"),
+        forwarded_hops=get_int_env("RATE_LIMIT_FORWARDED_HOPS", 0),
+        shed_inflight=get_int_env("LOAD_SHED_UPSTREAM_INFLIGHT", 150),
+    )
+
+
+def parse_deadlines(spec: str) -> List[Tuple[str, float]]:
+    """`/api/store-request=10,/api/ai/*=6` -> [(pattern, seconds)]; 0 or `off` disables."""
+    rules = []
+    for entry in filter(None, (e.strip() for e in spec.split(","))):
+        pattern, sep, value = entry.partition("=")
+        try:
+            seconds = 0.0 if value.strip() == "off" else float(value)
+        except ValueError:
+            seconds = -1.0
+        if not sep or not pattern.startswith("/") or seconds < 0:
+            raise RuntimeError(f"Invalid REQUEST_DEADLINES entry {entry!r} (expected /path=seconds)")
+        rules.append((pattern.strip(), seconds))
+    return rules
+
+
+# Routes that chain several upstream calls while a visitor waits. Uploads,
+# exports and anything not listed run without a budget.
+DEFAULT_DEADLINES = "/api/store-request=10,/api/ai/*=6,/api/send-*=5"
+
+
+def _deadlines() -> Tuple[Tuple[str, float], ...]:
+    deadlines = dict(parse_deadlines(DEFAULT_DEADLINES))
+    deadlines.update(parse_deadlines(get_env("REQUEST_DEADLINES", "")))
+    # exact paths first, then longer prefixes
+    return tuple(sorted(deadlines.items(), key=lambda r: (r[0].endswith("*"), -len(r[0]))))
+
+
+def _server_settings() -> ServerSettings:
+    return ServerSettings(
+        web_concurrency=get_int_env("WEB_CONCURRENCY", 0),
+        host=get_env("HOST", "0.0.0.0"),
+        port=get_int_env("PORT", 8080),
+        loop=get_env("UVICORN_LOOP", "uvloop"),
+        http=get_env("UVICORN_HTTP", "httptools"),
+        keep_alive_timeout=get_int_env("KEEP_ALIVE_TIMEOUT", 5),
+        graceful_timeout=get_int_env("GRACEFUL_TIMEOUT", 30),
+        access_log=get_bool_env("ACCESS_LOG", False),
+        drain_delay=get_float_env("DRAIN_DELAY", 0.0),
+    )
+
+
+def _range_problems(settings: Settings) -> List[str]:
+    """Knobs that parse fine but would break or silently disable a component."""
+    limits = settings.limits
+    checks = {
+        "HTTP_MAX_CONNECTIONS must be at least 1": all(u.max_connections >= 1 for u in settings.http.values()),
+        "HTTP_MAX_KEEPALIVE must not be negative": all(u.max_keepalive >= 0 for u in settings.http.values()),
+        "HTTP timeouts must be positive": all(
+            min(u.timeout, u.connect_timeout, u.pool_timeout) > 0 for u in settings.http.values()
+        ),
+        "HTTP_BREAKER_FAILURE_RATE must be in (0, 1]": all(
+            0 < u.breaker_failure_rate <= 1 for u in settings.http.values()
+        ),
+        "HTTP_BREAKER_MIN_CALLS and HTTP_BREAKER_HALF_OPEN_CALLS must be at least 1": all(
+            u.breaker_min_calls >= 1 and u.breaker_half_open_calls >= 1 for u in settings.http.values()
+        ),
+        "HTTP_BREAKER_WINDOW and HTTP_BREAKER_OPEN_SECONDS must be positive": all(
+            u.breaker_window > 0 and u.breaker_open_seconds > 0 for u in settings.http.values()
+        ),
+        "IMAGE_WORKERS must be at least 1": settings.images.workers >= 1,
+        "*_MAX_BODY_MB and UPLOAD_CHUNK_MB must be positive": all(
+            limit.max_body > 0
+            for limit in (limits.upload, limits.upload_chunk, limits.telegram_upload, limits.document, limits.default)
+        ),
+        "*_MAX_FILES and *_MAX_FILE_MB must be at least 1": all(
+            limit.max_files >= 1 and limit.max_file > 0
+            for limit in (limits.upload, limits.telegram_upload, limits.document)
+        ),
+        "RATE_LIMIT_MAX_KEYS must be at least 1": settings.rate_limits.max_keys >= 1,
+        "RATE_LIMIT_FORWARDED_HOPS must not be negative": settings.rate_limits.forwarded_hops >= 0,
+        "IDEMPOTENCY_TTL, IDEMPOTENCY_LOCK_SECONDS and IDEMPOTENCY_WAIT_TIMEOUT must be positive": min(
+            settings.idempotency.ttl, settings.idempotency.lock_seconds, settings.idempotency.wait_timeout
+        ) > 0,
+        "PROBE_INTERVAL and PROBE_TIMEOUT must be positive": min(settings.probes.interval, settings.probes.timeout) > 0,
+        "PROBE_FAILURE_THRESHOLD must be at least 1": settings.probes.failure_threshold >= 1,
+        "UPLOAD_SESSION_TTL and UPLOAD_SESSION_GC_INTERVAL must be positive": min(
+            settings.upload_sessions.ttl, settings.upload_sessions.gc_interval
+        ) > 0,
+        "UPLOAD_SESSION_MAX_PER_IP must not be negative": settings.upload_sessions.max_per_ip >= 0,
+        "WORKER_HEARTBEAT_INTERVAL must be positive": settings.workers.heartbeat_interval > 0,
+        "WEB_CONCURRENCY must not be negative": settings.server.web_concurrency >= 0,
+        "PORT must be between 1 and 65535": 1 <= settings.server.port <= 65535,
+    }
+    return [problem for problem, ok in checks.items() if not ok]
+
+
+def load_settings() -> Settings:
+    """Read and validate all configuration; raises RuntimeError on bad config.
+
+    Integrations listed in REQUIRED_INTEGRATIONS (default: supabase) must be
+    fully configured. The others may be left out entirely (their routes then
+    answer "not configured"), but not half-configured.
+    """
+    required = tuple(name.strip() for name in get_env("REQUIRED_INTEGRATIONS", "supabase").split(",") if name.strip())
+    settings = Settings(
+        supabase=_supabase_settings(),
+        telegram=_telegram_settings(),
+        telnyx=_telnyx_settings(),
+        images=ImageSettings(
+            format=_choice_env("IMAGE_FORMAT", ("jpeg", "webp"), "jpeg").upper(),
+            quality=get_int_env("IMAGE_QUALITY", 82),
+            original_max_side=get_int_env("IMAGE_ORIGINAL_MAX_SIDE", 4096),
+            preview_max_side=get_int_env("IMAGE_PREVIEW_MAX_SIDE", 1600),
+            thumb_max_side=get_int_env("IMAGE_THUMB_MAX_SIDE", 320),
+            keep_raw=get_bool_env("IMAGE_KEEP_RAW", False),
+            processing=get_bool_env("IMAGE_PROCESSING", True),
+            workers=get_int_env("IMAGE_WORKERS", min(4, os.cpu_count() or 1)),
+        ),
+        outbox=_outbox_settings(),
+        ai=_ai_settings(),
+        photos=_photo_settings(),
+        http={name: _upstream_settings(name) for name in UPSTREAMS},
+        limits=_limit_settings(),
+        rate_limits=_rate_limit_settings(),
+        deadlines=_deadlines(),
+        idempotency=IdempotencySettings(
+            ttl=get_float_env("IDEMPOTENCY_TTL", 86400.0),
+            cache_size=get_int_env("IDEMPOTENCY_CACHE_SIZE", 2000),
+            lock_seconds=get_float_env("IDEMPOTENCY_LOCK_SECONDS", 120.0),
+            wait_timeout=get_float_env("IDEMPOTENCY_WAIT_TIMEOUT", 30.0),
+            persist=get_bool_env("IDEMPOTENCY_PERSIST", True),
+        ),
+        probes=ProbeSettings(
+            interval=get_float_env("PROBE_INTERVAL", 15.0),
+            timeout=get_float_env("PROBE_TIMEOUT", 3.0),
+            failure_threshold=get_int_env("PROBE_FAILURE_THRESHOLD", 2),
+        ),
+        upload_sessions=UploadSessionSettings(
+            directory=get_env("UPLOAD_SESSION_DIR", "./data/uploads"),
+            ttl=get_float_env("UPLOAD_SESSION_TTL", 86400.0),
+            gc_interval=get_float_env("UPLOAD_SESSION_GC_INTERVAL", 600.0),
+            max_per_ip=get_int_env("UPLOAD_SESSION_MAX_PER_IP", 20),
+        ),
+        workers=WorkerSettings(
+            state_dir=get_env("WORKER_STATE_DIR", ""),
+            heartbeat_interval=get_float_env("WORKER_HEARTBEAT_INTERVAL", 5.0),
+        ),
+        server=_server_settings(),
+        required_integrations=required,
+        admin_token=get_env("ADMIN_API_TOKEN", "").strip(),
+        store_request_rpc=get_bool_env("STORE_REQUEST_RPC", False),
+        store_request_concurrency=max(1, get_int_env("STORE_REQUEST_CONCURRENCY", 4)),
+        upload_concurrency=max(1, get_int_env("UPLOAD_CONCURRENCY", 4)),
+        upload_dedup_global=_choice_env("UPLOAD_DEDUP_SCOPE", ("global", "request"), "global") == "global",
+        admin_export_page_size=max(1, get_int_env("ADMIN_EXPORT_PAGE_SIZE", 500)),
+        ready_max_queue_fill=get_float_env("READY_MAX_QUEUE_FILL", 0.9),
+    )
+
+    problems = [f"unknown integration {name!r} in REQUIRED_INTEGRATIONS" for name in required if name not in INTEGRATIONS]
+    problems.extend(_range_problems(settings))
+    partial = {
+        "supabase": ("SUPABASE_URL", "SUPABASE_SERVICE_ROLE_KEY"),
+        "telegram": ("TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID"),
+        "telnyx": ("TELNYX_API_KEY", "TELNYX_PROFILE_ID"),
+    }
+    for name, env_names in partial.items():
+        missing = [env for env in env_names if not os.getenv(env, "").strip()]
+        if name in required and missing:
+            problems.append(f"{name} is required but {', '.join(missing)} not set")
+        elif missing and len(missing) < len(env_names):
+            problems.append(f"{name} is half-configured: {', '.join(missing)} not set")
+    if problems:
+        raise RuntimeError("Invalid configuration: " + "; ".join(problems))
+    return settings
+
+
+def get_settings(request: Request) -> Settings:
+    return request.app.state.settings
@@ -0,0 +1,81 @@
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import httpx
+from fastapi import Request
+
+from app.core.config import UPSTREAMS, Settings, UpstreamSettings
+from app.core.metrics import InstrumentedTransport
+from app.core.resilience import CircuitBreaker, ResilientTransport
+
+
+@dataclass
+class HttpClients:
+    supabase: httpx.AsyncClient
+    storage: httpx.AsyncClient
+    telegram: httpx.AsyncClient
+    telnyx: httpx.AsyncClient
+    # upstream -> connection pool size, for saturation reporting
+    max_connections: Dict[str, int] = field(default_factory=dict)
+    breakers: Dict[str, CircuitBreaker] = field(default_factory=dict)
+
+    def all(self) -> list[httpx.AsyncClient]:
+        return [getattr(self, name) for name in UPSTREAMS]
+
+
+def _build_breaker(upstream: str, settings: UpstreamSettings) -> Optional[CircuitBreaker]:
+    if not settings.breaker:
+        return None
+    return CircuitBreaker(
+        upstream,
+        failure_rate=settings.breaker_failure_rate,
+        min_calls=settings.breaker_min_calls,
+        window=settings.breaker_window,
+        slow_call=settings.breaker_slow_call,
+        open_seconds=settings.breaker_open_seconds,
+        half_open_calls=settings.breaker_half_open_calls,
+    )
+
+
+def _build_client(
+    upstream: str, settings: UpstreamSettings, breaker: Optional[CircuitBreaker] = None
+) -> httpx.AsyncClient:
+    """Create a pooled client for one upstream."""
+    limits = httpx.Limits(
+        max_connections=settings.max_connections,
+        max_keepalive_connections=settings.max_keepalive,
+        keepalive_expiry=settings.keepalive_expiry,
+    )
+    timeout = httpx.Timeout(settings.timeout, connect=settings.connect_timeout, pool=settings.pool_timeout)
+    transport = InstrumentedTransport(httpx.AsyncHTTPTransport(limits=limits, http2=settings.http2), upstream)
+    return httpx.AsyncClient(transport=ResilientTransport(transport, breaker), timeout=timeout)
+
+
+def create_clients(settings: Settings) -> HttpClients:
+    breakers = {name: _build_breaker(name, settings.http[name]) for name in UPSTREAMS}
+    return HttpClients(
+        **{name: _build_client(name, settings.http[name], breakers[name]) for name in UPSTREAMS},
+        max_connections={name: settings.http[name].max_connections for name in UPSTREAMS},
+        breakers={name: breaker for name, breaker in breakers.items() if breaker is not None},
+    )
+
+
+async def close_clients(clients: HttpClients) -> None:
+    for client in clients.all():
+        await client.aclose()
+
+
+def get_supabase_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http.supabase
+
+
+def get_storage_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http.storage
+
+
+def get_telegram_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http.telegram
+
+
+def get_telnyx_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http.telnyx
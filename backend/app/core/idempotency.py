@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException, Request
+
+from app.core.cache import TTLCache
+from app.core.config import Settings, SupabaseSettings
+from app.core.serialization import dumps_canonical
+
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def fingerprint(*parts: Any) -> str:
+    """Stable hash of a request's meaningful content (JSON-normalized)."""
+    return hashlib.sha256(dumps_canonical(parts)).hexdigest()
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+class IdempotencyStore:
+    """Replays the first successful response for a repeated Idempotency-Key.
+
+    Lookups hit an in-process LRU first; concurrent duplicates in one worker
+    share the in-flight call. Across workers and restarts, keys live in the
+    `idempotency_keys` table: the first worker claims the key with a
+    `pending` row, the others poll it until the response is recorded.
+    Only 2xx responses are stored, so a failed request can simply be retried.
+    If the table is unavailable the store degrades to in-process only.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        supabase: SupabaseSettings,
+        *,
+        ttl: float,
+        cache_size: int,
+        lock_seconds: float,
+        wait_timeout: float,
+        persist: bool = True,
+    ):
+        self.client = client
+        self.url = supabase.table_url("idempotency_keys")
+        self.headers = supabase.json_headers
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        self.wait_timeout = wait_timeout
+        self.persist = persist
+        self.cache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self._last_purge = 0.0
+
+    async def run(
+        self,
+        scope: str,
+        key: str,
+        request_fingerprint: str,
+        handler: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Return (response body, replayed)."""
+        cache_key = (scope, key)
+        owner = False
+
+        async def load() -> Dict[str, Any]:
+            nonlocal owner
+            record = await self._lookup_or_claim(scope, key, request_fingerprint)
+            if record is not None:
+                return record
+            owner = True
+            try:
+                body = await handler()
+            except BaseException:
+                await self._release(scope, key)
+                raise
+            record = {"fingerprint": request_fingerprint, "response": body}
+            await self._save(scope, key, record)
+            return record
+
+        record = await self.cache.get_or_load(cache_key, load)
+        if record["response"] is None:
+            # Another worker is handling this key for a different payload;
+            # don't let the placeholder shadow its real response later.
+            self.cache.pop(cache_key)
+        if record["fingerprint"] != request_fingerprint:
+            raise HTTPException(status_code=422, detail=f"{IDEMPOTENCY_HEADER} was already used with a different request")
+        return record["response"], not owner
+
+    # Supabase-backed persistence
+
+    async def _lookup_or_claim(self, scope: str, key: str, request_fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Return a stored record, or None once this worker owns the key."""
+        if not self.persist:
+            return None
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.05
+        try:
+            await self._maybe_purge()
+            while True:
+                now = time.time()
+                resp = await self.client.post(
+                    self.url,
+                    params={"on_conflict": "scope,key"},
+                    headers={**self.headers, "Prefer": "return=representation,resolution=ignore-duplicates"},
+                    json=[{
+                        "scope": scope,
+                        "key": key,
+                        "fingerprint": request_fingerprint,
+                        "status": "pending",
+                        "expires_at": _iso(now + self.lock_seconds),
+                    }],
+                )
+                if resp.status_code // 100 != 2:
+                    logger.warning("Idempotency claim failed, continuing without it: %s", resp.text)
+                    return None
+                if resp.json():
+                    return None  # inserted: we own the key
+
+                existing = await self._fetch(scope, key)
+                if existing is None:
+                    continue  # vanished between insert and select (released/purged)
+                if existing["status"] == "done":
+                    return {"fingerprint": existing["fingerprint"], "response": existing["response"]}
+                if existing["expires_at"] <= datetime.now(timezone.utc):
+                    # The worker holding the claim died; take the key over.
+                    await self._delete(scope, key, expired_only=True)
+                    continue
+                if existing["fingerprint"] != request_fingerprint:
+                    return {"fingerprint": existing["fingerprint"], "response": None}
+                if time.monotonic() >= deadline:
+                    raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 1.0)
+        except httpx.HTTPError as e:
+            logger.warning("Idempotency lookup failed, continuing without it: %s", e)
+            return None
+
+    async def _fetch(self, scope: str, key: str) -> Optional[Dict[str, Any]]:
+        resp = await self.client.get(
+            self.url,
+            headers=self.headers,
+            params={"select": "fingerprint,status,response,expires_at", "scope": f"eq.{scope}", "key": f"eq.{key}"},
+        )
+        if resp.status_code // 100 != 2:
+            raise httpx.HTTPError(f"select idempotency_keys failed: {resp.text}")
+        rows = resp.json() or []
+        if not rows:
+            return None
+        row = rows[0]
+        row["expires_at"] = datetime.fromisoformat(row["expires_at"])
+        return row
+
+    async def _save(self, scope: str, key: str, record: Dict[str, Any]) -> None:
+        if not self.persist:
+            return
+        try:
+            resp = await self.client.patch(
+                self.url,
+                headers={**self.headers, "Prefer": "return=minimal"},
+                params={"scope": f"eq.{scope}", "key": f"eq.{key}"},
+                json={"status": "done", "response": record["response"], "expires_at": _iso(time.time() + self.ttl)},
+            )
+            if resp.status_code // 100 != 2:
+                logger.warning("Persisting idempotent response failed: %s", resp.text)
+        except httpx.HTTPError as e:
+            logger.warning("Persisting idempotent response failed: %s", e)
+
+    async def _release(self, scope: str, key: str) -> None:
+        if not self.persist:
+            return
+        try:
+            await self._delete(scope, key)
+        except httpx.HTTPError as e:
+            logger.warning("Releasing idempotency key failed: %s", e)
+
+    async def _delete(self, scope: str, key: str, expired_only: bool = False) -> None:
+        params = {"scope": f"eq.{scope}", "key": f"eq.{key}"}
+        if expired_only:
+            params["expires_at"] = f"lt.{_iso(time.time())}"
+        await self.client.delete(self.url, headers={**self.headers, "Prefer": "return=minimal"}, params=params)
+
+    async def _maybe_purge(self) -> None:
+        if time.monotonic() - self._last_purge < 3600:
+            return
+        self._last_purge = time.monotonic()
+        resp = await self.client.delete(
+            self.url,
+            headers={**self.headers, "Prefer": "return=minimal"},
+            params={"expires_at": f"lt.{_iso(time.time())}"},
+        )
+        if resp.status_code // 100 != 2:
+            logger.warning("Purging expired idempotency keys failed: %s", resp.text)
+
+
+def create_idempotency_store(client: httpx.AsyncClient, settings: Settings) -> IdempotencyStore:
+    options = settings.idempotency
+    return IdempotencyStore(
+        client,
+        settings.supabase,
+        ttl=options.ttl,
+        cache_size=options.cache_size,
+        lock_seconds=options.lock_seconds,
+        wait_timeout=options.wait_timeout,
+        persist=options.persist and settings.supabase.configured,
+    )
+
+
+def get_idempotency_store(request: Request) -> IdempotencyStore:
+    return request.app.state.idempotency
+
+
+def idempotency_key(request: Request, default: str) -> str:
+    """Client-supplied Idempotency-Key, else a key derived from the payload."""
+    key = (request.headers.get(IDEMPOTENCY_HEADER) or "").strip()
+    if len(key) > 255:
+        raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} is too long")
+    return key or default
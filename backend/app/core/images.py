@@ -0,0 +1,112 @@
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from fastapi import Request
+from PIL import Image, ImageOps
+
+from app.core.config import ImageSettings
+
+try:  # optional HEIC/HEIF support for iPhone photos
+    from pillow_heif import register_heif_opener
+
+    register_heif_opener()
+except ImportError:  # pragma: no cover - depends on optional package
+    pass
+
+
+_EXIF_ORIENTATION = 0x0112
+
+_FORMATS = {
+    "JPEG": ("image/jpeg", "jpg"),
+    "WEBP": ("image/webp", "webp"),
+}
+
+
+@dataclass(frozen=True)
+class Variant:
+    name: str
+    max_side: int
+
+
+@dataclass
+class ProcessedImage:
+    width: int
+    height: int
+    # variant name -> {"path", "width", "height", "size_bytes", "content_type", "ext"}
+    variants: Dict[str, dict]
+
+
+def image_variants(images: ImageSettings) -> List[Variant]:
+    # A derivative is never larger than the stored original.
+    cap = images.original_max_side
+    return [
+        Variant("original", cap),
+        Variant("preview", min(images.preview_max_side, cap)),
+        Variant("thumb", min(images.thumb_max_side, cap)),
+    ]
+
+
+def process_image(src_path: str, variants: List[Variant], fmt: str, quality: int) -> Optional[ProcessedImage]:
+    """Auto-orient, strip metadata and write size-capped re-encodes.
+
+    Runs in a worker process. Derivatives are written to temp files whose
+    paths are returned; the caller uploads and deletes them. Returns None
+    when the source is not a decodable image.
+    """
+    content_type, ext = _FORMATS[fmt]
+    out: Dict[str, dict] = {}
+    try:
+        with Image.open(src_path) as img:
+            width, height = img.size
+            if img.getexif().get(_EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+                width, height = height, width
+            largest = max(v.max_side for v in variants)
+            # Let the JPEG decoder downscale by 1/2..1/8 while decoding.
+            img.draft("RGB", (largest, largest))
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+
+            for variant in sorted(variants, key=lambda v: v.max_side, reverse=True):
+                derived = img.copy()
+                derived.thumbnail((variant.max_side, variant.max_side), Image.LANCZOS)
+                fd, path = tempfile.mkstemp(suffix=f".{ext}")
+                with os.fdopen(fd, "wb") as fh:
+                    # Saving without exif/icc arguments drops all metadata.
+                    derived.save(fh, fmt, quality=quality, optimize=True)
+                out[variant.name] = {
+                    "path": path,
+                    "width": derived.width,
+                    "height": derived.height,
+                    "size_bytes": os.path.getsize(path),
+                    "content_type": content_type,
+                    "ext": ext,
+                }
+                img = derived
+    except Exception:
+        for item in out.values():
+            discard_file(item["path"])
+        return None
+
+    return ProcessedImage(width=width, height=height, variants=out)
+
+
+def discard_file(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def create_image_pool(settings: ImageSettings) -> Optional[ProcessPoolExecutor]:
+    if not settings.processing:
+        return None
+    return ProcessPoolExecutor(max_workers=settings.workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def get_image_pool(request: Request) -> Optional[ProcessPoolExecutor]:
+    return getattr(request.app.state, "image_pool", None)
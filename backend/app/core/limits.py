@@ -0,0 +1,173 @@
+import json
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import MB, BodyLimit, BodyLimitSettings
+
+
+# PUT /api/upload/sessions/{id}: one chunk of a resumable upload
+CHUNK_ROUTE = "/api/upload/sessions/*"
+# Part headers are a few hundred bytes; anything bigger is not a real form.
+_MAX_PART_HEADER_BYTES = 16 * 1024
+
+
+def route_limits(settings: BodyLimitSettings) -> Dict[str, BodyLimit]:
+    """Per-route body limits (a trailing `*` matches by prefix); every other route gets `settings.default`."""
+    return {
+        "/api/upload": settings.upload,
+        CHUNK_ROUTE: settings.upload_chunk,
+        "/api/send-telegram-upload": settings.telegram_upload,
+        "/api/send-document": settings.document,
+    }
+
+
+def _too_large(detail: str) -> HTTPException:
+    return HTTPException(status_code=413, detail=detail)
+
+
+class MultipartScanner:
+    """Counts files and per-file bytes in a multipart stream as it arrives.
+
+    Only looks for part delimiters and the `filename=` of each part's
+    headers, so it never holds more than one chunk plus a delimiter.
+    """
+
+    def __init__(self, boundary: bytes, limit: BodyLimit):
+        self.delimiter = b"\r\n--" + boundary
+        self.limit = limit
+        # The first delimiter has no leading CRLF; pretend it does.
+        self.carry = b"\r\n"
+        self.in_part = False
+        self.header: Optional[bytearray] = None
+        self.is_file = False
+        self.part_bytes = 0
+        self.files = 0
+
+    def feed(self, chunk: bytes) -> None:
+        data = self.carry + chunk
+        start = 0
+        while True:
+            idx = data.find(self.delimiter, start)
+            if idx < 0:
+                break
+            self._consume(data[start:idx])
+            self.in_part = True
+            self.header = bytearray()
+            self.is_file = False
+            self.part_bytes = 0
+            start = idx + len(self.delimiter)
+        # Keep enough bytes to recognize a delimiter split across chunks.
+        tail = max(start, len(data) - len(self.delimiter) + 1)
+        self._consume(data[start:tail])
+        self.carry = data[tail:]
+
+    def _consume(self, segment: bytes) -> None:
+        if not self.in_part or not segment:
+            return
+        size = len(segment)
+        if self.header is not None:
+            self.header += segment
+            end = self.header.find(b"\r\n\r\n")
+            if end < 0:
+                if len(self.header) > _MAX_PART_HEADER_BYTES:
+                    raise _too_large("Multipart part headers too large")
+                return
+            self.is_file = b"filename=" in bytes(self.header[:end]).lower()
+            size = len(self.header) - end - 4
+            self.header = None
+            if self.is_file:
+                self.files += 1
+                if self.limit.max_files is not None and self.files > self.limit.max_files:
+                    raise _too_large(f"Too many files (max {self.limit.max_files})")
+        if self.is_file:
+            self.part_bytes += size
+            if self.limit.max_file is not None and self.part_bytes > self.limit.max_file:
+                raise _too_large(f"File too large (max {self.limit.max_file // MB} MB)")
+
+
+def _boundary(content_type: bytes) -> Optional[bytes]:
+    main, _, params = content_type.partition(b";")
+    if main.strip().lower() != b"multipart/form-data":
+        return None
+    for param in params.split(b";"):
+        key, _, value = param.strip().partition(b"=")
+        if key.lower() == b"boundary" and value:
+            return value.strip(b'"')
+    return None
+
+
+class BodyLimitMiddleware:
+    """Rejects oversized bodies with 413 while they stream in.
+
+    A declared Content-Length over the limit is refused before reading a
+    byte; otherwise the receive channel is metered, and multipart bodies are
+    scanned for file count and per-file size, so the form parser never spools
+    more than the limit to disk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        # Taken from app.state.settings on the first request (the middleware
+        # is built before the lifespan loads them).
+        self.limits: Optional[Dict[str, BodyLimit]] = None
+        self.default: Optional[BodyLimit] = None
+
+    def route_limit(self, path: str) -> BodyLimit:
+        limit = self.limits.get(path)
+        if limit is not None:
+            return limit
+        for pattern, limit in self.limits.items():
+            if pattern.endswith("*") and path.startswith(pattern[:-1]):
+                return limit
+        return self.default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS"):
+            await self.app(scope, receive, send)
+            return
+
+        if self.limits is None:
+            settings = scope["app"].state.settings.limits
+            self.limits, self.default = route_limits(settings), settings.default
+        limit = self.route_limit(scope["path"])
+        scanner = None
+        for name, value in scope.get("headers") or []:
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = 0
+                if declared > limit.max_body:
+                    await _reject(send, f"Request body too large (max {limit.max_body // MB} MB)")
+                    return
+            elif name == b"content-type" and (limit.max_files is not None or limit.max_file is not None):
+                boundary = _boundary(value)
+                if boundary:
+                    scanner = MultipartScanner(boundary, limit)
+
+        received = 0
+
+        async def metered_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                received += len(chunk)
+                if received > limit.max_body:
+                    raise _too_large(f"Request body too large (max {limit.max_body // MB} MB)")
+                if scanner is not None and chunk:
+                    scanner.feed(chunk)
+            return message
+
+        await self.app(scope, metered_receive, send)
+
+
+async def _reject(send, detail: str) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,190 @@
+import os
+import time
+from typing import Dict, Optional
+
+import httpx
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+
+# Upstream calls are mostly sub-second; uploads and Telegram media take longer.
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+http_requests = Counter(
+    "http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Time to fully send the response", ["method", "route"], buckets=_LATENCY_BUCKETS
+)
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight", "HTTP requests being handled", ["method"], multiprocess_mode="livesum"
+)
+
+upstream_requests = Counter(
+    "upstream_requests_total", "Calls to external services", ["upstream", "operation", "status"]
+)
+upstream_duration = Histogram(
+    "upstream_request_duration_seconds",
+    "Time from sending an upstream request until its response headers arrive",
+    ["upstream", "operation"],
+    buckets=_LATENCY_BUCKETS,
+)
+upstream_errors = Counter(
+    "upstream_errors_total", "Upstream calls that failed without a response", ["upstream", "operation", "error"]
+)
+upstream_in_flight = Gauge(
+    "upstream_requests_in_flight", "Upstream calls awaiting a response", ["upstream"], multiprocess_mode="livesum"
+)
+circuit_state = Gauge(
+    "upstream_circuit_state", "Circuit breaker state per upstream (0 closed, 1 half-open, 2 open)", ["upstream"],
+    multiprocess_mode="max",
+)
+short_circuited = Counter(
+    "upstream_short_circuited_total", "Upstream calls refused locally by an open circuit", ["upstream"]
+)
+write_behind_dropped = Counter(
+    "write_behind_dropped_rows_total", "Buffered rows given up on by a write-behind queue", ["queue", "reason"]
+)
+rate_limited = Counter(
+    "rate_limited_total", "Requests rejected by the rate limiter or load shedding", ["rule", "reason"]
+)
+
+# Plain per-process counts of requests being handled and upstream calls
+# awaiting a response; read on every request by the load shedder and by the
+# health check, so they avoid going through the metrics registry.
+_upstream_in_flight: Dict[str, int] = {}
+_http_in_flight = {"count": 0}
+
+
+def upstream_calls_in_flight(upstream: Optional[str] = None) -> int:
+    if upstream is not None:
+        return _upstream_in_flight.get(upstream, 0)
+    return sum(_upstream_in_flight.values())
+
+
+def http_calls_in_flight() -> int:
+    return _http_in_flight["count"]
+
+upload_bytes = Counter(
+    "upload_bytes_total", "Bytes written to Storage by /api/upload", ["kind"]
+)
+upload_files = Counter(
+    "upload_files_total", "Files received by /api/upload", ["outcome"]
+)
+image_processing_duration = Histogram(
+    "image_processing_seconds",
+    "Orientation/metadata strip/derivative generation per image (including pool wait)",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0),
+)
+
+
+def upstream_operation(upstream: str, path: str) -> str:
+    """Low-cardinality name for an upstream call: table, bucket op, or API method."""
+    parts = [p for p in path.split("/") if p]
+    if upstream == "supabase" and len(parts) >= 3 and parts[:2] == ["rest", "v1"]:
+        return "/".join(parts[2:4]) if parts[2] == "rpc" else parts[2]
+    if upstream == "storage" and len(parts) >= 3 and parts[:2] == ["storage", "v1"]:
+        return "/".join(parts[2:4]) if len(parts) > 3 and parts[3] in ("sign", "public", "authenticated") else parts[2]
+    if upstream == "telegram" and len(parts) >= 2 and parts[0].startswith("bot"):
+        return parts[1]
+    if upstream == "telnyx" and parts:
+        return "/".join(parts[-2:])
+    return "other"
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Wraps a pooled transport and records latency/status for every call.
+
+    Sits under the per-upstream clients in app.core.http, so every route and
+    background worker is measured without touching call sites.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, upstream: str):
+        self.transport = transport
+        self.upstream = upstream
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        operation = upstream_operation(self.upstream, request.url.path)
+        in_flight = upstream_in_flight.labels(self.upstream)
+        in_flight.inc()
+        _upstream_in_flight[self.upstream] = _upstream_in_flight.get(self.upstream, 0) + 1
+        start = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception as e:
+            upstream_errors.labels(self.upstream, operation, type(e).__name__).inc()
+            upstream_requests.labels(self.upstream, operation, "error").inc()
+            raise
+        finally:
+            in_flight.dec()
+            _upstream_in_flight[self.upstream] -= 1
+        upstream_duration.labels(self.upstream, operation).observe(time.perf_counter() - start)
+        upstream_requests.labels(self.upstream, operation, str(response.status_code)).inc()
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class MetricsMiddleware:
+    """Per-route request count, latency and in-flight gauge.
+
+    Routes are labelled by their path template (`/api/notifications/{job_id}`),
+    which FastAPI leaves in the ASGI scope after routing; unmatched paths share
+    one label so scanners can't blow up the series count.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = {"code": 500}
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        # The route is only known once the router has run, so in-flight is per method.
+        in_flight = http_requests_in_flight.labels(method)
+        in_flight.inc()
+        _http_in_flight["count"] += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            _http_in_flight["count"] -= 1
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            http_requests.labels(method, path, str(status["code"])).inc()
+            http_request_duration.labels(method, path).observe(time.perf_counter() - start)
+
+
+def mark_process_dead() -> None:
+    """Drop this worker's live gauges from the multiprocess aggregate on exit."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def render() -> tuple[bytes, str]:
+    """Exposition for this process, or for all workers when multiprocess mode is on."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
@@ -0,0 +1,583 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, Iterator, List, Optional
+
+from fastapi import Request
+
+from app.core import photos, telegram, transcripts
+from app.core.cache import Caches
+from app.core.config import OutboxSettings, Settings
+from app.core.http import HttpClients
+from app.core.telegram import DeliveryError, raise_for_delivery
+
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MAX_TEXT = 4096
+
+_SCHEMA = """
+create table if not exists jobs (
+  id integer primary key autoincrement,
+  kind text not null,
+  chat_key text not null,
+  payload text not null,
+  attachments text not null default '[]',
+  status text not null default 'pending',
+  attempts integer not null default 0,
+  next_attempt_at real not null,
+  lease_until real,
+  last_error text,
+  result text,
+  created_at real not null,
+  updated_at real not null
+);
+create index if not exists idx_jobs_due on jobs (status, next_attempt_at);
+create index if not exists idx_jobs_chat on jobs (chat_key, status, id);
+-- Earliest time (epoch seconds) the next send to a chat may start. Shared by
+-- every worker's dispatcher, so spacing and provider pauses hold across them.
+create table if not exists chat_throttle (
+  chat_key text primary key,
+  next_at real not null
+);
+"""
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    chat_key: str
+    payload: Dict[str, Any]
+    attachments: List[Dict[str, Any]] = field(default_factory=list)
+    attempts: int = 0
+
+
+class Outbox:
+    """Durable, file-backed (SQLite) queue of outbound notifications.
+
+    Jobs are claimed with a lease, so several worker processes can share one
+    database file; a job whose worker died is picked up again once the lease
+    runs out. Attachments are spooled into `<dir>/files` and deleted when
+    their job finishes.
+    """
+
+    def __init__(self, directory: str, max_attempts: int = 8):
+        self.directory = directory
+        self.files_dir = os.path.join(directory, "files")
+        self.db_path = os.path.join(directory, "outbox.sqlite3")
+        self.max_attempts = max_attempts
+        os.makedirs(self.files_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("pragma journal_mode=wal")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("pragma synchronous=normal")
+            yield conn
+        finally:
+            conn.close()
+
+    # Attachments
+
+    def spool(self, src: BinaryIO, filename: str, content_type: str) -> Dict[str, Any]:
+        """Copy a file object into the outbox files dir (chunked, never fully in memory)."""
+        path = os.path.join(self.files_dir, uuid.uuid4().hex)
+        src.seek(0)
+        with open(path, "wb") as out:
+            shutil.copyfileobj(src, out, 256 * 1024)
+        return {"path": path, "filename": filename, "content_type": content_type, "size": os.path.getsize(path)}
+
+    @staticmethod
+    def discard(attachments: List[Dict[str, Any]]) -> None:
+        """Remove attachment files from the files dir; missing files are ignored."""
+        for a in attachments:
+            try:
+                os.unlink(a["path"])
+            except OSError:
+                pass
+
+    # Queue operations (blocking; call through asyncio.to_thread)
+
+    def enqueue(
+        self,
+        kind: str,
+        chat_key: str,
+        payload: Dict[str, Any],
+        attachments: Optional[List[Dict[str, Any]]] = None,
+        delay: float = 0.0,
+    ) -> int:
+        """Add a job; `delay` holds it back (and later jobs for its chat) that many seconds."""
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                "insert into jobs (kind, chat_key, payload, attachments, next_attempt_at, created_at, updated_at) values (?, ?, ?, ?, ?, ?, ?)",
+                (kind, chat_key, json.dumps(payload, ensure_ascii=False), json.dumps(attachments or []), now + delay, now, now),
+            )
+            return int(cur.lastrowid)
+
+    def claim(self, limit: int, lease: float) -> List[Job]:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("begin immediate")
+            try:
+                # A job waits while an older job for the same chat is still
+                # pending (backing off or in flight) so chats keep their order,
+                # and while its chat is throttled by any worker's last send.
+                rows = conn.execute(
+                    "select id, kind, chat_key, payload, attachments, attempts from jobs j "
+                    "where status = 'pending' and next_attempt_at <= ? and (lease_until is null or lease_until <= ?) "
+                    "and not exists (select 1 from jobs e where e.chat_key = j.chat_key and e.status = 'pending' "
+                    "and e.id < j.id and (e.next_attempt_at > ? or e.lease_until > ?)) "
+                    "and not exists (select 1 from chat_throttle t where t.chat_key = j.chat_key and t.next_at > ?) "
+                    "order by id limit ?",
+                    (now, now, now, now, now, limit),
+                ).fetchall()
+                if rows:
+                    conn.executemany(
+                        "update jobs set lease_until = ?, updated_at = ? where id = ?",
+                        [(now + lease, now, r[0]) for r in rows],
+                    )
+                conn.execute("commit")
+            except BaseException:
+                conn.execute("rollback")
+                raise
+        return [
+            Job(id=r[0], kind=r[1], chat_key=r[2], payload=json.loads(r[3]), attachments=json.loads(r[4]), attempts=r[5])
+            for r in rows
+        ]
+
+    def complete(self, job: Job, result: Any = None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "update jobs set status = 'sent', lease_until = null, attempts = attempts + 1, result = ?, updated_at = ? where id = ?",
+                (json.dumps(result, ensure_ascii=False) if result is not None else None, time.time(), job.id),
+            )
+        self.discard(job.attachments)
+
+    def retry(self, job: Job, delay: float, error: str, permanent: bool = False) -> bool:
+        """Reschedule a failed job; returns False when it was given up on."""
+        attempts = job.attempts + 1
+        give_up = permanent or attempts >= self.max_attempts
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "update jobs set status = ?, attempts = ?, next_attempt_at = ?, lease_until = null, last_error = ?, updated_at = ? where id = ?",
+                ("failed" if give_up else "pending", attempts, now + delay, error[:2000], now, job.id),
+            )
+        if give_up:
+            self.discard(job.attachments)
+        return not give_up
+
+    def save_progress(self, job: Job) -> None:
+        """Persist `job.payload` so a retry can skip work that already succeeded."""
+        with self._connect() as conn:
+            conn.execute(
+                "update jobs set payload = ?, updated_at = ? where id = ?",
+                (json.dumps(job.payload, ensure_ascii=False), time.time(), job.id),
+            )
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "select id, kind, status, attempts, last_error, result, created_at, updated_at, payload from jobs where id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        payload = json.loads(row[8]) if row[8] else {}
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "attempts": row[3],
+            "last_error": row[4],
+            "result": json.loads(row[5]) if row[5] else None,
+            "created_at": row[6],
+            "updated_at": row[7],
+            "groups": payload.get("groups") or [],
+        }
+
+    def release(self, job: Job, delay: float) -> None:
+        """Put a claimed job back without counting an attempt (e.g. chat throttled)."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "update jobs set next_attempt_at = ?, lease_until = null, updated_at = ? where id = ?",
+                (now + delay, now, job.id),
+            )
+
+    def throttle_chat(self, chat_key: str, until: float) -> None:
+        """No job for `chat_key` is claimed (by any worker) before `until` (epoch seconds)."""
+        with self._connect() as conn:
+            conn.execute(
+                "insert into chat_throttle (chat_key, next_at) values (?, ?) "
+                "on conflict (chat_key) do update set next_at = max(next_at, excluded.next_at)",
+                (chat_key, until),
+            )
+
+    def purge(self, older_than: float) -> int:
+        with self._connect() as conn:
+            cur = conn.execute(
+                "delete from jobs where status in ('sent', 'failed') and updated_at < ?",
+                (time.time() - older_than,),
+            )
+            conn.execute("delete from chat_throttle where next_at < ?", (time.time(),))
+            return cur.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            rows = conn.execute("select status, count(*) from jobs group by status").fetchall()
+        return {status: n for status, n in rows}
+
+
+class _ChatThrottle:
+    """Minimum spacing between sends to one chat, plus provider-imposed pauses."""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self.next_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def blocked_for(self) -> float:
+        return max(0.0, self.next_at - time.monotonic())
+
+    async def wait(self) -> None:
+        delay = self.blocked_for()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def sent(self) -> None:
+        self.next_at = max(self.next_at, time.monotonic() + self.min_interval)
+
+    def pause(self, seconds: float) -> None:
+        self.next_at = max(self.next_at, time.monotonic() + seconds)
+
+
+class Dispatcher:
+    """Background worker that drains the outbox into Telegram and Telnyx.
+
+    - sends to one chat are serialized and spaced by a per-chat interval;
+      a 429 pauses that chat for the provider's `retry_after`. Both are
+      recorded in the outbox, so they hold across worker processes
+    - plain text messages due for the same chat are coalesced into one
+      sendMessage (up to Telegram's 4096 chars)
+    - 5xx/timeouts are retried with jittered exponential backoff; other 4xx
+      responses fail the job permanently
+    """
+
+    def __init__(self, outbox: Outbox, clients: HttpClients, settings: Settings, caches: Caches):
+        self.outbox = outbox
+        self.clients = clients
+        self.settings = settings
+        self.caches = caches
+        self.batch_size = settings.outbox.batch_size
+        self.lease = settings.outbox.lease_seconds
+        self.poll_interval = settings.outbox.poll_interval
+        self.backoff_base = settings.outbox.backoff_base
+        self.backoff_max = settings.outbox.backoff_max
+        self.retention = settings.outbox.retention_seconds
+        self.chat_interval = settings.telegram.chat_min_interval
+        self.media_parallelism = settings.telegram.media_parallelism
+        self.signed_url_ttl = settings.telegram.signed_url_ttl
+        self._throttles: Dict[str, _ChatThrottle] = {}
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="outbox-dispatcher")
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """Let in-flight sends finish (bounded by `timeout`), then stop polling."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def _throttle(self, chat_key: str) -> _ChatThrottle:
+        throttle = self._throttles.get(chat_key)
+        if throttle is None:
+            interval = self.chat_interval if chat_key.startswith("telegram:") else 0.0
+            throttle = self._throttles[chat_key] = _ChatThrottle(interval)
+        return throttle
+
+    async def _run(self) -> None:
+        last_purge = 0.0
+        while not self._stopping:
+            try:
+                jobs = await asyncio.to_thread(self.outbox.claim, self.batch_size, self.lease)
+            except Exception:
+                logger.exception("outbox: claim failed")
+                jobs = []
+            if jobs:
+                by_chat: Dict[str, List[Job]] = {}
+                for job in jobs:
+                    by_chat.setdefault(job.chat_key, []).append(job)
+                await asyncio.gather(*(self._dispatch_chat(key, chat_jobs) for key, chat_jobs in by_chat.items()))
+                continue
+
+            if time.monotonic() - last_purge > 3600:
+                last_purge = time.monotonic()
+                await asyncio.to_thread(self.outbox.purge, self.retention)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch_chat(self, chat_key: str, jobs: List[Job]) -> None:
+        throttle = self._throttle(chat_key)
+        # Once a send to this chat fails with a retryable error, later jobs are
+        # handed back with the same delay so the chat keeps its message order.
+        hold: Optional[float] = None
+        async with throttle.lock:
+            for group in self._coalesce(jobs):
+                blocked = throttle.blocked_for()
+                if hold is None and (blocked > 5 or self._stopping):
+                    # Chat is paused by the provider (or we're shutting down):
+                    # hand the jobs back rather than hold their lease.
+                    hold = blocked
+                if hold is not None:
+                    for job in group:
+                        await asyncio.to_thread(self.outbox.release, job, hold)
+                    continue
+                await throttle.wait()
+                try:
+                    result = await self._send(group)
+                except Exception as e:
+                    error = e if isinstance(e, DeliveryError) else DeliveryError(f"{type(e).__name__}: {e}")
+                    if error.retry_after:
+                        throttle.pause(float(error.retry_after))
+                    throttle.sent()
+                    # Recorded before the jobs are released, or another worker
+                    # could claim this chat's next job in between.
+                    await self._share_throttle(chat_key, throttle)
+                    delay = self._retry_delay(group[0], error)
+                    for job in group:
+                        await self._fail(job, error, delay)
+                    if not error.permanent:
+                        hold = delay
+                else:
+                    throttle.sent()
+                    await self._share_throttle(chat_key, throttle)
+                    for job in group:
+                        await asyncio.to_thread(self.outbox.complete, job, result)
+                finally:
+                    throttle.sent()
+
+    async def _share_throttle(self, chat_key: str, throttle: _ChatThrottle) -> None:
+        """Publish this chat's next allowed send time to the other workers."""
+        blocked = throttle.blocked_for()
+        if blocked <= 0:
+            return
+        try:
+            await asyncio.to_thread(self.outbox.throttle_chat, chat_key, time.time() + blocked)
+        except Exception:
+            logger.exception("outbox: could not record throttle for %s", chat_key)
+
+    def _coalesce(self, jobs: List[Job]) -> List[List[Job]]:
+        groups: List[List[Job]] = []
+        for job in jobs:
+            if job.kind == "telegram_message" and groups and groups[-1][0].kind == "telegram_message":
+                merged = sum(len(j.payload["text"]) + 2 for j in groups[-1]) + len(job.payload["text"])
+                if merged <= TELEGRAM_MAX_TEXT:
+                    groups[-1].append(job)
+                    continue
+            groups.append([job])
+        return groups
+
+    async def _send(self, group: List[Job]) -> Any:
+        job = group[0]
+        payload = job.payload
+        if job.kind == "telegram_message":
+            text = "\n\n".join(j.payload["text"] for j in group)
+            return await telegram.send_message(self.clients.telegram, self.settings.telegram, payload["chat_id"], text)
+        if job.kind == "telegram_media":
+            items = []
+            for a in job.attachments:
+                filename = a.get("filename") or "file"
+                content_type = a.get("content_type") or "application/octet-stream"
+                kind = telegram.classify(content_type, filename, a.get("size"))
+                items.append(telegram.MediaItem(kind or "", filename, content_type, path=a["path"]))
+            return await self._send_groups(job, items)
+        if job.kind == "telegram_document":
+            return await telegram.send_document(self.clients.telegram, self.settings.telegram, payload["chat_id"], payload.get("caption") or "", job.attachments[0])
+        if job.kind == "telegram_stored":
+            return await self._send_stored(job)
+        if job.kind == "telegram_transcript":
+            return await self._send_transcript(job)
+        if job.kind == "sms":
+            telnyx = self.settings.telnyx
+            if not telnyx.api_key:
+                raise DeliveryError("Telnyx not configured", permanent=True)
+            resp = await self.clients.telnyx.post(telnyx.messages_url, headers=telnyx.headers, json=payload)
+            raise_for_delivery(resp, "Telnyx send")
+            return resp.json()
+        raise DeliveryError(f"Unknown outbox job kind: {job.kind}", permanent=True)
+
+    async def _send_groups(
+        self,
+        job: Job,
+        items: List[telegram.MediaItem],
+        on_sent: Optional[Callable[[List[telegram.MediaItem], List[Optional[str]]], Awaitable[None]]] = None,
+    ) -> Dict[str, Any]:
+        """Send media split into Telegram-compliant groups, recording each group.
+
+        Per-group results are saved on the job, so a retry only resends the
+        groups that failed. Items Telegram can't take at all (`kind` empty)
+        are reported as skipped.
+        """
+        payload = job.payload
+        skipped = [it.filename for it in items if not it.kind]
+        groups = telegram.plan_groups([it for it in items if it.kind])
+        done = {g["index"]: g for g in payload.get("groups") or [] if g.get("ok")}
+        results = await telegram.send_planned(
+            self.clients.telegram,
+            self.settings.telegram,
+            payload["chat_id"],
+            payload.get("caption") or "",
+            groups,
+            skip=set(done),
+            parallelism=self.media_parallelism,
+        )
+        if on_sent is not None:
+            for r in results:
+                if r["ok"]:
+                    await on_sent(groups[r["index"]], r["file_ids"])
+
+        report = sorted([*done.values(), *results], key=lambda g: g["index"])
+        payload["groups"] = report
+        await asyncio.to_thread(self.outbox.save_progress, job)
+
+        failed = [r for r in results if not r["ok"]]
+        retryable = [r for r in failed if not r.get("permanent")]
+        if retryable or (failed and len(failed) == len(report)):
+            waits = [r["retry_after"] for r in retryable if r.get("retry_after")]
+            raise DeliveryError(
+                f"{len(failed)} of {len(report)} Telegram media groups failed: {failed[0]['error']}",
+                retry_after=max(waits) if waits else None,
+                permanent=not retryable,
+            )
+        if not groups and payload.get("caption"):
+            await telegram.send_message(self.clients.telegram, self.settings.telegram, payload["chat_id"], payload["caption"])
+        return {
+            "sent": sum(g["count"] for g in report if g["ok"]),
+            "failed": sum(g["count"] for g in report if not g["ok"]),
+            "skipped": skipped,
+            "groups": [{k: v for k, v in g.items() if k != "file_ids"} for g in report],
+        }
+
+    async def _send_stored(self, job: Job) -> Any:
+        """Forward already-stored photos without re-uploading their bytes.
+
+        Photos Telegram has seen before go by cached file_id; the rest by a
+        short-lived signed URL (the normalized preview when there is one)
+        that Telegram downloads itself. Originals that aren't photos, or are
+        too large for a photo by URL, go as documents.
+        """
+        payload = job.payload
+        rows = await photos.resolve_photos(self.clients.supabase, self.settings.supabase, payload.get("request_id"), payload.get("storage_paths"))
+        if not rows:
+            if payload.get("caption"):
+                return await telegram.send_message(self.clients.telegram, self.settings.telegram, payload["chat_id"], payload["caption"])
+            return {"info": "no photos"}
+
+        def source_path(p: Dict[str, Any]) -> str:
+            return p.get("preview_path") or p["storage_path"]
+
+        file_ids = self.caches.telegram_file_ids
+        to_sign = [source_path(p) for p in rows if not photos.cached_file_id(file_ids, p)]
+        reused = len(rows) - len(to_sign)
+        signed = await photos.sign_urls(self.clients.storage, self.settings.supabase, to_sign, self.signed_url_ttl)
+        items = []
+        for p in rows:
+            ref = photos.cached_file_id(file_ids, p) or signed.get(source_path(p))
+            if not ref:
+                raise DeliveryError(f"Could not sign {p['storage_path']}", permanent=True)
+            if p.get("preview_path"):
+                kind = "photo"
+            else:
+                kind = telegram.classify(None, p["storage_path"], p.get("size_bytes"), by_url=True) or ""
+            items.append(telegram.MediaItem(kind, os.path.basename(p["storage_path"]), ref=ref, source=p))
+
+        async def remember(group: List[telegram.MediaItem], sent: List[Optional[str]]) -> None:
+            await photos.remember_file_ids(self.clients.supabase, self.settings.supabase, file_ids, [(it.source, fid) for it, fid in zip(group, sent) if fid])
+
+        result = await self._send_groups(job, items, on_sent=remember)
+        return {**result, "reused_file_ids": reused}
+
+    async def _send_transcript(self, job: Job) -> Any:
+        """Render a request's AI dialog from ai_messages and send it as a document.
+
+        The file is rebuilt on every attempt (so a retry also picks up rows
+        that were still buffered the first time) and removed afterwards.
+        """
+        payload = job.payload
+        attachment = await transcripts.render_transcript(
+            self.clients.supabase,
+            self.settings.supabase,
+            payload["request_id"],
+            self.outbox.files_dir,
+            page_size=self.settings.outbox.transcript_page_size,
+            compress=bool(payload.get("gzip")),
+        )
+        try:
+            result = await telegram.send_document(
+                self.clients.telegram, self.settings.telegram, payload["chat_id"], payload.get("caption") or "", attachment
+            )
+        finally:
+            self.outbox.discard([attachment])
+        return {"messages": attachment["messages"], "bytes": attachment["size"], "telegram": result}
+
+    def _retry_delay(self, job: Job, error: DeliveryError) -> float:
+        if error.retry_after:
+            return float(error.retry_after) + random.uniform(0, 1)
+        return min(self.backoff_max, self.backoff_base * 2 ** job.attempts) * random.uniform(0.5, 1.5)
+
+    async def _fail(self, job: Job, error: DeliveryError, delay: float) -> None:
+        retrying = await asyncio.to_thread(self.outbox.retry, job, delay, str(error), error.permanent)
+        if retrying:
+            logger.warning("outbox: job %s (%s) failed, retry in %.1fs: %s", job.id, job.kind, delay, error)
+        else:
+            logger.error("outbox: job %s (%s) failed permanently: %s", job.id, job.kind, error)
+
+
+def create_outbox(settings: OutboxSettings) -> Outbox:
+    return Outbox(settings.directory, max_attempts=settings.max_attempts)
+
+
+def get_outbox(request: Request) -> Outbox:
+    return request.app.state.outbox
+
+
+def get_dispatcher(request: Request) -> Dispatcher:
+    return request.app.state.dispatcher
@@ -0,0 +1,155 @@
+import logging
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+
+import httpx
+
+from app.core.cache import TTLCache
+from app.core.config import SupabaseSettings
+from app.core.telegram import DeliveryError
+
+
+logger = logging.getLogger(__name__)
+
+_PHOTO_COLUMNS = "id,request_id,storage_path,preview_path,size_bytes,content_hash,telegram_file_id"
+
+
+def _require(supabase: SupabaseSettings) -> None:
+    if not supabase.configured:
+        raise DeliveryError("Supabase not configured", permanent=True)
+
+
+def photo_key(photo: Dict[str, Any]) -> str:
+    return photo.get("content_hash") or photo["storage_path"]
+
+
+# Characters that would end or split a quoted PostgREST `in.(...)` value.
+_UNSAFE_PATH_CHARS = set('",()\\')
+
+
+def unsafe_storage_path(path: str) -> bool:
+    return not path or any(c in _UNSAFE_PATH_CHARS for c in path)
+
+
+async def resolve_photos(
+    client: httpx.AsyncClient,
+    supabase: SupabaseSettings,
+    request_id: Optional[str],
+    storage_paths: Optional[List[str]],
+) -> List[Dict[str, Any]]:
+    """Load a request's request_photos rows, optionally only those at `storage_paths`.
+
+    Only objects recorded for `request_id` are returned; a path without such
+    a row is skipped, so a caller can't have arbitrary bucket objects signed
+    and forwarded.
+    """
+    _require(supabase)
+    if not request_id:
+        raise DeliveryError("request_id is required to forward stored photos", permanent=True)
+    params = {
+        "select": _PHOTO_COLUMNS,
+        "request_id": f"eq.{request_id}",
+        "storage_path": "not.is.null",
+        "order": "id.asc",
+    }
+    if storage_paths:
+        bad = [p for p in storage_paths if unsafe_storage_path(p)]
+        if bad:
+            raise DeliveryError(f"Invalid storage path {bad[0]!r}", permanent=True)
+        quoted = ",".join(f'"{p}"' for p in storage_paths)
+        params["storage_path"] = f"in.({quoted})"
+    resp = await client.get(supabase.table_url("request_photos"), headers=supabase.headers, params=params)
+    if resp.status_code // 100 != 2:
+        raise DeliveryError(f"Supabase select request_photos failed: {resp.text}")
+    rows = resp.json() or []
+
+    if storage_paths:
+        by_path = {row["storage_path"]: row for row in rows}
+        missing = [p for p in storage_paths if p not in by_path]
+        if missing:
+            logger.warning("photos: %d storage path(s) not recorded for request %s, skipped", len(missing), request_id)
+        rows = [by_path[p] for p in storage_paths if p in by_path]
+
+    photos: List[Dict[str, Any]] = []
+    seen = set()
+    for row in rows:
+        key = photo_key(row)
+        if key not in seen:
+            seen.add(key)
+            photos.append(row)
+    return photos
+
+
+async def sign_urls(
+    storage_client: httpx.AsyncClient,
+    supabase: SupabaseSettings,
+    paths: List[str],
+    expires_in: int,
+) -> Dict[str, str]:
+    """Create signed download URLs for several objects in one Storage call."""
+    if not paths:
+        return {}
+    _require(supabase)
+    resp = await storage_client.post(
+        f"{supabase.url}/storage/v1/object/sign/{quote(supabase.storage_bucket)}",
+        headers=supabase.json_headers,
+        json={"expiresIn": expires_in, "paths": paths},
+    )
+    if resp.status_code // 100 != 2:
+        raise DeliveryError(f"Storage sign failed: {resp.text}", permanent=resp.status_code in (400, 404))
+    signed: Dict[str, str] = {}
+    for item in resp.json() or []:
+        if item.get("signedURL") and not item.get("error"):
+            signed[item["path"]] = f"{supabase.url}/storage/v1{item['signedURL']}"
+    return signed
+
+
+async def cached_signed_url(
+    storage_client: httpx.AsyncClient,
+    supabase: SupabaseSettings,
+    cache: TTLCache,
+    path: str,
+    expires_in: int,
+) -> Optional[tuple[str, float]]:
+    """(signed URL, unix expiry) for one object, or None when it doesn't exist."""
+
+    async def sign() -> Optional[tuple[str, float]]:
+        expires_at = time.time() + expires_in
+        url = (await sign_urls(storage_client, supabase, [path], expires_in)).get(path)
+        return (url, expires_at) if url else None
+
+    return await cache.get_or_load(path, sign)
+
+
+def cached_file_id(cache: TTLCache, photo: Dict[str, Any]) -> Optional[str]:
+    return cache.get(photo_key(photo)) or photo.get("telegram_file_id")
+
+
+async def remember_file_ids(
+    client: httpx.AsyncClient,
+    supabase: SupabaseSettings,
+    cache: TTLCache,
+    pairs: List[tuple[Dict[str, Any], str]],
+) -> None:
+    """Cache Telegram file_ids in-process and persist them on request_photos."""
+    _require(supabase)
+    for photo, file_id in pairs:
+        cache.set(photo_key(photo), file_id)
+        if photo.get("telegram_file_id") == file_id:
+            continue
+        if photo.get("content_hash"):
+            params = {"content_hash": f"eq.{photo['content_hash']}"}
+        else:
+            params = {"storage_path": f"eq.{photo['storage_path']}"}
+        try:
+            resp = await client.patch(
+                supabase.table_url("request_photos"),
+                headers={**supabase.json_headers, "Prefer": "return=minimal"},
+                params=params,
+                json={"telegram_file_id": file_id},
+            )
+            if resp.status_code // 100 != 2:
+                logger.warning("Persisting telegram_file_id failed: %s", resp.text)
+        except httpx.HTTPError as e:
+            logger.warning("Persisting telegram_file_id failed: %s", e)
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.core.config import Settings
+from app.core.http import HttpClients
+
+
+logger = logging.getLogger(__name__)
+
+# Probe name -> integration it belongs to (readiness only waits on required ones).
+PROBES = {"supabase": "supabase", "storage": "supabase", "telegram": "telegram", "telnyx": "telnyx"}
+
+
+@dataclass
+class ProbeResult:
+    ok: bool
+    checked_at: float
+    latency_ms: Optional[float] = None
+    status: Optional[int] = None
+    error: Optional[str] = None
+    # consecutive failures; readiness flips only past the threshold
+    failures: int = 0
+
+
+class UpstreamProber:
+    """Checks upstream reachability and credentials in the background.
+
+    One cheap authenticated request per configured upstream every `interval`
+    seconds (table select, bucket lookup, getMe, messaging profile); health
+    endpoints only read the cached results, so they never cause upstream
+    traffic however often they are polled.
+    """
+
+    def __init__(self, clients: HttpClients, settings: Settings, interval: float, timeout: float, failure_threshold: int):
+        self.clients = clients
+        self.settings = settings
+        self.interval = interval
+        self.timeout = timeout
+        self.failure_threshold = max(1, failure_threshold)
+        self.results: Dict[str, ProbeResult] = {}
+        self.last_round: Optional[float] = None
+        self._seen_ok: set = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="upstream-prober")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _requests(self) -> Dict[str, Tuple[httpx.AsyncClient, str, Dict[str, str]]]:
+        s = self.settings
+        probes = {}
+        if s.supabase.configured:
+            probes["supabase"] = (
+                self.clients.supabase,
+                f"{s.supabase.table_url('requests')}?select=id&limit=1",
+                s.supabase.headers,
+            )
+            probes["storage"] = (
+                self.clients.storage,
+                f"{s.supabase.url}/storage/v1/bucket/{s.supabase.storage_bucket}",
+                s.supabase.headers,
+            )
+        if s.telegram.configured:
+            probes["telegram"] = (self.clients.telegram, s.telegram.method_url("getMe"), {})
+        if s.telnyx.configured:
+            probes["telnyx"] = (
+                self.clients.telnyx,
+                f"{s.telnyx.api_base}/v2/messaging_profiles/{s.telnyx.profile_id}",
+                s.telnyx.headers,
+            )
+        return probes
+
+    async def probe_all(self) -> None:
+        probes = self._requests()
+        results = await asyncio.gather(*(self._probe(*req) for req in probes.values()))
+        for name, result in zip(probes, results):
+            previous = self.results.get(name)
+            if result.ok:
+                self._seen_ok.add(name)
+            else:
+                result.failures = (previous.failures if previous else 0) + 1
+                logger.warning("probe %s failed (%d in a row): %s", name, result.failures, result.error)
+            self.results[name] = result
+        self.last_round = time.time()
+
+    async def _probe(self, client: httpx.AsyncClient, url: str, headers: Dict[str, str]) -> ProbeResult:
+        start = time.perf_counter()
+        try:
+            resp = await client.get(url, headers=headers, timeout=self.timeout)
+        except httpx.HTTPError as e:
+            return ProbeResult(ok=False, checked_at=time.time(), error=f"{type(e).__name__}: {e}")
+        latency = round((time.perf_counter() - start) * 1000, 1)
+        if resp.status_code // 100 == 2:
+            return ProbeResult(ok=True, checked_at=time.time(), latency_ms=latency, status=resp.status_code)
+        error = "credentials rejected" if resp.status_code in (401, 403) else f"HTTP {resp.status_code}"
+        return ProbeResult(ok=False, checked_at=time.time(), latency_ms=latency, status=resp.status_code, error=error)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.probe_all()
+            except Exception:
+                logger.exception("upstream probes failed")
+            await asyncio.sleep(self.interval)
+
+    def down(self, name: str) -> bool:
+        """Failed `failure_threshold` times in a row, or never reachable since startup."""
+        result = self.results.get(name)
+        if result is None or result.ok:
+            return False
+        return result.failures >= self.failure_threshold or name not in self._seen_ok
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {**asdict(result), "integration": PROBES[name], "down": self.down(name)}
+            for name, result in self.results.items()
+        }
+
+    def blocking_problems(self) -> List[str]:
+        """Reasons the required upstreams can't serve traffic, from cached results."""
+        problems = []
+        if self.last_round is None:
+            return ["upstream probes have not completed yet"]
+        if time.time() - self.last_round > 3 * self.interval + self.timeout:
+            problems.append("upstream probes are stale")
+        for name, integration in PROBES.items():
+            if integration in self.settings.required_integrations and self.down(name):
+                problems.append(f"{name} unreachable: {self.results[name].error}")
+        return problems
+
+
+def create_prober(clients: HttpClients, settings: Settings) -> UpstreamProber:
+    return UpstreamProber(
+        clients,
+        settings,
+        interval=settings.probes.interval,
+        timeout=settings.probes.timeout,
+        failure_threshold=settings.probes.failure_threshold,
+    )
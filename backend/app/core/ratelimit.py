@@ -0,0 +1,290 @@
+import importlib
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+from app.core.config import RateLimitSettings
+from app.core.metrics import rate_limited, upstream_calls_in_flight
+
+
+logger = logging.getLogger(__name__)
+
+# JSON bodies up to this size are peeked for `session_id`.
+SESSION_PEEK_BYTES = 64 * 1024
+
+
+@dataclass
+class RateRule:
+    pattern: str  # `/path`, `/prefix*`, optionally preceded by a method: `POST /path`
+    rate: float  # tokens per second
+    burst: int
+    method: str = field(init=False)
+    path: str = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.method, _, self.path = self.pattern.rpartition(" ")
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.method and method != self.method:
+            return False
+        if self.path.endswith("*"):
+            return path.startswith(self.path[:-1])
+        return path == self.path
+
+
+def load_rules(settings: RateLimitSettings) -> List[RateRule]:
+    return [RateRule(pattern, rate, burst) for pattern, rate, burst in settings.rules]
+
+
+class RateLimitBackend(Protocol):
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """Take one token; return 0 when allowed, else seconds until one is available."""
+
+    async def close(self) -> None:
+        ...
+
+
+class MemoryBackend:
+    """Per-process token buckets (LRU-bounded so random keys can't grow it forever)."""
+
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(burst), now))
+        tokens = min(float(burst), tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def close(self) -> None:
+        self._buckets.clear()
+
+
+_REDIS_TAKE = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBackend:
+    """Token buckets shared by every replica (needs the optional `redis` package)."""
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the `redis` package")
+        self.client = redis_asyncio.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(_REDIS_TAKE)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        return float(await self._take(keys=[self.prefix + key], args=[rate, burst, time.time()]))
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def create_backend(settings: RateLimitSettings) -> RateLimitBackend:
+    """`memory` (default), `redis` (RATE_LIMIT_REDIS_URL), or `package.module:factory`."""
+    if settings.backend == "memory":
+        return MemoryBackend(settings.max_keys)
+    if settings.backend == "redis":
+        return RedisBackend(settings.redis_url)
+    module_name, _, factory = settings.backend.partition(":")
+    return getattr(importlib.import_module(module_name), factory)()
+
+
+class RateLimiter:
+    def __init__(self, backend: RateLimitBackend, rules: List[RateRule], forwarded_hops: int, shed_inflight: int):
+        self.backend = backend
+        self.rules = rules
+        self.forwarded_hops = forwarded_hops
+        self.shed_inflight = shed_inflight
+
+    def rule_for(self, method: str, path: str) -> Optional[RateRule]:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return None
+
+    def client_ip(self, scope: Dict[str, Any]) -> str:
+        return client_ip(scope, self.forwarded_hops)
+
+    def should_shed(self) -> bool:
+        return self.shed_inflight > 0 and upstream_calls_in_flight() >= self.shed_inflight
+
+    async def check(self, rule: RateRule, identities: List[str]) -> float:
+        """Take a token from every identity's bucket; return the longest wait (0 = allowed)."""
+        wait = 0.0
+        for identity in identities:
+            try:
+                wait = max(wait, await self.backend.take(f"{rule.pattern}|{identity}", rule.rate, rule.burst))
+            except Exception as e:
+                # A broken shared backend must not take the site down with it.
+                logger.warning("Rate limit backend failed, allowing request: %s", e)
+        return wait
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+def client_ip(scope: Dict[str, Any], forwarded_hops: int) -> str:
+    """Peer address, or the x-forwarded-for entry added by our own proxies.
+
+    Only the last `forwarded_hops` entries are trusted; anything further
+    left is client-supplied and trivially spoofed. Off (0) by default:
+    with no proxy of ours in front, even the last entry is the client's.
+    """
+    peer = (scope.get("client") or ("unknown", 0))[0]
+    if forwarded_hops <= 0:
+        return peer
+    for name, value in scope.get("headers") or []:
+        if name == b"x-forwarded-for":
+            hops = [h.strip() for h in value.decode("latin-1").split(",") if h.strip()]
+            if hops:
+                return hops[-min(forwarded_hops, len(hops))]
+    return peer
+
+
+def create_rate_limiter(settings: RateLimitSettings) -> Optional[RateLimiter]:
+    if not settings.enabled:
+        return None
+    return RateLimiter(
+        create_backend(settings),
+        load_rules(settings),
+        forwarded_hops=settings.forwarded_hops,
+        shed_inflight=settings.shed_inflight,
+    )
+
+
+def _session_from_headers(scope: Dict[str, Any]) -> Tuple[Optional[str], bool, int]:
+    """(X-Session-Id header, body is JSON, content-length)."""
+    session = None
+    is_json = False
+    length = -1
+    for name, value in scope.get("headers") or []:
+        if name == b"x-session-id":
+            session = value.decode("latin-1")
+        elif name == b"content-type":
+            is_json = value.split(b";")[0].strip() == b"application/json"
+        elif name == b"content-length":
+            try:
+                length = int(value)
+            except ValueError:
+                pass
+    return session, is_json, length
+
+
+async def _peek_json_session(receive) -> Tuple[Optional[str], Any]:
+    """Read a small JSON body for `session_id`; returns a receive that replays it."""
+    chunks = []
+    more = True
+    while more:
+        message = await receive()
+        if message["type"] != "http.request":
+            chunks = None
+            replay_message = message
+            break
+        chunks.append(message.get("body", b""))
+        more = message.get("more_body", False)
+
+    if chunks is None:
+        async def replay_disconnect():
+            return replay_message
+        return None, replay_disconnect
+
+    body = b"".join(chunks)
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    session = None
+    try:
+        data = json.loads(body)
+        if isinstance(data, dict) and isinstance(data.get("session_id"), str):
+            session = data["session_id"]
+    except ValueError:
+        pass
+    return session, replay
+
+
+class RateLimitMiddleware:
+    """Token-bucket limits per client IP and per session for the public routes.
+
+    Each matching request takes a token from its IP bucket and, when a
+    session is known (X-Session-Id header, or `session_id` in a small JSON
+    body), from its session bucket. When too many upstream calls are already
+    in flight, limited routes are shed with 503 before doing any work.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        limiter: Optional[RateLimiter] = None
+        if scope["type"] == "http" and scope["method"] != "OPTIONS":
+            limiter = getattr(scope["app"].state, "rate_limiter", None)
+        rule = limiter.rule_for(scope["method"], scope["path"]) if limiter is not None else None
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        if limiter.should_shed():
+            rate_limited.labels(rule.pattern, "shed").inc()
+            await _reject(send, 503, 1.0, "Server busy, retry shortly")
+            return
+
+        identities = [f"ip:{limiter.client_ip(scope)}"]
+        session, is_json, length = _session_from_headers(scope)
+        if session is None and is_json and 0 <= length <= SESSION_PEEK_BYTES:
+            session, receive = await _peek_json_session(receive)
+        if session:
+            identities.append(f"session:{session}")
+
+        wait = await limiter.check(rule, identities)
+        if wait > 0:
+            rate_limited.labels(rule.pattern, "rate").inc()
+            await _reject(send, 429, wait, "Too many requests")
+            return
+        await self.app(scope, receive, send)
+
+
+async def _reject(send, status: int, retry_after: float, detail: str) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
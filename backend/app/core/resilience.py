@@ -0,0 +1,283 @@
+import asyncio
+import contextvars
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import httpx
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from app.core.metrics import circuit_state, short_circuited
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Call refused locally because the upstream's circuit is open."""
+
+    def __init__(self, upstream: str, retry_after: float, request: Optional[httpx.Request] = None):
+        super().__init__(f"{upstream} circuit open", request=request)
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """The route's time budget ran out before (or while) calling an upstream."""
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a sliding window of calls.
+
+    A call fails when it raises, answers 5xx, or takes longer than
+    `slow_call` seconds. Once at least `min_calls` calls in the last `window`
+    seconds fail at `failure_rate` or more, the circuit opens and calls are
+    refused for `open_seconds`; then up to `half_open_calls` trial calls go
+    through, and the first failure re-opens it while that many successes
+    close it again.
+    """
+
+    def __init__(
+        self,
+        upstream: str,
+        failure_rate: float,
+        min_calls: int,
+        window: float,
+        slow_call: float,
+        open_seconds: float,
+        half_open_calls: int,
+    ):
+        self.upstream = upstream
+        self.failure_rate = failure_rate
+        self.min_calls = max(1, min_calls)
+        self.window = window
+        self.slow_call = slow_call
+        self.open_seconds = open_seconds
+        self.half_open_calls = max(1, half_open_calls)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        # [second, calls, failures] buckets covering the last `window` seconds
+        self._buckets: deque = deque()
+        self._trials = 0
+        self._trial_successes = 0
+        circuit_state.labels(upstream).set(0)
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning("%s circuit %s -> %s", self.upstream, self.state, state)
+            self.state = state
+            circuit_state.labels(self.upstream).set(_STATE_VALUES[state])
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go out now."""
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                short_circuited.labels(self.upstream).inc()
+                raise CircuitOpenError(self.upstream, self.retry_after())
+            self._set_state(HALF_OPEN)
+            self._trials = self._trial_successes = 0
+        if self.state == HALF_OPEN:
+            if self._trials >= self.half_open_calls:
+                short_circuited.labels(self.upstream).inc()
+                raise CircuitOpenError(self.upstream, 1.0)
+            self._trials += 1
+
+    def release(self) -> None:
+        """A call ended without telling us anything about the upstream."""
+        if self.state == HALF_OPEN and self._trials > 0:
+            self._trials -= 1
+
+    def record(self, failed: bool) -> None:
+        if self.state == HALF_OPEN:
+            if failed:
+                self._open()
+            else:
+                self._trial_successes += 1
+                if self._trial_successes >= self.half_open_calls:
+                    self._buckets.clear()
+                    self._set_state(CLOSED)
+            return
+        if self.state == OPEN:
+            return  # a call that started before the circuit opened
+        now = int(time.monotonic())
+        if self._buckets and self._buckets[-1][0] == now:
+            bucket = self._buckets[-1]
+        else:
+            bucket = [now, 0, 0]
+            self._buckets.append(bucket)
+        bucket[1] += 1
+        bucket[2] += int(failed)
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+        if failed:
+            calls = sum(b[1] for b in self._buckets)
+            failures = sum(b[2] for b in self._buckets)
+            if calls >= self.min_calls and failures >= self.failure_rate * calls:
+                self._open()
+
+    def _open(self) -> None:
+        self.opened_at = time.monotonic()
+        self._buckets.clear()
+        self._set_state(OPEN)
+
+    def snapshot(self) -> Dict[str, Any]:
+        calls = sum(b[1] for b in self._buckets)
+        failures = sum(b[2] for b in self._buckets)
+        return {"state": self.state, "calls": calls, "failures": failures, "retry_after": round(self.retry_after(), 1)}
+
+
+# Absolute time.monotonic() by which the current request must be answered.
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+def remaining_budget() -> Optional[float]:
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """Applies the circuit breaker and the request's deadline to every call.
+
+    Timeouts of each outgoing call are cut to what is left of the route's
+    budget, so chained calls share one end-to-end deadline instead of each
+    getting the client's full timeout.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, breaker: Optional[CircuitBreaker]):
+        self.transport = transport
+        self.breaker = breaker
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        remaining = remaining_budget()
+        clamped = False
+        if remaining is not None:
+            if remaining <= 0:
+                raise DeadlineExceeded("Request deadline exceeded", request=request)
+            timeout = request.extensions.get("timeout") or {}
+            clamped = any(value is None or value > remaining for value in timeout.values())
+            request.extensions["timeout"] = {
+                key: remaining if value is None else min(value, remaining) for key, value in timeout.items()
+            }
+        breaker = self.breaker
+        if breaker is not None:
+            try:
+                breaker.before_call()
+            except CircuitOpenError as e:
+                e.request = request
+                raise
+        start = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except asyncio.CancelledError:
+            # The caller gave up (e.g. a losing hedge); says nothing about the upstream.
+            if breaker is not None:
+                breaker.release()
+            raise
+        except httpx.TimeoutException as e:
+            if not clamped:
+                if breaker is not None:
+                    breaker.record(True)
+                raise
+            # Our budget ran out; that only counts against the upstream if it
+            # was slow by its own standard too.
+            if breaker is not None:
+                if time.perf_counter() - start >= breaker.slow_call:
+                    breaker.record(True)
+                else:
+                    breaker.release()
+            raise DeadlineExceeded("Request deadline exceeded", request=request) from e
+        except Exception:
+            if breaker is not None:
+                breaker.record(True)
+            raise
+        if breaker is not None:
+            elapsed = time.perf_counter() - start
+            breaker.record(response.status_code >= 500 or elapsed > breaker.slow_call)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class DeadlineMiddleware:
+    """Starts each matching request's end-to-end upstream budget."""
+
+    def __init__(self, app):
+        self.app = app
+        # Settings.deadlines, taken from app.state on the first request.
+        self.rules: Optional[Tuple[Tuple[str, float], ...]] = None
+
+    def budget_for(self, path: str) -> float:
+        for pattern, seconds in self.rules:
+            if path == pattern or (pattern.endswith("*") and path.startswith(pattern[:-1])):
+                return seconds
+        return 0.0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.rules is None:
+            self.rules = scope["app"].state.settings.deadlines
+        budget = self.budget_for(scope["path"])
+        if budget <= 0:
+            await self.app(scope, receive, send)
+            return
+        token = _deadline.set(time.monotonic() + budget)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _deadline.reset(token)
+
+
+async def circuit_open_handler(request: Request, exc: CircuitOpenError) -> JSONResponse:
+    retry_after = max(1, math.ceil(exc.retry_after))
+    return JSONResponse(
+        {"detail": f"{exc.upstream} temporarily unavailable"},
+        status_code=503,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+async def deadline_handler(request: Request, exc: DeadlineExceeded) -> JSONResponse:
+    return JSONResponse({"detail": "Upstream deadline exceeded"}, status_code=504)
+
+
+async def hedged(call: Callable[[], Awaitable[T]], delay: float) -> T:
+    """Run `call`; if it hasn't finished after `delay` seconds, race a second copy.
+
+    Only for idempotent reads. The first successful result wins and the other
+    attempt is cancelled; if one attempt fails the other still gets its chance.
+    """
+    if delay <= 0:
+        return await call()
+    first = asyncio.ensure_future(call())
+    pending = {first}
+    error: Optional[BaseException] = None
+    try:
+        # A caller cancelled while we wait here must not leave `first` running.
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return first.result()
+        pending.add(asyncio.ensure_future(call()))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
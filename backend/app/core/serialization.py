@@ -0,0 +1,36 @@
+from typing import Any, Callable, Coroutine
+
+import orjson
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact UTF-8 JSON, for request bodies sent as `content=`."""
+    return orjson.dumps(obj)
+
+
+def dumps_canonical(obj: Any) -> bytes:
+    """Sorted-key JSON for hashing; values orjson can't encode fall back to str()."""
+    return orjson.dumps(obj, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONRequest(Request):
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            # orjson.JSONDecodeError subclasses json.JSONDecodeError, so
+            # FastAPI still answers malformed bodies with its usual 422.
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+
+class ORJSONRoute(APIRoute):
+    """Parses JSON request bodies with orjson instead of the stdlib."""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            return await handler(ORJSONRequest(request.scope, request.receive))
+
+        return route_handler
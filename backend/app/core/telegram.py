@@ -0,0 +1,230 @@
+import asyncio
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set
+
+import httpx
+
+from app.core.config import TelegramSettings
+
+
+class DeliveryError(Exception):
+    """A failed provider call.
+
+    `retry_after` carries the provider's requested delay (Telegram 429
+    `parameters.retry_after`); `permanent` marks errors retrying can't fix.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, permanent: bool = False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
+
+
+def raise_for_delivery(resp: httpx.Response, what: str) -> None:
+    if resp.status_code // 100 == 2:
+        return
+    retry_after = None
+    try:
+        retry_after = (resp.json().get("parameters") or {}).get("retry_after")
+    except Exception:
+        pass
+    if retry_after is None and resp.headers.get("retry-after"):
+        try:
+            retry_after = float(resp.headers["retry-after"])
+        except ValueError:
+            pass
+    permanent = resp.status_code // 100 == 4 and resp.status_code not in (408, 409, 429)
+    raise DeliveryError(f"{what} failed: HTTP {resp.status_code} {resp.text}", retry_after=retry_after, permanent=permanent)
+
+
+def bot_url(bot: TelegramSettings, method: str) -> str:
+    if not bot.bot_token:
+        raise DeliveryError("Telegram not configured", permanent=True)
+    return bot.method_url(method)
+
+
+async def send_message(client: httpx.AsyncClient, bot: TelegramSettings, chat_id: str, text: str) -> Dict[str, Any]:
+    resp = await client.post(bot_url(bot, "sendMessage"), json={"chat_id": chat_id, "text": text})
+    raise_for_delivery(resp, "Telegram sendMessage")
+    return resp.json()
+
+
+async def send_document(
+    client: httpx.AsyncClient,
+    bot: TelegramSettings,
+    chat_id: str,
+    caption: str,
+    attachment: Dict[str, Any],
+) -> Dict[str, Any]:
+    with open(attachment["path"], "rb") as fh:
+        resp = await client.post(
+            bot_url(bot, "sendDocument"),
+            files={
+                "chat_id": (None, chat_id),
+                "caption": (None, caption or ""),
+                "document": (attachment.get("filename") or "file.txt", fh, attachment.get("content_type") or "text/plain"),
+            },
+        )
+    raise_for_delivery(resp, "Telegram sendDocument")
+    return resp.json()
+
+
+# Bot API limits: https://core.telegram.org/bots/api#sending-files
+MEDIA_GROUP_MAX = 10
+PHOTO_UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+PHOTO_URL_MAX_BYTES = 5 * 1024 * 1024
+DOCUMENT_UPLOAD_MAX_BYTES = 50 * 1024 * 1024
+DOCUMENT_URL_MAX_BYTES = 20 * 1024 * 1024
+PHOTO_CONTENT_TYPES = {"image/jpeg", "image/png", "image/webp"}
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+@dataclass
+class MediaItem:
+    """One file to send: a local attachment (`path`) or a URL/file_id (`ref`)."""
+
+    kind: str  # "photo" | "document"
+    filename: str
+    content_type: str = "application/octet-stream"
+    path: Optional[str] = None
+    ref: Optional[str] = None
+    source: Any = None  # caller's bookkeeping (e.g. the request_photos row)
+
+
+def classify(content_type: Optional[str], filename: str, size: Optional[int], by_url: bool = False) -> Optional[str]:
+    """Pick how Telegram should receive a file: as a photo, a document, or not at all."""
+    is_image = (content_type or "").lower() in PHOTO_CONTENT_TYPES or filename.lower().endswith(PHOTO_EXTENSIONS)
+    photo_limit = PHOTO_URL_MAX_BYTES if by_url else PHOTO_UPLOAD_MAX_BYTES
+    document_limit = DOCUMENT_URL_MAX_BYTES if by_url else DOCUMENT_UPLOAD_MAX_BYTES
+    if is_image and (size is None or size <= photo_limit):
+        return "photo"
+    if size is not None and size > document_limit:
+        return None
+    return "document"
+
+
+def plan_groups(items: List[MediaItem]) -> List[List[MediaItem]]:
+    """Split items into Telegram-compliant batches.
+
+    Photos and documents can't share a media group, and a group holds at most
+    10 items; batches are balanced (11 photos -> 6 + 5, not 10 + 1) so that
+    no group degrades to a single-item send unnecessarily.
+    """
+    groups: List[List[MediaItem]] = []
+    for kind in ("photo", "document"):
+        same = [it for it in items if it.kind == kind]
+        if not same:
+            continue
+        count = -(-len(same) // MEDIA_GROUP_MAX)
+        size, extra = divmod(len(same), count)
+        start = 0
+        for i in range(count):
+            end = start + size + (1 if i < extra else 0)
+            groups.append(same[start:end])
+            start = end
+    return groups
+
+
+def _message_file_id(message: Dict[str, Any]) -> Optional[str]:
+    sizes = message.get("photo") or []
+    if sizes:
+        return sizes[-1].get("file_id")
+    return (message.get("document") or {}).get("file_id")
+
+
+async def send_group(
+    client: httpx.AsyncClient,
+    bot: TelegramSettings,
+    chat_id: str,
+    items: List[MediaItem],
+    caption: str = "",
+) -> List[Optional[str]]:
+    """Send one planned batch (sendPhoto / sendDocument / sendMediaGroup).
+
+    Returns the Telegram file_id for each item, in order.
+    """
+    kind = items[0].kind
+    files: Dict[str, Any] = {}
+    handles = []
+    try:
+        def media_value(idx: int, item: MediaItem) -> str:
+            if item.path is None:
+                return item.ref or ""
+            key = f"file{idx}"
+            fh = open(item.path, "rb")
+            handles.append(fh)
+            files[key] = (item.filename, fh, item.content_type)
+            return f"attach://{key}"
+
+        if len(items) == 1:
+            method = "sendPhoto" if kind == "photo" else "sendDocument"
+            fields: Dict[str, Any] = {"chat_id": chat_id, **({"caption": caption} if caption else {})}
+            item = items[0]
+            if item.path is not None:
+                fh = open(item.path, "rb")
+                handles.append(fh)
+                resp = await client.post(bot_url(bot, method), data=fields, files={kind: (item.filename, fh, item.content_type)})
+            else:
+                resp = await client.post(bot_url(bot, method), json={**fields, kind: item.ref})
+            raise_for_delivery(resp, f"Telegram {method}")
+            return [_message_file_id(resp.json().get("result") or {})]
+
+        media = []
+        for idx, item in enumerate(items):
+            entry = {"type": kind, "media": media_value(idx, item)}
+            if idx == 0 and caption:
+                entry["caption"] = caption
+            media.append(entry)
+        if files:
+            resp = await client.post(
+                bot_url(bot, "sendMediaGroup"),
+                data={"chat_id": chat_id, "media": json.dumps(media, ensure_ascii=False)},
+                files=files,
+            )
+        else:
+            resp = await client.post(bot_url(bot, "sendMediaGroup"), json={"chat_id": chat_id, "media": media})
+    finally:
+        for fh in handles:
+            fh.close()
+    raise_for_delivery(resp, "Telegram sendMediaGroup")
+    messages = resp.json().get("result") or []
+    return [_message_file_id(m) for m in messages] + [None] * (len(items) - len(messages))
+
+
+async def send_planned(
+    client: httpx.AsyncClient,
+    bot: TelegramSettings,
+    chat_id: str,
+    caption: str,
+    groups: List[List[MediaItem]],
+    skip: Optional[Set[int]] = None,
+    parallelism: int = 2,
+) -> List[Dict[str, Any]]:
+    """Send planned groups concurrently (bounded) and report each group.
+
+    The captioned first group goes out alone so it leads the chat; the rest
+    follow in parallel. Groups whose index is in `skip` (already delivered on
+    a previous attempt) are not sent again.
+    """
+    semaphore = asyncio.Semaphore(max(1, parallelism))
+    skip = skip or set()
+
+    async def run(index: int, group: List[MediaItem]) -> Dict[str, Any]:
+        method = "sendMediaGroup" if len(group) > 1 else ("sendPhoto" if group[0].kind == "photo" else "sendDocument")
+        result: Dict[str, Any] = {"index": index, "method": method, "count": len(group), "ok": False}
+        try:
+            async with semaphore:
+                result["file_ids"] = await send_group(client, bot, chat_id, group, caption if index == 0 else "")
+            result["ok"] = True
+        except DeliveryError as e:
+            result.update(error=str(e), retry_after=e.retry_after, permanent=e.permanent)
+        except (httpx.HTTPError, OSError) as e:
+            result.update(error=f"{type(e).__name__}: {e}", retry_after=None, permanent=False)
+        return result
+
+    results: List[Dict[str, Any]] = []
+    if groups and 0 not in skip:
+        results.append(await run(0, groups[0]))
+    results.extend(await asyncio.gather(*(run(i, g) for i, g in enumerate(groups) if i and i not in skip)))
+    return results
@@ -0,0 +1,91 @@
+import asyncio
+import gzip
+import os
+import uuid
+from typing import Any, BinaryIO, Dict
+
+import httpx
+
+from app.core.config import SupabaseSettings
+from app.core.telegram import DOCUMENT_UPLOAD_MAX_BYTES, DeliveryError, raise_for_delivery
+
+
+_COLUMNS = "id,created_at,sender,content,photos_count"
+
+
+def format_message(row: Dict[str, Any]) -> str:
+    """One dialog entry, in the layout the frontend used for ai_dialog.txt."""
+    who = "User" if row.get("sender") == "user" else "AI"
+    photos = int(row.get("photos_count") or 0)
+    return f"{who}: {row.get('content') or ''}" + (f" [photos: {photos}]" if photos > 0 else "")
+
+
+async def render_transcript(
+    client: httpx.AsyncClient,
+    supabase: SupabaseSettings,
+    request_id: str,
+    directory: str,
+    page_size: int = 500,
+    compress: bool = False,
+) -> Dict[str, Any]:
+    """Write a request's ai_messages to a file in `directory`, page by page.
+
+    Rows are read in keyset pages on (created_at, id), which is served by
+    idx_ai_messages_request_id, and written as they arrive, so memory use
+    doesn't grow with the length of the chat. Returns an outbox-style
+    attachment; the caller removes the file.
+    """
+    if not supabase.configured:
+        raise DeliveryError("Supabase not configured", permanent=True)
+    path = os.path.join(directory, f"transcript-{uuid.uuid4().hex}")
+    out: BinaryIO = gzip.open(path, "wb") if compress else open(path, "wb")
+    count = 0
+    try:
+        cursor = None
+        while True:
+            params = {
+                "select": _COLUMNS,
+                "request_id": f"eq.{request_id}",
+                "order": "created_at.asc,id.asc",
+                "limit": str(page_size),
+            }
+            if cursor is not None:
+                created_at, row_id = cursor
+                params["or"] = f'(created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{row_id}))'
+            resp = await client.get(supabase.table_url("ai_messages"), headers=supabase.headers, params=params)
+            raise_for_delivery(resp, "Supabase select ai_messages")
+            rows = resp.json() or []
+            if rows:
+                text = "\n\n".join(format_message(r) for r in rows)
+                await asyncio.to_thread(out.write, (("\n\n" if count else "") + text).encode("utf-8"))
+                count += len(rows)
+            if len(rows) < page_size:
+                break
+            cursor = (rows[-1]["created_at"], rows[-1]["id"])
+    except BaseException:
+        out.close()
+        _remove(path)
+        raise
+    await asyncio.to_thread(out.close)
+
+    size = os.path.getsize(path)
+    if count == 0:
+        _remove(path)
+        raise DeliveryError(f"No ai_messages for request {request_id}", permanent=True)
+    if size > DOCUMENT_UPLOAD_MAX_BYTES:
+        _remove(path)
+        raise DeliveryError(f"Transcript too large for Telegram ({size} bytes)", permanent=True)
+    return {
+        "path": path,
+        "filename": "ai_dialog.txt.gz" if compress else "ai_dialog.txt",
+        "content_type": "application/gzip" if compress else "text/plain",
+        "size": size,
+        "messages": count,
+    }
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
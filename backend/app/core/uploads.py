@@ -0,0 +1,262 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import secrets
+import string
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterator, Optional
+
+from fastapi import HTTPException, Request
+
+from app.core.config import Settings
+
+
+logger = logging.getLogger(__name__)
+
+_WRITE_BUFFER = 256 * 1024
+
+
+class UploadSessions:
+    """Resumable uploads, assembled on disk before they enter the upload pipeline.
+
+    A session is `<id>.json` (what the client declared) plus `<id>.part`
+    (the bytes received so far, so its size is the resume offset). The
+    directory is shared by all workers: an exclusive flock on the part file
+    serializes appends and finalization across processes. Sessions untouched
+    for `ttl` seconds are removed by a background sweep. Each client IP may
+    hold at most `max_per_ip` unfinished sessions (0 = no cap); the count is
+    taken from the shared directory, so it holds across workers, give or take
+    creations racing each other.
+    """
+
+    def __init__(
+        self, directory: str, ttl: float, chunk_size: int, max_size: int, gc_interval: float, max_per_ip: int = 0
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self.gc_interval = gc_interval
+        self.max_per_ip = max_per_ip
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="upload-session-sweep")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                removed = await asyncio.to_thread(self.sweep)
+                if removed:
+                    logger.info("removed %d abandoned upload sessions", removed)
+            except OSError as e:
+                logger.warning("upload session sweep failed: %s", e)
+            await asyncio.sleep(self.gc_interval)
+
+    def _path(self, upload_id: str, ext: str) -> str:
+        if len(upload_id) != 32 or any(c not in string.hexdigits for c in upload_id):
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        return os.path.join(self.directory, f"{upload_id}.{ext}")
+
+    def _last_activity(self, upload_id: str) -> float:
+        times = []
+        for ext in ("json", "part"):
+            try:
+                times.append(os.path.getmtime(os.path.join(self.directory, f"{upload_id}.{ext}")))
+            except OSError:
+                pass
+        return max(times, default=0.0)
+
+    def _write_meta(self, upload_id: str, meta: Dict[str, Any]) -> None:
+        path = self._path(upload_id, "json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(meta, fh)
+        os.replace(tmp, path)
+
+    # Blocking operations; call through asyncio.to_thread
+
+    def create(self, meta: Dict[str, Any], client_ip: str) -> Dict[str, Any]:
+        if meta["size"] > self.max_size:
+            raise HTTPException(status_code=413, detail=f"File too large (max {self.max_size // (1024 * 1024)} MB)")
+        if self.max_per_ip > 0 and self.open_sessions(client_ip) >= self.max_per_ip:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Too many open upload sessions (max {self.max_per_ip}); finish or delete one first",
+            )
+        upload_id = secrets.token_hex(16)
+        open(self._path(upload_id, "part"), "xb").close()
+        self._write_meta(
+            upload_id,
+            {**meta, "upload_id": upload_id, "status": "uploading", "created_at": time.time(), "client_ip": client_ip},
+        )
+        return self.load(upload_id)
+
+    def open_sessions(self, client_ip: str) -> int:
+        """Unexpired sessions still receiving bytes that `client_ip` created."""
+        count = 0
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as fh:
+                    meta = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            if meta.get("client_ip") != client_ip or meta.get("status") != "uploading":
+                continue
+            if now - self._last_activity(name[:-5]) <= self.ttl:
+                count += 1
+        return count
+
+    def load(self, upload_id: str) -> Dict[str, Any]:
+        """Session state with the current `offset`; 404 once gone or expired."""
+        try:
+            with open(self._path(upload_id, "json")) as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        last_activity = self._last_activity(upload_id)
+        if time.time() - last_activity > self.ttl:
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        if meta["status"] == "uploading":
+            try:
+                meta["offset"] = os.path.getsize(self._path(upload_id, "part"))
+            except OSError:
+                raise HTTPException(status_code=404, detail="Upload session not found")
+        else:
+            meta["offset"] = meta["size"]
+        meta["expires_at"] = last_activity + self.ttl
+        return meta
+
+    def complete(self, upload_id: str, result: Dict[str, Any]) -> None:
+        """Keep the result for repeated finalize calls; the bytes are no longer needed."""
+        meta = self.load(upload_id)
+        meta.pop("offset", None)
+        meta.pop("expires_at", None)
+        self._write_meta(upload_id, {**meta, "status": "completed", "result": result})
+        _remove(self._path(upload_id, "part"))
+
+    def delete(self, upload_id: str) -> None:
+        with self.lock(upload_id, missing_ok=True):
+            _remove(self._path(upload_id, "json"))
+            _remove(self._path(upload_id, "part"))
+
+    def sweep(self) -> int:
+        removed = 0
+        now = time.time()
+        ids = {name.split(".", 1)[0] for name in os.listdir(self.directory) if name.endswith((".json", ".part"))}
+        for upload_id in ids:
+            if now - self._last_activity(upload_id) <= self.ttl:
+                continue
+            try:
+                with self.lock(upload_id, missing_ok=True):
+                    _remove(self._path(upload_id, "json"))
+                    _remove(self._path(upload_id, "part"))
+                removed += 1
+            except HTTPException:
+                continue  # in use right now, or not one of ours
+        return removed
+
+    @contextmanager
+    def lock(self, upload_id: str, missing_ok: bool = False) -> Iterator[Optional[BinaryIO]]:
+        """Exclusive hold on the part file (409 when another request has it)."""
+        try:
+            fh = open(self._path(upload_id, "part"), "r+b")
+        except FileNotFoundError:
+            if missing_ok:
+                yield None
+                return
+            # Finalized (or removed) by a concurrent request; its state tells which.
+            raise HTTPException(status_code=409, detail="Upload session busy")
+        try:
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise HTTPException(status_code=409, detail="Upload session busy")
+            yield fh
+        finally:
+            fh.close()
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """Write a chunk at `offset` and return the new offset.
+
+        Bytes that arrive before a dropped connection are kept, so the client
+        resumes from wherever the server actually got to.
+        """
+        meta = await asyncio.to_thread(self.load, upload_id)
+        if meta["status"] != "uploading":
+            raise HTTPException(status_code=409, detail="Upload already completed")
+        size = meta["size"]
+        with self.lock(upload_id) as fh:
+            start = os.fstat(fh.fileno()).st_size
+            if offset != start:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Offset mismatch: server has {start} bytes",
+                    headers={"Upload-Offset": str(start)},
+                )
+            fh.seek(start)
+            written = start
+            buf = bytearray()
+            overflow = False
+            try:
+                async for chunk in chunks:
+                    if written + len(buf) + len(chunk) > size:
+                        overflow = True
+                        break
+                    buf += chunk
+                    if len(buf) >= _WRITE_BUFFER:
+                        await asyncio.to_thread(_write, fh, bytes(buf))
+                        written += len(buf)
+                        buf.clear()
+            finally:
+                if buf and not overflow:
+                    await asyncio.to_thread(_write, fh, bytes(buf))
+                    written += len(buf)
+            if overflow:
+                await asyncio.to_thread(fh.truncate, start)
+                raise HTTPException(status_code=413, detail=f"Chunk runs past the declared size of {size} bytes")
+            return written
+
+
+def _write(fh: BinaryIO, data: bytes) -> None:
+    fh.write(data)
+    fh.flush()
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def create_upload_sessions(settings: Settings) -> UploadSessions:
+    return UploadSessions(
+        settings.upload_sessions.directory,
+        ttl=settings.upload_sessions.ttl,
+        chunk_size=settings.limits.upload_chunk.max_body,
+        max_size=settings.limits.upload.max_file,
+        gc_interval=settings.upload_sessions.gc_interval,
+        max_per_ip=settings.upload_sessions.max_per_ip,
+    )
+
+
+def get_upload_sessions(request: Request) -> UploadSessions:
+    return request.app.state.upload_sessions
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI
+
+from app.core.config import WorkerSettings
+from app.core.metrics import http_calls_in_flight, upstream_calls_in_flight
+
+
+logger = logging.getLogger(__name__)
+
+# Set by app.server when SIGTERM arrives (or by the lifespan on shutdown);
+# /api/health reports 503 from then on so load balancers stop routing here.
+_lifecycle = {"started_at": time.time(), "draining_since": None}
+
+
+def begin_drain() -> None:
+    if _lifecycle["draining_since"] is None:
+        _lifecycle["draining_since"] = time.time()
+
+
+def is_draining() -> bool:
+    return _lifecycle["draining_since"] is not None
+
+
+def worker_status(app: FastAPI) -> Dict[str, Any]:
+    """Health of this worker process: background tasks, pools and load."""
+    state = app.state
+    dispatcher = getattr(state, "dispatcher", None)
+    queue = getattr(state, "ai_messages_queue", None)
+    image_pool = getattr(state, "image_pool", None)
+    problems = []
+    if dispatcher is not None and not dispatcher.running:
+        problems.append("outbox dispatcher stopped")
+    if queue is not None and not queue.running:
+        problems.append("ai_messages flusher stopped")
+    if image_pool is not None and getattr(image_pool, "_broken", False):
+        problems.append("image pool broken")
+    return {
+        "pid": os.getpid(),
+        "ok": not problems and not is_draining(),
+        "draining": is_draining(),
+        "problems": problems,
+        "started_at": _lifecycle["started_at"],
+        "requests_in_flight": http_calls_in_flight(),
+        "upstream_in_flight": upstream_calls_in_flight(),
+        "ai_messages_pending": queue.depth if queue is not None else 0,
+    }
+
+
+class Heartbeat:
+    """Publishes this worker's status to a directory shared by all workers.
+
+    Each worker rewrites `<pid>.json` every `interval` seconds, so whichever
+    worker answers /api/health can report on its siblings; a file that has
+    not been refreshed for three intervals marks a stuck or dead worker.
+    """
+
+    def __init__(self, app: FastAPI, directory: str, interval: float):
+        self.app = app
+        self.directory = directory
+        self.interval = interval
+        self.path = os.path.join(directory, f"{os.getpid()}.json")
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._write()
+        self._task = asyncio.create_task(self._run(), name="worker-heartbeat")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        _remove(self.path)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self._write)
+            except OSError as e:
+                logger.warning("worker heartbeat write failed: %s", e)
+
+    def _write(self) -> None:
+        status = {**worker_status(self.app), "updated_at": time.time()}
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(status, fh)
+        os.replace(tmp, self.path)
+
+    def read_all(self) -> List[Dict[str, Any]]:
+        workers = []
+        now = time.time()
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as fh:
+                    status = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            if not _alive(status.get("pid")):
+                # Killed without running its shutdown; the supervisor replaces it.
+                _remove(os.path.join(self.directory, name))
+                continue
+            if now - status.get("updated_at", 0) > 3 * self.interval:
+                status.update(ok=False, problems=[*status.get("problems", []), "heartbeat stale"])
+            workers.append(status)
+        return workers
+
+
+def _alive(pid: Any) -> bool:
+    if not isinstance(pid, int):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def create_heartbeat(app: FastAPI, settings: WorkerSettings) -> Optional[Heartbeat]:
+    """Only when several workers share WORKER_STATE_DIR (set by app.server)."""
+    if not settings.state_dir:
+        return None
+    return Heartbeat(app, settings.state_dir, settings.heartbeat_interval)
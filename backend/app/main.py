@@ -1,5 +1,30 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+
+from app.core.cache import create_caches
+from app.core.config import load_settings
+from app.core.http import close_clients, create_clients
+from app.core.idempotency import create_idempotency_store
+from app.core.limits import BodyLimitMiddleware
+from app.core.images import create_image_pool
+from app.core.metrics import MetricsMiddleware, mark_process_dead
+from app.core.ratelimit import RateLimitMiddleware, create_rate_limiter
+from app.core.resilience import (
+    CircuitOpenError,
+    DeadlineExceeded,
+    DeadlineMiddleware,
+    circuit_open_handler,
+    deadline_handler,
+)
+from app.core.outbox import Dispatcher, create_outbox
+from app.core.probes import create_prober
+from app.core.uploads import create_upload_sessions
+from app.core.workers import begin_drain, create_heartbeat
+from app.routes.ai import create_ai_messages_queue
 
 from app.routes.health import router as health_router
 from app.routes.telegram import router as telegram_router
@@ -7,10 +32,64 @@ from app.routes.sms import router as sms_router
 from app.routes.requests import router as requests_router
 from app.routes.storage import router as storage_router
 from app.routes.ai import router as ai_router
+from app.routes.notifications import router as notifications_router
+from app.routes.metrics import router as metrics_router
+from app.routes.admin import router as admin_router
+from app.routes.photos import router as photos_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fail fast on bad configuration before opening any pools.
+    settings = app.state.settings = load_settings()
+    app.state.http = create_clients(settings)
+    app.state.image_pool = create_image_pool(settings.images)
+    app.state.idempotency = create_idempotency_store(app.state.http.supabase, settings)
+    app.state.rate_limiter = create_rate_limiter(settings.rate_limits)
+    app.state.caches = create_caches(settings)
+    app.state.outbox = await asyncio.to_thread(create_outbox, settings.outbox)
+    app.state.dispatcher = Dispatcher(app.state.outbox, app.state.http, settings, app.state.caches)
+    app.state.dispatcher.start()
+    app.state.ai_messages_queue = create_ai_messages_queue(app.state.http.supabase, settings)
+    if app.state.ai_messages_queue is not None:
+        app.state.ai_messages_queue.start()
+    app.state.upload_sessions = create_upload_sessions(settings)
+    app.state.upload_sessions.start()
+    app.state.prober = create_prober(app.state.http, settings)
+    app.state.prober.start()
+    app.state.heartbeat = create_heartbeat(app, settings.workers)
+    if app.state.heartbeat is not None:
+        app.state.heartbeat.start()
+    try:
+        yield
+    finally:
+        # By now the server has stopped accepting and finished in-flight
+        # requests; flush queued work before the pools go away.
+        begin_drain()
+        if app.state.heartbeat is not None:
+            await app.state.heartbeat.stop()
+        await app.state.prober.stop()
+        await app.state.upload_sessions.stop()
+        await app.state.dispatcher.stop()
+        if app.state.ai_messages_queue is not None:
+            await app.state.ai_messages_queue.close()
+        if app.state.image_pool is not None:
+            await asyncio.to_thread(app.state.image_pool.shutdown)
+        if app.state.rate_limiter is not None:
+            await app.state.rate_limiter.close()
+        await close_clients(app.state.http)
+        mark_process_dead()
+
 
+app = FastAPI(title="Handyman Backend", version="0.1.0", lifespan=lifespan, default_response_class=ORJSONResponse)
 
-app = FastAPI(title="Handyman Backend", version="0.1.0")
+app.add_exception_handler(CircuitOpenError, circuit_open_handler)
+app.add_exception_handler(DeadlineExceeded, deadline_handler)
 
+# Innermost first: rejections from the limiters still get CORS headers.
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(BodyLimitMiddleware)
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -18,6 +97,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(health_router)
 app.include_router(telegram_router)
@@ -25,3 +105,7 @@ app.include_router(sms_router)
 app.include_router(requests_router)
 app.include_router(storage_router)
 app.include_router(ai_router)
+app.include_router(notifications_router)
+app.include_router(metrics_router)
+app.include_router(admin_router)
+app.include_router(photos_router)
@@ -0,0 +1,280 @@
+import base64
+import csv
+import hmac
+import io
+import json
+import logging
+import re
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from app.core.config import Settings, SupabaseSettings, get_settings
+from app.core.http import get_supabase_client
+
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/admin")
+
+# include name -> PostgREST embed. request_photos also references ai_messages,
+# so the request_id foreign key is named to keep the embeds unambiguous.
+CHILD_EMBEDS = {
+    "contact": "contact_details(*)",
+    "dynamic": "dynamic_details(*)",
+    "hourly": "hourly_details(*)",
+    "jobs": "request_jobs(*)",
+    "ai_jobs": "ai_jobs(*)",
+    "photos": "request_photos!request_photos_request_id_fkey(*)",
+    "messages": "request_messages(*)",
+    "ai_messages": "ai_messages!ai_messages_request_id_fkey(*)",
+}
+DEFAULT_INCLUDE = ("contact", "dynamic", "hourly", "jobs", "ai_jobs", "photos")
+# Embedded lists that have a natural order
+_CHILD_ORDER = {
+    "request_messages": "created_at.asc",
+    "ai_messages": "created_at.asc",
+    "request_photos": "id.asc",
+}
+
+REQUEST_COLUMNS = (
+    "id", "created_at", "status", "source", "form_type", "session_id",
+    "full_name", "email", "phone", "address", "consent_to_text", "meta",
+)
+
+MAX_PAGE_SIZE = 200
+
+
+def require_admin(request: Request, settings: Settings = Depends(get_settings)) -> None:
+    """Bearer ADMIN_API_TOKEN; the admin API is off while it is unset."""
+    if not settings.admin_token:
+        raise HTTPException(status_code=500, detail="Admin API not configured")
+    scheme, _, token = (request.headers.get("authorization") or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), settings.admin_token.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+    if not settings.supabase.configured:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+
+
+def _encode_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps([row["created_at"], row["id"]], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        datetime.fromisoformat(created_at)
+        return created_at, str(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _in_list(values: List[str]) -> str:
+    return "in.(" + ",".join(f'"{v}"' for v in values) + ")"
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+
+class RequestQuery:
+    """Filters shared by the list and export endpoints."""
+
+    def __init__(
+        self,
+        status: Optional[str] = Query(None, description="comma-separated statuses"),
+        form_type: Optional[str] = Query(None, description="comma-separated form types"),
+        since: Optional[datetime] = Query(None, description="created_at >= (ISO 8601)"),
+        until: Optional[datetime] = Query(None, description="created_at < (ISO 8601)"),
+        session_id: Optional[str] = None,
+        include: Optional[str] = Query(None, description=f"children to embed: {', '.join(CHILD_EMBEDS)}, all or none"),
+    ):
+        self.statuses = _split(status)
+        self.form_types = _split(form_type)
+        self.since = since
+        self.until = until
+        self.session_id = session_id
+        if include is None:
+            self.include = list(DEFAULT_INCLUDE)
+        elif include.strip() == "all":
+            self.include = list(CHILD_EMBEDS)
+        elif include.strip() == "none":
+            self.include = []
+        else:
+            self.include = _split(include)
+            unknown = [name for name in self.include if name not in CHILD_EMBEDS]
+            if unknown:
+                raise HTTPException(status_code=422, detail=f"Unknown include: {', '.join(unknown)}")
+
+    def tables(self) -> List[str]:
+        return [CHILD_EMBEDS[name].split("(")[0].split("!")[0] for name in self.include]
+
+    def params(self, limit: int, cursor: Optional[str]) -> List[Tuple[str, str]]:
+        """PostgREST query for one keyset page, newest first, children embedded."""
+        select = ",".join(["*", *(CHILD_EMBEDS[name] for name in self.include)])
+        params = [("select", select), ("order", "created_at.desc,id.desc"), ("limit", str(limit))]
+        for table in self.tables():
+            if table in _CHILD_ORDER:
+                params.append((f"{table}.order", _CHILD_ORDER[table]))
+        if self.statuses:
+            params.append(("status", _in_list(self.statuses)))
+        if self.form_types:
+            params.append(("form_type", _in_list(self.form_types)))
+        if self.since:
+            params.append(("created_at", f"gte.{self.since.isoformat()}"))
+        if self.until:
+            params.append(("created_at", f"lt.{self.until.isoformat()}"))
+        if self.session_id:
+            params.append(("session_id", f"eq.{self.session_id}"))
+        if cursor:
+            created_at, row_id = _decode_cursor(cursor)
+            params.append(("or", f'(created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{row_id}))'))
+        return params
+
+
+async def _fetch_page(
+    client: httpx.AsyncClient,
+    supabase: SupabaseSettings,
+    query: RequestQuery,
+    limit: int,
+    cursor: Optional[str],
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page plus the cursor of the next one (None on the last page)."""
+    resp = await client.get(supabase.table_url("requests"), headers=supabase.headers, params=query.params(limit + 1, cursor))
+    if resp.status_code // 100 != 2:
+        raise HTTPException(status_code=502, detail=f"Supabase select requests failed: {resp.text}")
+    rows = resp.json() or []
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, _encode_cursor(rows[-1])
+
+
+@router.get("/requests", dependencies=[Depends(require_admin)])
+async def list_requests(
+    query: RequestQuery = Depends(),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    client: httpx.AsyncClient = Depends(get_supabase_client),
+    settings: Settings = Depends(get_settings),
+):
+    """Leads, newest first, with children embedded; pass `next_cursor` back as `cursor`."""
+    rows, next_cursor = await _fetch_page(client, settings.supabase, query, limit, cursor)
+    return {"ok": True, "items": rows, "next_cursor": next_cursor}
+
+
+@router.get("/requests/export", dependencies=[Depends(require_admin)])
+async def export_requests(
+    query: RequestQuery = Depends(),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    client: httpx.AsyncClient = Depends(get_supabase_client),
+    settings: Settings = Depends(get_settings),
+):
+    """Stream every matching lead as NDJSON or CSV, one keyset page at a time.
+
+    Only one page is held in memory, so the range can be arbitrarily large.
+    The first page is fetched before the response starts so upstream errors
+    still surface as a 502; a failure mid-stream (an error response or a
+    transport error) ends the body early with a final `{"error": ...}` NDJSON
+    line or `error,<detail>` CSV row.
+    """
+    supabase = settings.supabase
+    first, cursor = await _fetch_page(client, supabase, query, settings.admin_export_page_size, None)
+
+    async def pages() -> AsyncIterator[List[Dict[str, Any]]]:
+        nonlocal cursor
+        yield first
+        while cursor:
+            rows, cursor = await _fetch_page(client, supabase, query, settings.admin_export_page_size, cursor)
+            yield rows
+
+    stamp = date.today().isoformat()
+    if format == "csv":
+        body = _csv_lines(pages(), query.tables())
+        media_type, filename = "text/csv; charset=utf-8", f"leads-{stamp}.csv"
+    else:
+        body = _ndjson_lines(pages())
+        media_type, filename = "application/x-ndjson", f"leads-{stamp}.ndjson"
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@router.get("/requests/{request_id}", dependencies=[Depends(require_admin)])
+async def get_request(
+    request_id: str,
+    client: httpx.AsyncClient = Depends(get_supabase_client),
+    settings: Settings = Depends(get_settings),
+):
+    """One lead with every child table embedded."""
+    supabase = settings.supabase
+    select = ",".join(["*", *CHILD_EMBEDS.values()])
+    params = [("select", select), ("id", f"eq.{request_id}")]
+    params += [(f"{table}.order", order) for table, order in _CHILD_ORDER.items()]
+    resp = await client.get(supabase.table_url("requests"), headers=supabase.headers, params=params)
+    if resp.status_code // 100 != 2:
+        raise HTTPException(status_code=502, detail=f"Supabase select requests failed: {resp.text}")
+    rows = resp.json() or []
+    if not rows:
+        raise HTTPException(status_code=404, detail="Request not found")
+    return {"ok": True, **rows[0]}
+
+
+async def _ndjson_lines(pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    try:
+        async for rows in pages:
+            yield b"".join(orjson.dumps(row, default=str, option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+    except (HTTPException, httpx.HTTPError) as e:
+        yield (json.dumps({"error": _export_error(e)}) + "\n").encode()
+
+
+async def _csv_lines(pages: AsyncIterator[List[Dict[str, Any]]], child_tables: List[str]) -> AsyncIterator[bytes]:
+    """requests columns, then one JSON-encoded column per embedded child table."""
+    header = [*REQUEST_COLUMNS, *child_tables]
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    try:
+        async for rows in pages:
+            for row in rows:
+                writer.writerow([_csv_value(row.get(col)) for col in header])
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+    except (HTTPException, httpx.HTTPError) as e:
+        writer.writerow(["error", _csv_value(_export_error(e))])
+        yield buf.getvalue().encode()
+
+
+def _export_error(e: Exception) -> str:
+    """Log a failure after the export started streaming; returns the trailing error text."""
+    if isinstance(e, HTTPException):
+        detail = e.detail
+    else:
+        detail = f"Supabase select requests failed: {type(e).__name__}: {e}"
+    logger.error("lead export aborted: %s", detail)
+    return detail
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str) if value else ""
+    if isinstance(value, str) and _is_formula(value):
+        # Lead fields are user input; keep spreadsheets from running them as formulas.
+        return "'" + value
+    return "" if value is None else value
+
+
+# Phone numbers (+1 555 010-0100) and plain signed numbers start with + or -
+# but can't do anything in a spreadsheet, so they are exported untouched.
+_NUMERIC = re.compile(r"[+-]?[\d\s().-]+")
+
+
+def _is_formula(value: str) -> bool:
+    first = value[:1]
+    if first in ("=", "@", "\t", "\r"):
+        return True
+    return first in ("+", "-") and not _NUMERIC.fullmatch(value)
@@ -1,11 +1,20 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 import httpx
 from typing import Optional, List
 
+from app.core.batcher import WriteBehindQueue
+from app.core.cache import Caches, get_caches
+from app.core.config import AISettings, Settings, SupabaseSettings, get_settings
+from app.core.http import get_supabase_client
+from app.core.resilience import hedged
+from app.core.serialization import ORJSONRoute
 
-router = APIRouter(prefix="/api/ai")
 
+router = APIRouter(prefix="/api/ai", route_class=ORJSONRoute)
 
 class EnsureRequestBody(BaseModel):
     session_id: str
@@ -24,89 +33,134 @@ class IngestMessageBody(BaseModel):
     storage_paths: Optional[List[str]] = None
 
 
-async def _supabase_headers(supabase_key: str) -> dict:
-    return {
-        "apikey": supabase_key,
-        "Authorization": f"Bearer {supabase_key}",
-        "Content-Type": "application/json",
-        "Prefer": "return=representation",
-    }
+def create_ai_messages_queue(client: httpx.AsyncClient, settings: Settings) -> Optional[WriteBehindQueue]:
+    """Build the ai_messages write-behind queue, or None when disabled/unconfigured."""
+    ai, supabase = settings.ai, settings.supabase
+    if not ai.write_behind or not supabase.configured:
+        return None
+    return WriteBehindQueue(
+        client,
+        supabase.table_url("ai_messages"),
+        supabase.json_headers,
+        name="ai_messages",
+        max_batch=ai.batch_size,
+        flush_interval=ai.flush_interval,
+        max_pending=ai.max_pending,
+        enqueue_timeout=ai.enqueue_timeout,
+        max_retries=ai.max_retries,
+    )
 
 
-@router.post("/ensure-request", response_model=EnsureRequestResp)
-async def ensure_request(body: EnsureRequestBody):
-    from os import getenv
+def get_ai_messages_queue(request: Request) -> Optional[WriteBehindQueue]:
+    return getattr(request.app.state, "ai_messages_queue", None)
+
 
-    supabase_url = getenv("SUPABASE_URL", "").rstrip("/")
-    supabase_key = getenv("SUPABASE_SERVICE_ROLE_KEY", "")
-    if not supabase_url or not supabase_key:
+@router.post("/ensure-request", response_model=EnsureRequestResp)
+async def ensure_request(
+    body: EnsureRequestBody,
+    client: httpx.AsyncClient = Depends(get_supabase_client),
+    settings: Settings = Depends(get_settings),
+    caches: Caches = Depends(get_caches),
+):
+    supabase = settings.supabase
+    if not supabase.configured:
         raise HTTPException(status_code=500, detail="Supabase not configured")
 
-    headers = await _supabase_headers(supabase_key)
-    async with httpx.AsyncClient(timeout=15) as client:
-        # Try to find latest request for this session
-        sel_url = (
-            f"{supabase_url}/rest/v1/requests?"
-            f"session_id=eq.{body.session_id}&form_type=eq.ai&select=id&order=created_at.desc&limit=1"
-        )
-        r = await client.get(sel_url, headers={k: v for k, v in headers.items() if k != "Content-Type"})
-        if r.status_code // 100 == 2:
-            arr = r.json() or []
-            if isinstance(arr, list) and arr:
-                rid = arr[0].get("id")
-                if rid:
-                    return {"request_id": rid}
-        # Create new request row
-        payload = [{
-            "source": body.source or "website",
-            "form_type": "ai",
-            "session_id": body.session_id,
-            "status": "new",
-            "meta": {"session_id": body.session_id},
-        }]
-        cr = await client.post(f"{supabase_url}/rest/v1/requests", headers=headers, json=payload)
-        if cr.status_code // 100 != 2:
-            raise HTTPException(status_code=502, detail=f"Supabase create request failed: {cr.text}")
-        body_json = cr.json()
-        rid = body_json[0].get("id") if isinstance(body_json, list) and body_json else body_json.get("id")
-        if not rid:
-            raise HTTPException(status_code=502, detail="Supabase did not return request id")
-        return {"request_id": rid}
+    # Saves the lookup round trip on every chat message.
+    rid = await caches.ai_sessions.get_or_load(
+        body.session_id,
+        lambda: _find_or_create_request(client, supabase, settings.ai, body.session_id, body.source),
+    )
+    return {"request_id": rid}
+
+
+async def find_session_request(
+    client: httpx.AsyncClient, supabase: SupabaseSettings, ai: AISettings, session_id: str
+) -> Optional[str]:
+    """Latest AI request_id for a session, or None (also when the lookup fails)."""
+    sel_url = (
+        f"{supabase.url}/rest/v1/requests?"
+        f"session_id=eq.{session_id}&form_type=eq.ai&select=id&order=created_at.desc&limit=1"
+    )
+    # The lookup is a plain select, so racing a second copy of it is safe.
+    r = await hedged(lambda: client.get(sel_url, headers=supabase.headers), ai.lookup_hedge_delay)
+    if r.status_code // 100 == 2:
+        arr = r.json() or []
+        if isinstance(arr, list) and arr:
+            return arr[0].get("id") or None
+    return None
+
+
+async def _find_or_create_request(
+    client: httpx.AsyncClient,
+    supabase: SupabaseSettings,
+    ai: AISettings,
+    session_id: str,
+    source: Optional[str],
+) -> str:
+    rid = await find_session_request(client, supabase, ai, session_id)
+    if rid:
+        return rid
+    # Create new request row
+    payload = [{
+        "source": source or "website",
+        "form_type": "ai",
+        "session_id": session_id,
+        "status": "new",
+        "meta": {"session_id": session_id},
+    }]
+    cr = await client.post(supabase.table_url("requests"), headers=supabase.returning_headers, json=payload)
+    if cr.status_code // 100 != 2:
+        raise HTTPException(status_code=502, detail=f"Supabase create request failed: {cr.text}")
+    body_json = cr.json()
+    rid = body_json[0].get("id") if isinstance(body_json, list) and body_json else body_json.get("id")
+    if not rid:
+        raise HTTPException(status_code=502, detail="Supabase did not return request id")
+    return rid
 
 
 @router.post("/ingest-message")
-async def ingest_message(body: IngestMessageBody):
-    from os import getenv
-
-    supabase_url = getenv("SUPABASE_URL", "").rstrip("/")
-    supabase_key = getenv("SUPABASE_SERVICE_ROLE_KEY", "")
-    if not supabase_url or not supabase_key:
+async def ingest_message(
+    body: IngestMessageBody,
+    client: httpx.AsyncClient = Depends(get_supabase_client),
+    queue: Optional[WriteBehindQueue] = Depends(get_ai_messages_queue),
+    settings: Settings = Depends(get_settings),
+    caches: Caches = Depends(get_caches),
+):
+    supabase = settings.supabase
+    if not supabase.configured:
         raise HTTPException(status_code=500, detail="Supabase not configured")
 
-    headers = await _supabase_headers(supabase_key)
-
     # Ensure request exists
-    ensure = await ensure_request(EnsureRequestBody(session_id=body.session_id))
+    ensure = await ensure_request(EnsureRequestBody(session_id=body.session_id), client, settings, caches)
     request_id = ensure["request_id"]
 
+    # Batched rows must share the same keys, and created_at is stamped here so
+    # message order survives being inserted together in one statement.
     row = {
         "request_id": request_id,
         "session_id": body.session_id,
         "sender": body.sender,
         "content": body.content or "",
         "photos_count": int(body.photos_count or 0),
+        "storage_paths": body.storage_paths or None,
+        "created_at": datetime.now(timezone.utc).isoformat(),
     }
-    if body.storage_paths:
-        row["storage_paths"] = body.storage_paths
-
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.post(
-            f"{supabase_url}/rest/v1/ai_messages",
-            headers=headers,
-            json=[row],
-        )
-        if r.status_code // 100 != 2:
-            raise HTTPException(status_code=502, detail=f"Supabase insert ai_messages failed: {r.text}")
+
+    if queue is not None:
+        try:
+            await queue.put(row)
+            return {"ok": True, "request_id": request_id, "queued": True}
+        except asyncio.QueueFull:
+            pass  # buffer saturated or shutting down: write synchronously
+
+    r = await client.post(
+        supabase.table_url("ai_messages"),
+        headers=supabase.returning_headers,
+        json=[row],
+    )
+    if r.status_code // 100 != 2:
+        raise HTTPException(status_code=502, detail=f"Supabase insert ai_messages failed: {r.text}")
 
     return {"ok": True, "request_id": request_id}
 
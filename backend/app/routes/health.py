@@ -1,11 +1,92 @@
-from fastapi import APIRouter
+import asyncio
+import os
+from typing import Any, Dict, List
 
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from app.core.http import UPSTREAMS
+from app.core.metrics import upstream_calls_in_flight
+from app.core.workers import is_draining, worker_status
 
-router = APIRouter(prefix="/api")
 
+router = APIRouter(prefix="/api")
 
 @router.get("/health")
-async def health():
-    return {"ok": True}
+async def health(request: Request):
+    """503 while this worker drains or has a dead background task.
+
+    With several workers (app.server), `workers` lists every sibling's last
+    heartbeat, so one probe shows the whole process group.
+    """
+    status = worker_status(request.app)
+    body = {"ok": status["ok"], "worker": status}
+    heartbeat = getattr(request.app.state, "heartbeat", None)
+    if heartbeat is not None:
+        body["workers"] = [w for w in heartbeat.read_all() if w["pid"] != status["pid"]]
+        body["workers_ok"] = all(w["ok"] for w in body["workers"])
+    if not status["ok"]:
+        return JSONResponse(body, status_code=503, headers={"Connection": "close"} if is_draining() else None)
+    return body
+
+
+@router.get("/health/live")
+async def live():
+    """Liveness: the event loop answers. Never checks dependencies."""
+    return {"ok": True, "pid": os.getpid()}
+
+
+@router.get("/health/ready")
+async def ready(request: Request):
+    """Readiness: config, cached upstream probes, queue depths, pool saturation.
+
+    Upstream state comes from the background prober, so polling this never
+    touches Supabase, Telegram or Telnyx. Only required integrations
+    (REQUIRED_INTEGRATIONS) and local backlog make it answer 503.
+    """
+    state = request.app.state
+    settings = state.settings
+    status = worker_status(request.app)
+    problems: List[str] = [*status["problems"]]
+    if status["draining"]:
+        problems.append("draining")
+
+    config = {
+        name: {"configured": getattr(settings, name).configured, "required": name in settings.required_integrations}
+        for name in ("supabase", "telegram", "telnyx")
+    }
+    problems += [f"{name} not configured" for name, c in config.items() if c["required"] and not c["configured"]]
+    problems += state.prober.blocking_problems()
+
+    queues: Dict[str, Any] = {"outbox": await asyncio.to_thread(state.outbox.counts)}
+    queue = state.ai_messages_queue
+    if queue is not None:
+        fill = queue.depth / queue.capacity
+        queues["ai_messages"] = {"pending": queue.depth, "capacity": queue.capacity, "fill": round(fill, 3)}
+        if fill >= settings.ready_max_queue_fill:  # enqueues would soon block
+            problems.append("ai_messages queue nearly full")
 
+    pools: Dict[str, Any] = {}
+    for name in UPSTREAMS:
+        in_flight = upstream_calls_in_flight(name)
+        size = state.http.max_connections.get(name)
+        pools[name] = {"in_flight": in_flight, "max_connections": size, "saturated": bool(size) and in_flight >= size}
+        breaker = state.http.breakers.get(name)
+        if breaker is not None:
+            pools[name]["circuit"] = breaker.snapshot()
+    image_pool = state.image_pool
+    if image_pool is not None:
+        workers = getattr(image_pool, "_max_workers", None)
+        backlog = len(getattr(image_pool, "_pending_work_items", {}))
+        pools["images"] = {"workers": workers, "queued": backlog, "saturated": bool(workers) and backlog > workers}
 
+    body = {
+        "ok": not problems,
+        "problems": problems,
+        "config": config,
+        "upstreams": state.prober.report(),
+        "queues": queues,
+        "pools": pools,
+        "worker": status,
+    }
+    return body if not problems else JSONResponse(body, status_code=503)
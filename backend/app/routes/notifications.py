@@ -0,0 +1,32 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.core.outbox import Outbox, get_outbox
+
+
+router = APIRouter(prefix="/api")
+
+# Per-group fields safe to show anyone holding a job id; errors carry raw
+# provider bodies and stay out.
+_GROUP_FIELDS = ("index", "method", "count", "ok")
+
+
+@router.get("/notifications/{job_id}")
+async def notification_status(job_id: int, outbox: Outbox = Depends(get_outbox)):
+    """Delivery status of a queued Telegram/SMS job, with per-group media status.
+
+    Unauthenticated, so it never returns the provider's response or error
+    text: those echo the lead's contact details and message.
+    """
+    job = await asyncio.to_thread(outbox.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    return {
+        "ok": True,
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "groups": [{k: g[k] for k in _GROUP_FIELDS if k in g} for g in job["groups"]],
+    }
@@ -0,0 +1,162 @@
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from app.core.cache import Caches, TTLCache, get_caches
+from app.core.config import Settings, SupabaseSettings, get_settings
+from app.core.http import get_storage_client, get_supabase_client
+from app.core.photos import cached_signed_url
+from app.core.telegram import DeliveryError
+from app.routes.admin import require_admin
+
+
+router = APIRouter(prefix="/api/admin/photos", dependencies=[Depends(require_admin)])
+
+_ROW_COLUMNS = "id,request_id,storage_path,preview_path,thumb_path,content_hash,name"
+
+# Smallest first; a missing variant falls back to the next larger one.
+_VARIANT_ORDER = ("thumb", "preview", "original")
+
+# Objects are stored under their sha256, so their bytes never change.
+_IMMUTABLE = "private, max-age={}, immutable"
+# Objects without a content hash may be overwritten in place: revalidate.
+_REVALIDATE = "private, no-cache"
+
+_PROXY_HEADERS = (
+    "content-type", "content-length", "content-range", "content-encoding", "accept-ranges", "last-modified",
+)
+
+
+async def _photo_row(
+    client: httpx.AsyncClient,
+    supabase: SupabaseSettings,
+    cache: TTLCache,
+    column: str,
+    value: str,
+) -> Optional[Dict[str, Any]]:
+    # Rows only change when a photo is re-processed, so a short TTL is plenty.
+    async def load() -> Optional[Dict[str, Any]]:
+        resp = await client.get(
+            supabase.table_url("request_photos"),
+            headers=supabase.headers,
+            params={"select": _ROW_COLUMNS, column: f"eq.{value}", "limit": "1"},
+        )
+        if resp.status_code // 100 != 2:
+            raise HTTPException(status_code=502, detail=f"Supabase select request_photos failed: {resp.text}")
+        rows = resp.json() or []
+        return rows[0] if rows else None
+
+    return await cache.get_or_load((column, value), load)
+
+
+def _pick_variant(row: Dict[str, Any], variant: str) -> Tuple[str, str]:
+    """(variant served, storage path): the requested size, else the next larger one."""
+    for name in _VARIANT_ORDER[_VARIANT_ORDER.index(variant):]:
+        path = row.get("storage_path") if name == "original" else row.get(f"{name}_path")
+        if path:
+            return name, path
+    raise HTTPException(status_code=404, detail="Photo not found")
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+
+async def _deliver(
+    request: Request,
+    row: Dict[str, Any],
+    variant: str,
+    delivery: str,
+    storage_client: httpx.AsyncClient,
+    settings: Settings,
+    caches: Caches,
+):
+    supabase = settings.supabase
+    served, path = _pick_variant(row, variant)
+    content_hash = row.get("content_hash")
+    etag = f'"{content_hash}-{served}"' if content_hash else None
+    cache_control = _IMMUTABLE.format(settings.photos.cache_max_age) if content_hash else _REVALIDATE
+
+    if delivery != "proxy":
+        try:
+            signed = await cached_signed_url(
+                storage_client, supabase, caches.signed_urls, path, settings.photos.signed_url_ttl
+            )
+        except DeliveryError as e:
+            raise HTTPException(status_code=502, detail=str(e))
+        if signed is None:
+            raise HTTPException(status_code=404, detail="Photo not found")
+        url, expires_at = signed
+        if delivery == "url":
+            return {"ok": True, "url": url, "expires_at": expires_at, "variant": served, "storage_path": path}
+        max_age = max(0, int(expires_at - time.time()) - 60)
+        return RedirectResponse(url, status_code=307, headers={"Cache-Control": f"private, max-age={max_age}"})
+
+    if_none_match = request.headers.get("if-none-match")
+    if etag and if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+    headers = dict(supabase.headers)
+    if request.headers.get("range"):
+        headers["Range"] = request.headers["range"]
+    if not etag and if_none_match:
+        headers["If-None-Match"] = if_none_match
+    resp = await storage_client.send(
+        storage_client.build_request("GET", supabase.object_url(path), headers=headers), stream=True
+    )
+    if resp.status_code not in (200, 206, 304, 416):
+        body = await resp.aread()
+        await resp.aclose()
+        # Storage answers 400 {"error": "not_found"} for missing objects.
+        if resp.status_code in (400, 404):
+            raise HTTPException(status_code=404, detail="Photo not found")
+        raise HTTPException(status_code=502, detail=f"Storage download failed: {body.decode(errors='replace')}")
+    out = {name: resp.headers[name] for name in _PROXY_HEADERS if name in resp.headers}
+    out.setdefault("accept-ranges", "bytes")
+    out["Cache-Control"] = cache_control
+    if etag or resp.headers.get("etag"):
+        out["ETag"] = etag or resp.headers["etag"]
+    return StreamingResponse(
+        resp.aiter_raw(), status_code=resp.status_code, headers=out, background=BackgroundTask(resp.aclose)
+    )
+
+
+@router.get("/object/{storage_path:path}")
+async def get_photo_by_path(
+    storage_path: str,
+    request: Request,
+    variant: str = Query("preview", pattern="^(thumb|preview|original)$"),
+    delivery: str = Query("proxy", pattern="^(proxy|redirect|url)$"),
+    client: httpx.AsyncClient = Depends(get_supabase_client),
+    storage_client: httpx.AsyncClient = Depends(get_storage_client),
+    settings: Settings = Depends(get_settings),
+    caches: Caches = Depends(get_caches),
+):
+    """A stored object by path; objects without a request_photos row are served as-is."""
+    row = await _photo_row(client, settings.supabase, caches.photo_rows, "storage_path", storage_path)
+    return await _deliver(
+        request, row or {"storage_path": storage_path}, variant, delivery, storage_client, settings, caches
+    )
+
+
+@router.get("/{photo_id}")
+async def get_photo(
+    photo_id: int,
+    request: Request,
+    variant: str = Query("preview", pattern="^(thumb|preview|original)$"),
+    delivery: str = Query("proxy", pattern="^(proxy|redirect|url)$"),
+    client: httpx.AsyncClient = Depends(get_supabase_client),
+    storage_client: httpx.AsyncClient = Depends(get_storage_client),
+    settings: Settings = Depends(get_settings),
+    caches: Caches = Depends(get_caches),
+):
+    """A request_photos row's image: streamed (default), a 307 to a signed URL, or the URL as JSON."""
+    row = await _photo_row(client, settings.supabase, caches.photo_rows, "id", str(photo_id))
+    if row is None:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    return await _deliver(request, row, variant, delivery, storage_client, settings, caches)
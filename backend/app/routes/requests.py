@@ -1,30 +1,42 @@
-from typing import Any, Dict
+import asyncio
+import logging
+from typing import Any, Dict, List, Tuple
 
 import httpx
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import ORJSONResponse
 
+from app.core.cache import Caches, TTLCache, get_caches
+from app.core.config import Settings, get_settings
+from app.core.http import get_supabase_client
+from app.core.idempotency import (
+    REPLAYED_HEADER,
+    IdempotencyStore,
+    fingerprint,
+    get_idempotency_store,
+    idempotency_key,
+)
+from app.core.serialization import ORJSONRoute, dumps
 from app.schemas import StoreRequestPayload
 
 
-router = APIRouter(prefix="/api")
+logger = logging.getLogger(__name__)
 
+router = APIRouter(prefix="/api", route_class=ORJSONRoute)
 
-@router.post("/store-request")
-async def store_request(payload: StoreRequestPayload, request: Request):
-    from os import getenv
 
-    supabase_url = getenv("SUPABASE_URL", "").rstrip("/")
-    supabase_key = getenv("SUPABASE_SERVICE_ROLE_KEY", "")
-    if not supabase_url or not supabase_key:
+@router.post("/store-request", response_class=ORJSONResponse)
+async def store_request(
+    payload: StoreRequestPayload,
+    request: Request,
+    client: httpx.AsyncClient = Depends(get_supabase_client),
+    idempotency: IdempotencyStore = Depends(get_idempotency_store),
+    settings: Settings = Depends(get_settings),
+    caches: Caches = Depends(get_caches),
+):
+    if not settings.supabase.configured:
         raise HTTPException(status_code=500, detail="Supabase not configured")
 
-    headers = {
-        "apikey": supabase_key,
-        "Authorization": f"Bearer {supabase_key}",
-        "Content-Type": "application/json",
-        "Prefer": "return=representation",
-    }
-
     def normalize_contact(contact: Dict[str, Any] | None) -> Dict[str, Any]:
         if not contact:
             return {}
@@ -53,145 +65,217 @@ async def store_request(payload: StoreRequestPayload, request: Request):
         **normalize_contact(payload.contact or {}),
     }
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        resp = await client.post(f"{supabase_url}/rest/v1/requests", headers=headers, json=[request_row])
-        if resp.status_code // 100 != 2:
-            raise HTTPException(status_code=502, detail=f"Supabase insert requests failed: {resp.text}")
-        body = resp.json()
-        request_id = body[0].get("id") if isinstance(body, list) and body else body.get("id")
-        if not request_id:
-            raise HTTPException(status_code=502, detail="Supabase did not return request id")
+    # Retries of the same submission (Idempotency-Key header, else the same
+    # session + payload) replay the first response instead of storing a new lead.
+    request_fingerprint = fingerprint("store-request", payload.model_dump())
+    key = idempotency_key(request, request_fingerprint)
+    body, replayed = await idempotency.run(
+        "store-request",
+        key,
+        request_fingerprint,
+        lambda: _store(client, settings, caches.ai_sessions, payload, request_row),
+    )
+    # Returned as a response so the body skips jsonable_encoder; it is plain JSON already.
+    return ORJSONResponse(body, headers={REPLAYED_HEADER: "true"} if replayed else None)
+
+
+async def _store(
+    client: httpx.AsyncClient,
+    settings: Settings,
+    sessions: TTLCache,
+    payload: StoreRequestPayload,
+    request_row: Dict[str, Any],
+) -> Dict[str, Any]:
+    supabase_url = settings.supabase.url
+    headers = settings.supabase.returning_headers
+    if settings.store_request_rpc:
+        return await _store_request_rpc(client, supabase_url, headers, sessions, payload, request_row)
+
+    resp = await client.post(f"{supabase_url}/rest/v1/requests", headers=headers, content=dumps([request_row]))
+    if resp.status_code // 100 != 2:
+        raise HTTPException(status_code=502, detail=f"Supabase insert requests failed: {resp.text}")
+    body = resp.json()
+    request_id = body[0].get("id") if isinstance(body, list) and body else body.get("id")
+    if not request_id:
+        raise HTTPException(status_code=502, detail="Supabase did not return request id")
+
+    _remember_ai_session(sessions, payload, request_id)
+    children = await _insert_children(
+        client, supabase_url, settings.supabase.json_headers, _child_rows(payload, request_id), settings.store_request_concurrency
+    )
+
+    return {"ok": True, "stored": True, "request_id": request_id, "children": children}
+
+
+async def _store_request_rpc(
+    client: httpx.AsyncClient,
+    supabase_url: str,
+    headers: Dict[str, str],
+    sessions: TTLCache,
+    payload: StoreRequestPayload,
+    request_row: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Store the parent and all children in one call to public.store_request().
+
+    The SQL function runs in a single transaction, so either everything is
+    written or nothing is; there are no orphaned `requests` rows.
+    """
+    inserts = _child_rows(payload, None)
+    rpc_payload = {
+        "request": request_row,
+        "children": {table: rows for table, rows in inserts},
+    }
+    resp = await client.post(
+        f"{supabase_url}/rest/v1/rpc/store_request",
+        headers=headers,
+        content=dumps({"payload": rpc_payload}),
+    )
+    if resp.status_code // 100 != 2:
+        raise HTTPException(status_code=502, detail=f"Supabase store_request rpc failed: {resp.text}")
+    request_id = resp.json()
+    if not request_id or not isinstance(request_id, str):
+        raise HTTPException(status_code=502, detail="Supabase did not return request id")
+    _remember_ai_session(sessions, payload, request_id)
+
+    children = [{"table": table, "rows": len(rows), "ok": True} for table, rows in inserts]
+    return {"ok": True, "stored": True, "request_id": request_id, "children": children}
+
+
+def _remember_ai_session(sessions: TTLCache, payload: StoreRequestPayload, request_id: str) -> None:
+    # Later chat messages for this session belong to the newest AI request.
+    if payload.form_type == "ai" and payload.session_id:
+        sessions.set(payload.session_id, request_id)
 
-        try:
-            if payload.form_type == "dynamic":
-                _ = await client.post(
-                    f"{supabase_url}/rest/v1/dynamic_details",
-                    headers=headers,
-                    json=[{
-                        "request_id": request_id,
-                        "project_description": (payload.meta or {}).get("projectDescription"),
-                        "timeline": (payload.meta or {}).get("timeline"),
-                        "main_categories": (payload.meta or {}).get("mainCategories"),
-                        "service_groups": (payload.meta or {}).get("serviceGroups"),
-                        "detailed_services": (payload.meta or {}).get("detailedServices"),
-                    }]
-                )
-            elif payload.form_type == "hourly":
-                _ = await client.post(
-                    f"{supabase_url}/rest/v1/hourly_details",
-                    headers=headers,
-                    json=[{
-                        "request_id": request_id,
-                        "hourly_package": (payload.meta or {}).get("hourlyPackage"),
-                        "description": (payload.meta or {}).get("description"),
-                    }]
-                )
-            elif payload.form_type == "contact":
-                _ = await client.post(
-                    f"{supabase_url}/rest/v1/contact_details",
-                    headers=headers,
-                    json=[{
-                        "request_id": request_id,
-                        "description": (payload.meta or {}).get("description"),
-                    }]
-                )
-            elif payload.form_type == "ai":
-                # Insert AI messages (conversation summary)
-                if payload.messages:
-                    ai_msg_rows = []
-                    for m in payload.messages:
-                        try:
-                            # Extract storage_paths from provided photos list if any
-                            storage_paths = None
-                            photos = m.get("photos") or []
-                            if isinstance(photos, list):
-                                storage_paths = [p.get("storage_path") for p in photos if isinstance(p, dict) and p.get("storage_path")]
-                            ai_msg_rows.append({
-                                "request_id": request_id,
-                                "session_id": m.get("session_id") or payload.session_id,
-                                "sender": m.get("sender"),
-                                "content": m.get("content"),
-                                "photos_count": m.get("photos_count") or (len(photos or [])),
-                                **({"storage_paths": storage_paths} if storage_paths else {}),
-                            })
-                        except Exception:
-                            continue
-                    if ai_msg_rows:
-                        _ = await client.post(
-                            f"{supabase_url}/rest/v1/ai_messages",
-                            headers=headers,
-                            json=ai_msg_rows,
-                        )
-                # Insert AI jobs (final snapshot on submit)
-                if payload.jobs:
-                    ai_job_rows = []
-                    for j in payload.jobs:
-                        try:
-                            ai_job_rows.append({
-                                "request_id": request_id,
-                                "job_id": j.get("id"),
-                                "name": j.get("name"),
-                                "price": j.get("price"),
-                                "session_id": payload.session_id,
-                            })
-                        except Exception:
-                            continue
-                    if ai_job_rows:
-                        _ = await client.post(
-                            f"{supabase_url}/rest/v1/ai_jobs",
-                            headers=headers,
-                            json=ai_job_rows,
-                        )
-        except Exception:
-            pass
-
-        if payload.jobs:
-            jobs_rows = []
-            for j in payload.jobs:
-                try:
-                    jobs_rows.append({
-                        "request_id": request_id,
-                        "job_id": j.get("id"),
-                        "name": j.get("name"),
-                        "price": j.get("price"),
-                    })
-                except Exception:
-                    continue
-            if jobs_rows:
-                _ = await client.post(f"{supabase_url}/rest/v1/request_jobs", headers=headers, json=jobs_rows)
-
-        if payload.messages:
-            msg_rows = []
-            for m in payload.messages:
-                try:
-                    msg_rows.append({
-                        "request_id": request_id,
-                        "sender": m.get("sender"),
-                        "content": m.get("content"),
-                        "photos_count": m.get("photos_count") or (len(m.get("photos", []) or [])),
-                        "session_id": m.get("session_id") or payload.session_id,
-                    })
-                except Exception:
-                    continue
-            if msg_rows:
-                _ = await client.post(f"{supabase_url}/rest/v1/request_messages", headers=headers, json=msg_rows)
-
-        if payload.photos:
-            ph_rows = []
-            for p in payload.photos:
-                try:
-                    ph_rows.append({
-                        "request_id": request_id,
-                        "url": p.get("url"),
-                        "name": p.get("name"),
-                        "origin": p.get("origin") or payload.form_type or "unknown",
-                        "session_id": p.get("session_id") or payload.session_id,
-                    })
-                except Exception:
-                    continue
-            if ph_rows:
-                _ = await client.post(f"{supabase_url}/rest/v1/request_photos", headers=headers, json=ph_rows)
-
-    return {"ok": True, "stored": True, "request_id": request_id}
 
+def _child_rows(payload: StoreRequestPayload, request_id: Any) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    """Build (table, rows) pairs for everything that hangs off a `requests` row."""
+    meta = payload.meta or {}
+    inserts: List[Tuple[str, List[Dict[str, Any]]]] = []
+
+    if payload.form_type == "dynamic":
+        inserts.append(("dynamic_details", [{
+            "request_id": request_id,
+            "project_description": meta.get("projectDescription"),
+            "timeline": meta.get("timeline"),
+            "main_categories": meta.get("mainCategories"),
+            "service_groups": meta.get("serviceGroups"),
+            "detailed_services": meta.get("detailedServices"),
+        }]))
+    elif payload.form_type == "hourly":
+        inserts.append(("hourly_details", [{
+            "request_id": request_id,
+            "hourly_package": meta.get("hourlyPackage"),
+            "description": meta.get("description"),
+        }]))
+    elif payload.form_type == "contact":
+        inserts.append(("contact_details", [{
+            "request_id": request_id,
+            "description": meta.get("description"),
+        }]))
+    elif payload.form_type == "ai":
+        # AI conversation summary and final job snapshot on submit
+        ai_msg_rows = []
+        for m in payload.messages or []:
+            storage_paths = [p.storage_path for p in m.photos or [] if p.storage_path]
+            ai_msg_rows.append({
+                "request_id": request_id,
+                "session_id": m.session_id or payload.session_id,
+                "sender": m.sender,
+                "content": m.content,
+                "photos_count": m.photos_count or len(m.photos or []),
+                **({"storage_paths": storage_paths} if storage_paths else {}),
+            })
+        if ai_msg_rows:
+            inserts.append(("ai_messages", ai_msg_rows))
+
+        ai_job_rows = [
+            {
+                "request_id": request_id,
+                "job_id": j.id,
+                "name": j.name,
+                "price": j.price,
+                "session_id": payload.session_id,
+            }
+            for j in payload.jobs or []
+        ]
+        if ai_job_rows:
+            inserts.append(("ai_jobs", ai_job_rows))
+
+    jobs_rows = [
+        {
+            "request_id": request_id,
+            "job_id": j.id,
+            "name": j.name,
+            "price": j.price,
+        }
+        for j in payload.jobs or []
+    ]
+    if jobs_rows:
+        inserts.append(("request_jobs", jobs_rows))
+
+    msg_rows = [
+        {
+            "request_id": request_id,
+            "sender": m.sender,
+            "content": m.content,
+            "photos_count": m.photos_count or len(m.photos or []),
+            "session_id": m.session_id or payload.session_id,
+        }
+        for m in payload.messages or []
+    ]
+    if msg_rows:
+        inserts.append(("request_messages", msg_rows))
+
+    ph_rows = [
+        {
+            "request_id": request_id,
+            "url": p.url,
+            "name": p.name,
+            "origin": p.origin or payload.form_type or "unknown",
+            "session_id": p.session_id or payload.session_id,
+        }
+        for p in payload.photos or []
+    ]
+    if ph_rows:
+        inserts.append(("request_photos", ph_rows))
+
+    return inserts
+
+
+async def _insert_children(
+    client: httpx.AsyncClient,
+    supabase_url: str,
+    headers: Dict[str, str],
+    inserts: List[Tuple[str, List[Dict[str, Any]]]],
+    concurrency: int,
+) -> List[Dict[str, Any]]:
+    """Insert child rows concurrently and report one result per table.
+
+    Child tables only depend on the parent id, so they are sent in parallel,
+    bounded by STORE_REQUEST_CONCURRENCY. A failed child never fails the
+    request (the parent row is already stored) but is logged and reported.
+    """
+    if not inserts:
+        return []
+
+    semaphore = asyncio.Semaphore(concurrency)
+    child_headers = {**headers, "Prefer": "return=minimal"}
+
+    async def insert(table: str, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"table": table, "rows": len(rows), "ok": False}
+        body = dumps(rows)
+        try:
+            async with semaphore:
+                resp = await client.post(f"{supabase_url}/rest/v1/{table}", headers=child_headers, content=body)
+            result["status"] = resp.status_code
+            if resp.status_code // 100 == 2:
+                result["ok"] = True
+            else:
+                result["error"] = resp.text
+        except httpx.HTTPError as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        if not result["ok"]:
+            logger.warning("Supabase insert %s failed: %s", table, result.get("error"))
+        return result
 
+    return list(await asyncio.gather(*(insert(table, rows) for table, rows in inserts)))
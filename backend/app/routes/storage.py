@@ -1,85 +1,497 @@
+import asyncio
+import hashlib
 import io
-from typing import List
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 import httpx
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, UploadFile, File, Form
 from PIL import Image
+from pydantic import BaseModel, Field
+from starlette.datastructures import Headers
+
+from app.core.config import ImageSettings, Settings, get_settings
+from app.core.http import get_storage_client, get_supabase_client
+from app.core.idempotency import (
+    REPLAYED_HEADER,
+    IdempotencyStore,
+    fingerprint,
+    get_idempotency_store,
+    idempotency_key,
+)
+from app.core.metrics import image_processing_duration, upload_bytes, upload_files
+from app.core.ratelimit import client_ip
+from app.core.uploads import UploadSessions, get_upload_sessions
+from app.core.images import (
+    ProcessedImage,
+    discard_file,
+    get_image_pool,
+    image_variants,
+    process_image,
+)
 
 
 router = APIRouter(prefix="/api")
 
+CHUNK_SIZE = 256 * 1024
+# Enough to reach the SOF/IHDR marker of phone photos, even with large EXIF blocks.
+HEADER_PROBE_BYTES = 256 * 1024
+
+
+def _probe_dimensions(header: bytes) -> Tuple[Optional[int], Optional[int]]:
+    """Read image dimensions from the leading bytes only (no pixel decoding)."""
+    try:
+        with Image.open(io.BytesIO(header)) as img:
+            return img.size
+    except Exception:
+        return None, None
+
+
+async def _iter_upload(f: UploadFile) -> AsyncIterator[bytes]:
+    await f.seek(0)
+    while True:
+        chunk = await f.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def _iter_file(path: str) -> AsyncIterator[bytes]:
+    with open(path, "rb") as fh:
+        while True:
+            chunk = await asyncio.to_thread(fh.read, CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _digest_upload(f: UploadFile, spool: bool) -> Tuple[str, int, bytes, Optional[str]]:
+    """Hash an upload in one pass, keeping its first bytes for the image probe.
+
+    With `spool`, the same pass also copies the file to a named temp file for
+    the image process pool. Returns (sha256, size, header, spool_path).
+    """
+    f.file.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    header = bytearray()
+    spool_path = None
+    out = None
+    if spool:
+        fd, spool_path = tempfile.mkstemp(prefix="upload-")
+        out = os.fdopen(fd, "wb")
+    try:
+        while True:
+            chunk = f.file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+            if len(header) < HEADER_PROBE_BYTES:
+                header.extend(chunk[:HEADER_PROBE_BYTES - len(header)])
+            if out is not None:
+                out.write(chunk)
+    except BaseException:
+        if spool_path:
+            discard_file(spool_path)
+        raise
+    finally:
+        if out is not None:
+            out.close()
+    return digest.hexdigest(), size, bytes(header), spool_path
+
+
+def _extension(filename: str) -> str:
+    ext = os.path.splitext(filename)[1].lower()
+    return ext if 1 < len(ext) <= 6 and ext[1:].isalnum() else ""
+
+
+async def _process_upload(pool: ProcessPoolExecutor, src: str, images: ImageSettings) -> Optional[ProcessedImage]:
+    """Run orientation/metadata stripping/derivatives in the process pool."""
+    loop = asyncio.get_running_loop()
+    with image_processing_duration.time():
+        return await loop.run_in_executor(
+            pool, process_image, src, image_variants(images), images.format, images.quality
+        )
+
+
+async def _find_existing_photos(
+    client: httpx.AsyncClient,
+    supabase_url: str,
+    headers: Dict[str, str],
+    hashes: List[str],
+    request_id: str,
+    global_scope: bool,
+) -> Tuple[Dict[str, dict], set]:
+    """Look up already stored objects by content hash in one query.
+
+    Returns (hash -> existing row, hashes already linked to this request).
+    """
+    params = {
+        "select": "request_id,storage_path,preview_path,thumb_path,raw_path,width,height,size_bytes,content_hash",
+        "content_hash": f"in.({','.join(hashes)})",
+        "storage_path": "not.is.null",
+    }
+    if not global_scope:
+        params["request_id"] = f"eq.{request_id}"
+    resp = await client.get(f"{supabase_url}/rest/v1/request_photos", headers=headers, params=params)
+    if resp.status_code // 100 != 2:
+        # Dedup is an optimization; fall back to uploading everything.
+        return {}, set()
+    existing: Dict[str, dict] = {}
+    linked = set()
+    for row in resp.json() or []:
+        h = row.get("content_hash")
+        if not h:
+            continue
+        existing.setdefault(h, row)
+        if str(row.get("request_id")) == str(request_id):
+            linked.add(h)
+    return existing, linked
+
+
+async def _put_object(
+    storage_client: httpx.AsyncClient,
+    url: str,
+    headers: Dict[str, str],
+    content: AsyncIterator[bytes],
+    content_type: str,
+    size: Optional[int],
+) -> None:
+    headers = {**headers, "Content-Type": content_type, "x-upsert": "true"}
+    if size is not None:
+        headers["Content-Length"] = str(size)
+    resp = await storage_client.post(url, headers=headers, content=content)
+    if resp.status_code // 100 != 2:
+        raise HTTPException(status_code=502, detail=f"Storage upload failed: {resp.text}")
+
 
 @router.post("/upload")
 async def upload_photos(
+    request: Request,
+    response: Response,
     request_id: str = Form(...),
     origin: str = Form(""),
     session_id: str = Form(""),
     files: List[UploadFile] = File(default_factory=list),
+    storage_client: httpx.AsyncClient = Depends(get_storage_client),
+    client: httpx.AsyncClient = Depends(get_supabase_client),
+    image_pool: Optional[ProcessPoolExecutor] = Depends(get_image_pool),
+    idempotency: IdempotencyStore = Depends(get_idempotency_store),
+    settings: Settings = Depends(get_settings),
 ):
-    from os import getenv
-
-    supabase_url = getenv("SUPABASE_URL", "").rstrip("/")
-    supabase_key = getenv("SUPABASE_SERVICE_ROLE_KEY", "")
-    bucket = getenv("SUPABASE_STORAGE_BUCKET", "uploads")
-    if not supabase_url or not supabase_key:
+    if not settings.supabase.configured:
         raise HTTPException(status_code=500, detail="Supabase not configured")
-    headers_auth = {"apikey": supabase_key, "Authorization": f"Bearer {supabase_key}"}
-
-    stored: list[dict] = []
-    async with httpx.AsyncClient(timeout=60) as client:
-        for f in files:
-            content = await f.read()
-            from time import time
-            safe_name = f.filename or "file"
-            path = f"{request_id}/{int(time())}_{safe_name}"
-            upload_url = f"{supabase_url}/storage/v1/object/{bucket}/{path}"
-            resp = await client.post(
-                upload_url,
-                headers={
-                    **headers_auth,
-                    "Content-Type": f.content_type or "application/octet-stream",
-                    "x-upsert": "true",
-                },
-                content=content,
-            )
-            if resp.status_code // 100 != 2:
-                raise HTTPException(status_code=502, detail=f"Storage upload failed: {resp.text}")
-            width = None
-            height = None
-            size_bytes = len(content) if content else None
-            try:
-                img = Image.open(io.BytesIO(content))
-                width, height = img.size
-            except Exception:
-                pass
-            stored.append({"storage_path": path, "name": safe_name, "origin": origin, "width": width, "height": height, "size_bytes": size_bytes, "session_id": session_id})
-
-        if stored:
-            rows = [
-                {
-                    "request_id": request_id,
-                    "storage_path": it["storage_path"],
-                    "name": it.get("name"),
-                    "origin": it.get("origin", origin),
-                    "width": it.get("width"),
-                    "height": it.get("height"),
-                    "size_bytes": it.get("size_bytes"),
-                    "session_id": it.get("session_id", session_id),
-                }
-                for it in stored
-            ]
-            resp2 = await client.post(
-                f"{supabase_url}/rest/v1/request_photos",
-                headers={
-                    **headers_auth,
-                    "Content-Type": "application/json",
-                    "Prefer": "return=minimal",
-                },
-                json=rows,
-            )
-            if resp2.status_code // 100 != 2:
-                raise HTTPException(status_code=502, detail=f"Supabase insert request_photos failed: {resp2.text}")
+
+    body, replayed = await _upload_files(
+        request, files, request_id, origin, session_id, image_pool, storage_client, client, idempotency, settings
+    )
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return body
+
+
+async def _upload_files(
+    request: Request,
+    files: List[UploadFile],
+    request_id: str,
+    origin: str,
+    session_id: str,
+    image_pool: Optional[ProcessPoolExecutor],
+    storage_client: httpx.AsyncClient,
+    client: httpx.AsyncClient,
+    idempotency: IdempotencyStore,
+    settings: Settings,
+) -> Tuple[dict, bool]:
+    """Hash, dedupe, store and record `files`; shared by multipart and resumable uploads."""
+    semaphore = asyncio.Semaphore(settings.upload_concurrency)
+
+    def wants_processing(f: UploadFile) -> bool:
+        return image_pool is not None and (f.content_type or "").startswith("image/")
+
+    async def digest_one(f: UploadFile) -> Tuple[str, int, bytes, Optional[str]]:
+        async with semaphore:
+            return await asyncio.to_thread(_digest_upload, f, wants_processing(f))
+
+    digests = await asyncio.gather(*(digest_one(f) for f in files), return_exceptions=True)
+    spools = [d[3] for d in digests if not isinstance(d, BaseException) and d[3]]
+    try:
+        for d in digests:
+            if isinstance(d, BaseException):
+                raise d
+
+        # A retried upload (Idempotency-Key header, else the same request,
+        # session and file contents) replays the first response.
+        request_fingerprint = fingerprint(
+            "upload", request_id, origin, session_id, [(f.filename, d[0]) for f, d in zip(files, digests)]
+        )
+        key = idempotency_key(request, request_fingerprint)
+        return await idempotency.run(
+            "upload",
+            key,
+            request_fingerprint,
+            lambda: _store_uploads(
+                files, digests, request_id, origin, session_id, image_pool, storage_client, client,
+                settings, semaphore,
+            ),
+        )
+    finally:
+        for path in spools:
+            discard_file(path)
+
+
+async def _store_uploads(
+    files: List[UploadFile],
+    digests: List[Tuple[str, int, bytes, Optional[str]]],
+    request_id: str,
+    origin: str,
+    session_id: str,
+    image_pool: Optional[ProcessPoolExecutor],
+    storage_client: httpx.AsyncClient,
+    client: httpx.AsyncClient,
+    settings: Settings,
+    semaphore: asyncio.Semaphore,
+) -> dict:
+    supabase = settings.supabase
+    global_scope = settings.upload_dedup_global
+    existing: Dict[str, dict] = {}
+    linked: set = set()
+    if digests:
+        existing, linked = await _find_existing_photos(
+            client, supabase.url, supabase.headers, sorted({d[0] for d in digests}), request_id, global_scope
+        )
+
+    # Identical files within one batch are uploaded once.
+    pending: Dict[str, asyncio.Task] = {}
+
+    async def store_one(f: UploadFile, content_hash: str, size: int, header: bytes, spool: Optional[str]) -> dict:
+        safe_name = f.filename or "file"
+        prefix = "sha256" if global_scope else request_id
+        stem = f"{prefix}/{content_hash[:2]}/{content_hash}"
+        item = {"storage_path": f"{stem}{_extension(safe_name)}", "name": safe_name, "origin": origin, "width": None, "height": None, "size_bytes": size or None, "session_id": session_id, "preview_path": None, "thumb_path": None, "raw_path": None, "content_hash": content_hash, "deduplicated": False}
+
+        found = existing.get(content_hash)
+        if found:
+            for key in ("storage_path", "preview_path", "thumb_path", "raw_path", "width", "height", "size_bytes"):
+                item[key] = found.get(key)
+            item["deduplicated"] = True
+            upload_files.labels("deduplicated").inc()
+            return item
+
+        # Images are stored as their normalized re-encode (oriented, metadata
+        # stripped, size-capped); anything else is stored as uploaded.
+        processed = await _process_upload(image_pool, spool, settings.images) if spool and image_pool is not None else None
+        if processed is None:
+            async with semaphore:
+                await _put_object(
+                    storage_client,
+                    supabase.object_url(item["storage_path"]),
+                    supabase.headers,
+                    _iter_upload(f),
+                    f.content_type or "application/octet-stream",
+                    size,
+                )
+            upload_files.labels("stored").inc()
+            upload_bytes.labels("original").inc(size)
+            item["width"], item["height"] = await asyncio.to_thread(_probe_dimensions, header)
+            return item
+
+        try:
+            if settings.images.keep_raw:
+                raw_path = f"{stem}.raw{_extension(safe_name)}"
+                async with semaphore:
+                    await _put_object(
+                        storage_client,
+                        supabase.object_url(raw_path),
+                        supabase.headers,
+                        _iter_upload(f),
+                        f.content_type or "application/octet-stream",
+                        size,
+                    )
+                upload_bytes.labels("raw").inc(size)
+                item["raw_path"] = raw_path
+
+            for name, variant in processed.variants.items():
+                if name == "original":
+                    variant_path = f"{stem}.{variant['ext']}"
+                    item["storage_path"] = variant_path
+                    item["size_bytes"] = variant["size_bytes"]
+                    item["width"], item["height"] = variant["width"], variant["height"]
+                else:
+                    variant_path = f"{stem}.{name}.{variant['ext']}"
+                    item[f"{name}_path"] = variant_path
+                async with semaphore:
+                    await _put_object(
+                        storage_client,
+                        supabase.object_url(variant_path),
+                        supabase.headers,
+                        _iter_file(variant["path"]),
+                        variant["content_type"],
+                        variant["size_bytes"],
+                    )
+                upload_bytes.labels("original" if name == "original" else "derivative").inc(variant["size_bytes"])
+        finally:
+            for variant in processed.variants.values():
+                discard_file(variant["path"])
+        upload_files.labels("stored").inc()
+        return item
+
+    async def store_or_share(f: UploadFile, digest: Tuple[str, int, bytes, Optional[str]]) -> dict:
+        content_hash, size, header, spool = digest
+        first = pending.get(content_hash)
+        if first is None:
+            first = pending[content_hash] = asyncio.ensure_future(store_one(f, content_hash, size, header, spool))
+            return await first
+        shared = await first
+        upload_files.labels("deduplicated").inc()
+        return {**shared, "name": f.filename or "file", "deduplicated": True}
+
+    results = await asyncio.gather(
+        *(store_or_share(f, d) for f, d in zip(files, digests)), return_exceptions=True
+    )
+    for res in results:
+        if isinstance(res, BaseException):
+            raise res
+    stored: list[dict] = list(results)
+
+    # One row per distinct object for this request; hashes already linked
+    # (a retried submit) are skipped entirely.
+    rows = []
+    seen = set(linked)
+    for it in stored:
+        if it["content_hash"] in seen:
+            continue
+        seen.add(it["content_hash"])
+        rows.append({
+            "request_id": request_id,
+            "storage_path": it["storage_path"],
+            "name": it.get("name"),
+            "origin": it.get("origin", origin),
+            "width": it.get("width"),
+            "height": it.get("height"),
+            "size_bytes": it.get("size_bytes"),
+            "session_id": it.get("session_id", session_id),
+            "preview_path": it.get("preview_path"),
+            "thumb_path": it.get("thumb_path"),
+            "raw_path": it.get("raw_path"),
+            "content_hash": it["content_hash"],
+        })
+    if rows:
+        resp2 = await client.post(
+            supabase.table_url("request_photos"),
+            params={"on_conflict": "request_id,content_hash"},
+            headers={**supabase.json_headers, "Prefer": "return=minimal,resolution=ignore-duplicates"},
+            json=rows,
+        )
+        if resp2.status_code // 100 != 2:
+            raise HTTPException(status_code=502, detail=f"Supabase insert request_photos failed: {resp2.text}")
 
     return {"ok": True, "uploaded": len(stored), "items": stored}
 
 
+# Resumable uploads: create a session, PUT chunks at increasing offsets
+# (GET the session to learn the offset after a dropped connection), then
+# finalize, which runs the assembled file through the /api/upload pipeline.
+
+class UploadSessionBody(BaseModel):
+    request_id: str
+    filename: str
+    size: int = Field(..., gt=0)
+    content_type: Optional[str] = None
+    origin: str = ""
+    session_id: str = ""
+
+
+def _session_view(meta: dict) -> dict:
+    return {
+        "ok": True,
+        "upload_id": meta["upload_id"],
+        "status": meta["status"],
+        "offset": meta["offset"],
+        "size": meta["size"],
+        "expires_at": meta["expires_at"],
+    }
+
+
+@router.post("/upload/sessions", status_code=201)
+async def create_upload_session(
+    body: UploadSessionBody,
+    request: Request,
+    sessions: UploadSessions = Depends(get_upload_sessions),
+    settings: Settings = Depends(get_settings),
+):
+    """Open a resumable upload; 429 once this client holds too many unfinished ones."""
+    if not settings.supabase.configured:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+    ip = client_ip(request.scope, settings.rate_limits.forwarded_hops)
+    meta = await asyncio.to_thread(sessions.create, body.model_dump(), ip)
+    return {**_session_view(meta), "chunk_size": sessions.chunk_size}
+
+
+@router.get("/upload/sessions/{upload_id}")
+async def get_upload_session(upload_id: str, sessions: UploadSessions = Depends(get_upload_sessions)):
+    meta = await asyncio.to_thread(sessions.load, upload_id)
+    return _session_view(meta)
+
+
+@router.put("/upload/sessions/{upload_id}")
+async def put_upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    sessions: UploadSessions = Depends(get_upload_sessions),
+):
+    """Append the raw request body at `offset`; 409 with `Upload-Offset` when it is not where the server is."""
+    new_offset = await sessions.append(upload_id, offset, request.stream())
+    return {"ok": True, "offset": new_offset}
+
+
+@router.post("/upload/sessions/{upload_id}/complete")
+async def complete_upload_session(
+    upload_id: str,
+    request: Request,
+    response: Response,
+    sessions: UploadSessions = Depends(get_upload_sessions),
+    storage_client: httpx.AsyncClient = Depends(get_storage_client),
+    client: httpx.AsyncClient = Depends(get_supabase_client),
+    image_pool: Optional[ProcessPoolExecutor] = Depends(get_image_pool),
+    idempotency: IdempotencyStore = Depends(get_idempotency_store),
+    settings: Settings = Depends(get_settings),
+):
+    """Store the assembled file and its request_photos row; repeat calls return the same result."""
+    if not settings.supabase.configured:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+    meta = await asyncio.to_thread(sessions.load, upload_id)
+    if meta["status"] == "uploading":
+        with sessions.lock(upload_id) as fh:
+            meta = await asyncio.to_thread(sessions.load, upload_id)
+            if meta["status"] == "uploading":
+                if meta["offset"] != meta["size"]:
+                    raise HTTPException(
+                        status_code=409,
+                        detail=f"Upload incomplete: {meta['offset']} of {meta['size']} bytes received",
+                        headers={"Upload-Offset": str(meta["offset"])},
+                    )
+                upload = UploadFile(
+                    fh,
+                    size=meta["size"],
+                    filename=meta["filename"],
+                    headers=Headers({"content-type": meta["content_type"] or "application/octet-stream"}),
+                )
+                body, replayed = await _upload_files(
+                    request, [upload], meta["request_id"], meta["origin"], meta["session_id"],
+                    image_pool, storage_client, client, idempotency, settings,
+                )
+                await asyncio.to_thread(sessions.complete, upload_id, body)
+                if replayed:
+                    response.headers[REPLAYED_HEADER] = "true"
+                return body
+    return meta["result"]
+
+
+@router.delete("/upload/sessions/{upload_id}")
+async def delete_upload_session(upload_id: str, sessions: UploadSessions = Depends(get_upload_sessions)):
+    await asyncio.to_thread(sessions.delete, upload_id)
+    return {"ok": True}
@@ -1,109 +1,144 @@
-from typing import List
+import asyncio
+from typing import List, Optional
 
 import httpx
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 
-from app.core.config import get_env
-from app.schemas import SendTelegramPayload
-import json
+from app.core.batcher import WriteBehindQueue
+from app.core.cache import Caches, get_caches
+from app.core.config import Settings, get_settings
+from app.core.http import get_supabase_client
+from app.core.outbox import Dispatcher, Outbox, get_dispatcher, get_outbox
+from app.core.photos import unsafe_storage_path
+from app.routes.ai import find_session_request, get_ai_messages_queue
+from app.schemas import SendTelegramPayload, SendTelegramStoredPayload, SendTranscriptPayload
 
 
 router = APIRouter(prefix="/api")
 
 
-@router.post("/send-telegram")
-async def send_telegram(payload: SendTelegramPayload):
-    bot_token = get_env("TELEGRAM_BOT_TOKEN", "")
-    chat_id = get_env("TELEGRAM_CHAT_ID", "")
-    if not bot_token or not chat_id:
+def _telegram_chat_id(settings: Settings) -> str:
+    if not settings.telegram.configured:
         raise HTTPException(status_code=500, detail="Telegram not configured")
+    return settings.telegram.chat_id
+
+
+async def _enqueue(
+    outbox: Outbox, dispatcher: Dispatcher, kind: str, chat_id: str, payload: dict, attachments=None, delay: float = 0.0
+) -> dict:
+    job_id = await asyncio.to_thread(outbox.enqueue, kind, f"telegram:{chat_id}", payload, attachments, delay)
+    dispatcher.notify()
+    return {"ok": True, "queued": True, "job_id": job_id}
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.post(
-            f"https://api.telegram.org/bot{bot_token}/sendMessage",
-            json={"chat_id": chat_id, "text": payload.text},
-        )
-        if resp.status_code // 100 != 2:
-            raise HTTPException(status_code=502, detail=f"Telegram sendMessage failed: {resp.text}")
 
-    return {"ok": True}
+async def _spool_uploads(outbox: Outbox, files: List[UploadFile], default_name: str, default_type: str) -> list:
+    attachments = []
+    for idx, f in enumerate(files):
+        attachments.append(await asyncio.to_thread(
+            outbox.spool, f.file, f.filename or default_name.format(idx=idx), f.content_type or default_type
+        ))
+    return attachments
 
 
-@router.post("/send-telegram-upload")
+@router.post("/send-telegram", status_code=202)
+async def send_telegram(
+    payload: SendTelegramPayload,
+    outbox: Outbox = Depends(get_outbox),
+    dispatcher: Dispatcher = Depends(get_dispatcher),
+    settings: Settings = Depends(get_settings),
+):
+    chat_id = _telegram_chat_id(settings)
+    return await _enqueue(outbox, dispatcher, "telegram_message", chat_id, {"chat_id": chat_id, "text": payload.text})
+
+
+@router.post("/send-telegram-upload", status_code=202)
 async def send_telegram_upload(
     text: str = Form(""),
     files: List[UploadFile] = File(default_factory=list),
+    outbox: Outbox = Depends(get_outbox),
+    dispatcher: Dispatcher = Depends(get_dispatcher),
+    settings: Settings = Depends(get_settings),
 ):
-    bot_token = get_env("TELEGRAM_BOT_TOKEN", "")
-    chat_id = get_env("TELEGRAM_CHAT_ID", "")
-    if not bot_token or not chat_id:
-        raise HTTPException(status_code=500, detail="Telegram not configured")
+    chat_id = _telegram_chat_id(settings)
 
     if not files:
         if text:
-            async with httpx.AsyncClient(timeout=30) as client:
-                r = await client.post(
-                    f"https://api.telegram.org/bot{bot_token}/sendMessage",
-                    json={"chat_id": chat_id, "text": text},
-                )
-                if r.status_code // 100 != 2:
-                    raise HTTPException(status_code=502, detail=f"Telegram sendMessage failed: {r.text}")
+            await _enqueue(outbox, dispatcher, "telegram_message", chat_id, {"chat_id": chat_id, "text": text})
         return {"ok": True, "info": "no files"}
 
-    async with httpx.AsyncClient(timeout=60) as client:
-        if len(files) == 1:
-            f0 = files[0]
-            data0 = await f0.read()
-            r = await client.post(
-                f"https://api.telegram.org/bot{bot_token}/sendPhoto",
-                data={"chat_id": chat_id, **({"caption": text} if text else {})},
-                files={"photo": (f0.filename or "photo.jpg", data0, f0.content_type or "image/jpeg")},
-            )
-            if r.status_code // 100 != 2:
-                raise HTTPException(status_code=502, detail=f"Telegram sendPhoto failed: {r.text}")
-            return {"ok": True}
-
-        files_dict = {}
-        media = []
-        for idx, f in enumerate(files):
-            await f.seek(0)
-            data = await f.read()
-            key = f"photo{idx}"
-            files_dict[key] = (f.filename or f"{key}.jpg", data, f.content_type or "image/jpeg")
-            item = {"type": "photo", "media": f"attach://{key}"}
-            if idx == 0 and text:
-                item["caption"] = text
-            media.append(item)
-        r = await client.post(
-            f"https://api.telegram.org/bot{bot_token}/sendMediaGroup",
-            data={"chat_id": chat_id, "media": json.dumps(media, ensure_ascii=False)},
-            files=files_dict,
-        )
-        if r.status_code // 100 != 2:
-            raise HTTPException(status_code=502, detail=f"Telegram sendMediaGroup failed: {r.text}")
-
-    return {"ok": True}
-
-
-@router.post("/send-document")
-async def send_document(caption: str = Form(""), document: UploadFile = File(...)):
-    bot_token = get_env("TELEGRAM_BOT_TOKEN", "")
-    chat_id = get_env("TELEGRAM_CHAT_ID", "")
-    if not bot_token or not chat_id:
-        raise HTTPException(status_code=500, detail="Telegram not configured")
-
-    content = await document.read()
-    async with httpx.AsyncClient(timeout=30) as client:
-        url = f"https://api.telegram.org/bot{bot_token}/sendDocument"
-        files = {
-            "chat_id": (None, chat_id),
-            "caption": (None, caption or ""),
-            "document": (document.filename or "file.txt", content, document.content_type or "text/plain"),
-        }
-        resp = await client.post(url, files=files)
-        if resp.status_code // 100 != 2:
-            raise HTTPException(status_code=502, detail=f"Telegram sendDocument failed: {resp.text}")
-
-    return {"ok": True}
+    attachments = await _spool_uploads(outbox, files, "photo{idx}.jpg", "image/jpeg")
+    return await _enqueue(outbox, dispatcher, "telegram_media", chat_id, {"chat_id": chat_id, "caption": text}, attachments)
 
 
+@router.post("/send-telegram-stored", status_code=202)
+async def send_telegram_stored(
+    payload: SendTelegramStoredPayload,
+    outbox: Outbox = Depends(get_outbox),
+    dispatcher: Dispatcher = Depends(get_dispatcher),
+    settings: Settings = Depends(get_settings),
+):
+    """Forward photos already uploaded via /api/upload for a request, optionally only some paths."""
+    if not payload.request_id:
+        raise HTTPException(status_code=422, detail="request_id is required")
+    if any(unsafe_storage_path(p) for p in payload.storage_paths or []):
+        raise HTTPException(status_code=422, detail="Invalid storage path")
+    chat_id = _telegram_chat_id(settings)
+    return await _enqueue(outbox, dispatcher, "telegram_stored", chat_id, {
+        "chat_id": chat_id,
+        "caption": payload.text,
+        "request_id": payload.request_id,
+        "storage_paths": payload.storage_paths,
+    })
+
+
+@router.post("/send-document", status_code=202)
+async def send_document(
+    caption: str = Form(""),
+    document: UploadFile = File(...),
+    outbox: Outbox = Depends(get_outbox),
+    dispatcher: Dispatcher = Depends(get_dispatcher),
+    settings: Settings = Depends(get_settings),
+):
+    chat_id = _telegram_chat_id(settings)
+    attachments = await _spool_uploads(outbox, [document], "file.txt", "text/plain")
+    return await _enqueue(outbox, dispatcher, "telegram_document", chat_id, {"chat_id": chat_id, "caption": caption or ""}, attachments)
+
+
+@router.post("/send-transcript", status_code=202)
+async def send_transcript(
+    payload: SendTranscriptPayload,
+    client: httpx.AsyncClient = Depends(get_supabase_client),
+    queue: Optional[WriteBehindQueue] = Depends(get_ai_messages_queue),
+    outbox: Outbox = Depends(get_outbox),
+    dispatcher: Dispatcher = Depends(get_dispatcher),
+    settings: Settings = Depends(get_settings),
+    caches: Caches = Depends(get_caches),
+):
+    """Send an AI dialog as a text document, rendered server-side from ai_messages."""
+    if not payload.request_id and not payload.session_id:
+        raise HTTPException(status_code=422, detail="request_id or session_id is required")
+    chat_id = _telegram_chat_id(settings)
+    if not settings.supabase.configured:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+
+    request_id = payload.request_id
+    if not request_id:
+        request_id = caches.ai_sessions.get(payload.session_id) or await find_session_request(
+            client, settings.supabase, settings.ai, payload.session_id
+        )
+        if not request_id:
+            raise HTTPException(status_code=404, detail="No AI request for this session")
+
+    # Messages of this chat may still sit in a write-behind buffer: flush ours
+    # now, and give other workers' buffers one flush interval before the
+    # dispatcher reads the table.
+    delay = 0.0
+    if queue is not None:
+        await queue.drain(settings.outbox.transcript_drain_timeout)
+        delay = queue.flush_interval
+    return await _enqueue(outbox, dispatcher, "telegram_transcript", chat_id, {
+        "chat_id": chat_id,
+        "caption": payload.caption,
+        "request_id": request_id,
+        "gzip": payload.gzip,
+    }, delay=delay)
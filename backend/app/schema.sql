@@ -84,3 +84,119 @@ create index if not exists idx_request_photos_message_id on public.request_photo
 create index if not exists idx_request_photos_session_id on public.request_photos (session_id);
 
 
+
+create table if not exists public.request_jobs (
+  id bigserial primary key,
+  request_id uuid not null references public.requests(id) on delete cascade,
+  job_id text,
+  name text,
+  price numeric
+);
+
+create index if not exists idx_request_jobs_request_id on public.request_jobs (request_id);
+
+create table if not exists public.request_messages (
+  id bigserial primary key,
+  request_id uuid not null references public.requests(id) on delete cascade,
+  created_at timestamptz not null default now(),
+  session_id text,
+  sender text,
+  content text,
+  photos_count int default 0
+);
+
+create index if not exists idx_request_messages_request_id on public.request_messages (request_id, created_at);
+
+-- Client-provided photo links sent with /api/store-request
+alter table public.request_photos add column if not exists url text;
+alter table public.request_photos alter column storage_path drop not null;
+
+-- Single round-trip ingestion for /api/store-request (STORE_REQUEST_RPC=1).
+-- payload = { "request": {requests columns}, "children": { "<table>": [rows], ... } }
+-- Everything runs in one transaction: a failing child rolls back the parent.
+create or replace function public.store_request(payload jsonb)
+returns uuid
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  rid uuid;
+  children jsonb := coalesce(payload->'children', '{}'::jsonb);
+begin
+  insert into public.requests (source, form_type, session_id, full_name, email, phone, address, consent_to_text, meta)
+  select r.source, r.form_type, r.session_id, r.full_name, r.email, r.phone, r.address, r.consent_to_text, coalesce(r.meta, '{}'::jsonb)
+  from jsonb_populate_record(null::public.requests, payload->'request') r
+  returning id into rid;
+
+  insert into public.contact_details (request_id, description)
+  select rid, c.description
+  from jsonb_populate_recordset(null::public.contact_details, children->'contact_details') c;
+
+  insert into public.dynamic_details (request_id, project_description, timeline, main_categories, service_groups, detailed_services)
+  select rid, d.project_description, d.timeline, d.main_categories, d.service_groups, d.detailed_services
+  from jsonb_populate_recordset(null::public.dynamic_details, children->'dynamic_details') d;
+
+  insert into public.hourly_details (request_id, hourly_package, description)
+  select rid, h.hourly_package, h.description
+  from jsonb_populate_recordset(null::public.hourly_details, children->'hourly_details') h;
+
+  insert into public.ai_messages (request_id, session_id, sender, content, photos_count, storage_paths)
+  select rid, m.session_id, m.sender, m.content, coalesce(m.photos_count, 0), m.storage_paths
+  from jsonb_populate_recordset(null::public.ai_messages, children->'ai_messages') m;
+
+  insert into public.ai_jobs (request_id, job_id, name, price, session_id)
+  select rid, j.job_id, j.name, j.price, j.session_id
+  from jsonb_populate_recordset(null::public.ai_jobs, children->'ai_jobs') j;
+
+  insert into public.request_jobs (request_id, job_id, name, price)
+  select rid, j.job_id, j.name, j.price
+  from jsonb_populate_recordset(null::public.request_jobs, children->'request_jobs') j;
+
+  insert into public.request_messages (request_id, session_id, sender, content, photos_count)
+  select rid, m.session_id, m.sender, m.content, coalesce(m.photos_count, 0)
+  from jsonb_populate_recordset(null::public.request_messages, children->'request_messages') m;
+
+  insert into public.request_photos (request_id, url, name, origin, session_id)
+  select rid, p.url, p.name, p.origin, p.session_id
+  from jsonb_populate_recordset(null::public.request_photos, children->'request_photos') p;
+
+  return rid;
+end;
+$$;
+
+revoke all on function public.store_request(jsonb) from public, anon, authenticated;
+grant execute on function public.store_request(jsonb) to service_role;
+
+-- Normalized derivatives written next to the original by /api/upload
+-- (auto-oriented, metadata stripped, size-capped)
+alter table public.request_photos add column if not exists preview_path text;
+alter table public.request_photos add column if not exists thumb_path text;
+-- storage_path of an image is itself a normalized re-encode; the uploaded
+-- bytes are only kept (here) with IMAGE_KEEP_RAW=1
+alter table public.request_photos add column if not exists raw_path text;
+
+-- Content-addressed uploads: sha256 of the original bytes. The unique index
+-- makes re-linking the same object to a request idempotent.
+alter table public.request_photos add column if not exists content_hash text;
+create index if not exists idx_request_photos_content_hash on public.request_photos (content_hash);
+create unique index if not exists uq_request_photos_request_content_hash on public.request_photos (request_id, content_hash);
+
+-- Telegram file_id of the forwarded photo, so it is never uploaded to Telegram twice
+alter table public.request_photos add column if not exists telegram_file_id text;
+
+-- Responses replayed for repeated Idempotency-Key requests (/api/store-request,
+-- /api/upload). A 'pending' row is the claim of the worker handling the key;
+-- expires_at is its lease, then the retention of the stored response.
+create table if not exists public.idempotency_keys (
+  scope text not null,
+  key text not null,
+  fingerprint text not null,
+  status text not null default 'pending',
+  response jsonb,
+  created_at timestamptz not null default now(),
+  expires_at timestamptz not null,
+  primary key (scope, key)
+);
+
+create index if not exists idx_idempotency_keys_expires_at on public.idempotency_keys (expires_at);
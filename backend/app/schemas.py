@@ -1,4 +1,4 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union
 
 from pydantic import BaseModel
 
@@ -7,20 +7,59 @@ class SendTelegramPayload(BaseModel):
     text: str
 
 
+class SendTelegramStoredPayload(BaseModel):
+    text: str = ""
+    request_id: Optional[str] = None
+    storage_paths: Optional[List[str]] = None
+
+
+class SendTranscriptPayload(BaseModel):
+    request_id: Optional[str] = None
+    session_id: Optional[str] = None  # resolved to the session's latest AI request
+    caption: str = ""
+    gzip: bool = False
+
+
 class SendSmsPayload(BaseModel):
     to: str
     text: str
     subject: Optional[str] = None
 
 
+# Items of /api/store-request. Typed so the whole payload is checked in one
+# validation pass; keys the backend doesn't store are ignored.
+
+
+class PhotoItem(BaseModel):
+    url: Optional[str] = None
+    name: Optional[str] = None
+    origin: Optional[str] = None
+    session_id: Optional[str] = None
+    storage_path: Optional[str] = None
+
+
+class JobItem(BaseModel):
+    id: Optional[Union[str, int]] = None
+    name: Optional[str] = None
+    price: Optional[Union[int, float, str]] = None  # numeric column; strings are left to Postgres
+
+
+class MessageItem(BaseModel):
+    sender: Optional[str] = None
+    content: Optional[str] = None
+    photos_count: Optional[int] = None
+    session_id: Optional[str] = None
+    photos: Optional[List[PhotoItem]] = None
+
+
 class StoreRequestPayload(BaseModel):
     source: Optional[str] = None  # website, etc
     form_type: Optional[str] = None  # contact | dynamic | hourly | ai
     session_id: Optional[str] = None
     contact: Optional[Dict[str, Any]] = None
-    jobs: Optional[List[Dict[str, Any]]] = None
-    messages: Optional[List[Dict[str, Any]]] = None
-    photos: Optional[List[Dict[str, Any]]] = None
+    jobs: Optional[List[JobItem]] = None
+    messages: Optional[List[MessageItem]] = None
+    photos: Optional[List[PhotoItem]] = None
     meta: Optional[Dict[str, Any]] = None
 
 
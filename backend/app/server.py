@@ -0,0 +1,110 @@
+"""Production entry point: `python -m app.server`.
+
+Runs uvicorn with uvloop/httptools and WEB_CONCURRENCY worker processes
+(default: one per available CPU, honouring container CPU quotas). Workers
+that die are replaced by the supervisor.
+
+On SIGTERM each worker drains: /api/health turns 503 (after DRAIN_DELAY
+seconds of still serving, so a load balancer can deregister it), the
+listener closes, in-flight requests get up to GRACEFUL_TIMEOUT seconds to
+finish, then the lifespan flushes queued writes and the outbox dispatcher.
+Keep the orchestrator's stop timeout above DRAIN_DELAY + GRACEFUL_TIMEOUT + 40.
+"""
+
+import glob
+import math
+import os
+import tempfile
+import time
+from typing import Optional
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+from app.core.config import load_settings
+from app.core.workers import begin_drain
+
+
+def available_cpus() -> int:
+    """CPUs this process may use: affinity mask, capped by a cgroup v2 quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as fh:
+            quota, period = fh.read().split()[:2]
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def _shared_dir(name: str, prefix: str) -> str:
+    """Directory shared by all workers, emptied of a previous run's files."""
+    directory = os.environ.get(name) or tempfile.mkdtemp(prefix=prefix)
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*")):
+        if os.path.isfile(path):
+            os.remove(path)
+    os.environ[name] = directory
+    return directory
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn.Server that reports draining before it stops accepting."""
+
+    def __init__(self, config: uvicorn.Config, drain_delay: float = 0.0):
+        super().__init__(config)
+        self.drain_delay = drain_delay
+        self.drain_until: Optional[float] = None
+
+    def handle_exit(self, sig, frame) -> None:
+        begin_drain()
+        if self.drain_delay > 0 and self.drain_until is None:
+            # Keep serving while health checks fail; a second signal stops now.
+            self.drain_until = time.monotonic() + self.drain_delay
+            return
+        super().handle_exit(sig, frame)
+
+    async def on_tick(self, counter: int) -> bool:
+        if self.drain_until is not None and time.monotonic() >= self.drain_until:
+            return True
+        return await super().on_tick(counter)
+
+
+def main() -> None:
+    # Validate everything once here, before forking workers that would each fail.
+    settings = load_settings().server
+    cpus = available_cpus()
+    workers = settings.web_concurrency or cpus
+    if workers > 1:
+        _shared_dir("PROMETHEUS_MULTIPROC_DIR", "prometheus-")
+        _shared_dir("WORKER_STATE_DIR", "workers-")
+        # Workers load their own settings from the environment; these are
+        # handed down that way. Each worker owns an image pool; don't let them
+        # oversubscribe the CPUs.
+        os.environ.setdefault("IMAGE_WORKERS", str(max(1, cpus // workers)))
+
+    config = uvicorn.Config(
+        "app.main:app",
+        host=settings.host,
+        port=settings.port,
+        workers=workers,
+        loop=settings.loop,
+        http=settings.http,
+        lifespan="on",
+        timeout_keep_alive=settings.keep_alive_timeout,
+        timeout_graceful_shutdown=settings.graceful_timeout,
+        access_log=settings.access_log,
+    )
+    server = DrainingServer(config, drain_delay=settings.drain_delay)
+    if workers > 1:
+        Multiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
+
+
+if __name__ == "__main__":
+    main()
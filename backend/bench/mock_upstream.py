@@ -0,0 +1,219 @@
+"""Local stand-in for Supabase (PostgREST + Storage), Telegram and Telnyx.
+
+Point the backend at it to benchmark without touching real services:
+
+    SUPABASE_URL=http://127.0.0.1:9900
+    TELEGRAM_API_BASE=http://127.0.0.1:9900
+    TELNYX_API_BASE=http://127.0.0.1:9900
+
+Latency and failures are injected per upstream, e.g.
+
+    python -m bench.mock_upstream --latency-ms 40 --jitter-ms 15 \\
+        --latency-ms telegram=250 --error-rate storage=0.02
+
+Injected errors are 503s, except Telegram which answers 429 with a
+`retry_after`, like the real Bot API under flood control.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+
+UPSTREAMS = ("supabase", "storage", "telegram", "telnyx")
+
+# Served for every Storage download (a typical preview-sized JPEG).
+_OBJECT = bytes(range(256)) * 1024
+
+
+class Faults:
+    def __init__(self, latency_ms: Dict[str, float], jitter_ms: Dict[str, float], error_rate: Dict[str, float]):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    async def delay(self, upstream: str) -> None:
+        base = self.latency_ms.get(upstream, 0.0)
+        jitter = self.jitter_ms.get(upstream, 0.0)
+        seconds = max(0.0, random.gauss(base, jitter)) / 1000 if jitter else base / 1000
+        if seconds:
+            await asyncio.sleep(seconds)
+
+    def should_fail(self, upstream: str) -> bool:
+        rate = self.error_rate.get(upstream, 0.0)
+        return rate > 0 and random.random() < rate
+
+
+def _injected_error(upstream: str) -> Response:
+    if upstream == "telegram":
+        return JSONResponse(
+            {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1", "parameters": {"retry_after": 1}},
+            status_code=429,
+        )
+    return JSONResponse({"message": "injected failure"}, status_code=503)
+
+
+def _upstream(path: str) -> str:
+    if path.startswith("/rest/v1/"):
+        return "supabase"
+    if path.startswith("/storage/v1/"):
+        return "storage"
+    if path.startswith("/bot"):
+        return "telegram"
+    return "telnyx"
+
+
+def create_app(faults: Faults) -> FastAPI:
+    app = FastAPI(title="Mock upstreams")
+    calls: Counter = Counter()
+    started = time.time()
+
+    @app.middleware("http")
+    async def inject(request: Request, call_next):
+        if request.url.path == "/__stats":
+            return await call_next(request)
+        upstream = _upstream(request.url.path)
+        calls[f"{upstream} {request.method}"] += 1
+        # Read the body before sleeping so uploads cost what they would upstream.
+        await request.body()
+        await faults.delay(upstream)
+        if faults.should_fail(upstream):
+            calls[f"{upstream} injected_error"] += 1
+            return _injected_error(upstream)
+        return await call_next(request)
+
+    @app.get("/__stats")
+    async def stats():
+        return {"uptime": time.time() - started, "calls": dict(calls)}
+
+    # PostgREST
+
+    @app.post("/rest/v1/rpc/{fn}")
+    async def rpc(fn: str):
+        return JSONResponse(str(uuid.uuid4()))
+
+    @app.get("/rest/v1/{table}")
+    async def select(table: str):
+        return JSONResponse([])
+
+    @app.post("/rest/v1/{table}")
+    async def insert(table: str, request: Request):
+        body = await request.json()
+        rows = body if isinstance(body, list) else [body]
+        if "return=representation" not in request.headers.get("prefer", ""):
+            return Response(status_code=201)
+        return JSONResponse([{**row, "id": str(uuid.uuid4())} for row in rows], status_code=201)
+
+    @app.patch("/rest/v1/{table}")
+    async def update(table: str):
+        return Response(status_code=204)
+
+    # Storage
+
+    @app.post("/storage/v1/object/sign/{bucket}")
+    async def sign(bucket: str, request: Request):
+        body = await request.json()
+        return [
+            {"path": path, "signedURL": f"/object/sign/{bucket}/{path}?token=mock", "error": None}
+            for path in body.get("paths") or []
+        ]
+
+    @app.post("/storage/v1/object/{bucket}/{path:path}")
+    async def upload(bucket: str, path: str):
+        return {"Key": f"{bucket}/{path}"}
+
+    @app.get("/storage/v1/object/{bucket}/{path:path}")
+    async def download(bucket: str, path: str, request: Request):
+        start, end = 0, len(_OBJECT) - 1
+        spec = request.headers.get("range", "")
+        if spec.startswith("bytes="):
+            first, _, last = spec[6:].partition("-")
+            start, end = int(first or 0), min(int(last) if last else end, end)
+            return Response(
+                _OBJECT[start:end + 1],
+                status_code=206,
+                media_type="image/jpeg",
+                headers={"Content-Range": f"bytes {start}-{end}/{len(_OBJECT)}", "ETag": '"mock"'},
+            )
+        return Response(_OBJECT, media_type="image/jpeg", headers={"ETag": '"mock"'})
+
+    @app.get("/storage/v1/bucket/{bucket}")
+    async def bucket(bucket: str):
+        return {"id": bucket, "name": bucket, "public": False}
+
+    # Telegram
+
+    @app.get("/bot{token}/getMe")
+    async def get_me(token: str):
+        return {"ok": True, "result": {"id": 1, "is_bot": True, "username": "mock_bot"}}
+
+    @app.post("/bot{token}/{method}")
+    async def telegram(token: str, method: str, request: Request):
+        if method == "sendMediaGroup":
+            if request.headers.get("content-type", "").startswith("application/json"):
+                count = len((await request.json()).get("media") or [])
+            else:
+                count = max(1, (await request.body()).count(b"attach://"))
+            result = [_telegram_message(i) for i in range(count)]
+        else:
+            result = _telegram_message(0, document=method == "sendDocument")
+        return {"ok": True, "result": result}
+
+    # Telnyx
+
+    @app.post("/v2/messages")
+    async def telnyx():
+        return {"data": {"id": str(uuid.uuid4()), "record_type": "message"}}
+
+    @app.get("/v2/messaging_profiles/{profile_id}")
+    async def messaging_profile(profile_id: str):
+        return {"data": {"id": profile_id, "record_type": "messaging_profile", "enabled": True}}
+
+    return app
+
+
+def _telegram_message(index: int, document: bool = False) -> dict:
+    file_id = f"mock-{uuid.uuid4().hex}"
+    if document:
+        return {"message_id": index, "document": {"file_id": file_id}}
+    return {"message_id": index, "photo": [{"file_id": f"{file_id}-s"}, {"file_id": file_id}]}
+
+
+def _per_upstream(values: Optional[list], default: float = 0.0) -> Dict[str, float]:
+    """Parse repeated `N` / `upstream=N` options into a per-upstream map."""
+    result = {name: default for name in UPSTREAMS}
+    for value in values or []:
+        name, sep, number = value.rpartition("=")
+        if not sep:
+            result = {upstream: float(number) for upstream in UPSTREAMS}
+        elif name in UPSTREAMS:
+            result[name] = float(number)
+        else:
+            raise SystemExit(f"unknown upstream {name!r} (expected one of {', '.join(UPSTREAMS)})")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9900)
+    parser.add_argument("--latency-ms", action="append", help="mean latency, N or upstream=N (repeatable)")
+    parser.add_argument("--jitter-ms", action="append", help="latency std-dev, N or upstream=N (repeatable)")
+    parser.add_argument("--error-rate", action="append", help="failure probability 0..1, N or upstream=N (repeatable)")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    faults = Faults(_per_upstream(args.latency_ms), _per_upstream(args.jitter_ms), _per_upstream(args.error_rate))
+    uvicorn.run(create_app(faults), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
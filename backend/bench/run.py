@@ -0,0 +1,236 @@
+"""Closed-loop load generator with latency percentiles.
+
+Against a running backend (already pointed at bench.mock_upstream):
+
+    python -m bench.run --target http://127.0.0.1:8080 --concurrency 32 --duration 20
+
+Or let it start the mock and a backend itself (run from backend/):
+
+    python -m bench.run --spawn --mock-args "--latency-ms 40 --jitter-ms 10"
+
+Save a run with `--json out.json` and pass it to a later run with
+`--compare out.json` to see the deltas; `--max-regression 10` makes the
+command exit non-zero when any p95 gets more than 10% slower.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+from bench.scenarios import Scenario, build_scenarios
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), math.ceil(pct / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    counter = iter(range(1 << 62))
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    async def worker() -> None:
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                return
+            call = scenario(next(counter))
+            t0 = time.perf_counter()
+            try:
+                resp = await client.request(call.method, call.path, **call.kwargs)
+                outcome = None if resp.status_code // 100 == 2 else str(resp.status_code)
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            t1 = time.perf_counter()
+            if t0 < measure_from:
+                continue
+            if outcome is None:
+                latencies.append((t1 - t0) * 1000)
+            else:
+                errors[outcome] = errors.get(outcome, 0) + 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = max(1e-9, time.perf_counter() - measure_from)
+    latencies.sort()
+    return {
+        "requests": len(latencies) + sum(errors.values()),
+        "errors": sum(errors.values()),
+        "error_kinds": errors,
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": latencies[-1] if latencies else 0.0,
+    }
+
+
+def print_report(results: Dict[str, Dict], baseline: Optional[Dict[str, Dict]]) -> None:
+    header = f"{'scenario':<16}{'reqs':>8}{'errs':>7}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(f"{name:<16}{r['requests']:>8}{r['errors']:>7}{r['rps']:>9.1f}{r['p50']:>10.1f}{r['p95']:>10.1f}{r['p99']:>10.1f}{r['max']:>10.1f}")
+        if r["error_kinds"]:
+            print(f"{'':<16}errors: {r['error_kinds']}")
+        old = (baseline or {}).get(name)
+        if old:
+            deltas = "  ".join(f"{key} {_delta(old[key], r[key])}" for key in ("rps", "p50", "p95", "p99"))
+            print(f"{'':<16}vs baseline: {deltas}")
+
+
+def _delta(old: float, new: float) -> str:
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def regressions(results: Dict[str, Dict], baseline: Dict[str, Dict], max_pct: float) -> List[str]:
+    slower = []
+    for name, r in results.items():
+        old = baseline.get(name)
+        if old and old["p95"] and (r["p95"] - old["p95"]) / old["p95"] * 100 > max_pct:
+            slower.append(f"{name}: p95 {old['p95']:.1f} -> {r['p95']:.1f} ms")
+    return slower
+
+
+def _wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout:.0f}s")
+
+
+@contextmanager
+def spawned(args: argparse.Namespace) -> Iterator[str]:
+    """Start the mock upstream and a backend wired to it; yields the backend URL."""
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    backend_url = f"http://127.0.0.1:{args.backend_port}"
+    outbox_dir = tempfile.mkdtemp(prefix="bench-outbox-")
+    env = {
+        **os.environ,
+        "SUPABASE_URL": mock_url,
+        "SUPABASE_SERVICE_ROLE_KEY": "bench",
+        "TELEGRAM_API_BASE": mock_url,
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "1",
+        "TELNYX_API_BASE": mock_url,
+        "TELNYX_API_KEY": "bench",
+        "TELNYX_PROFILE_ID": "bench",
+        "OUTBOX_DIR": outbox_dir,
+        "TELEGRAM_CHAT_MIN_INTERVAL": "0",
+        # Every bench request comes from one IP; measure the app, not the limiter.
+        "RATE_LIMIT_ENABLED": "0",
+    }
+    procs = [
+        subprocess.Popen(
+            [sys.executable, "-m", "bench.mock_upstream", "--port", str(args.mock_port), *shlex.split(args.mock_args)],
+        ),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.backend_port), "--log-level", "warning", *shlex.split(args.backend_args)],
+            env=env,
+        ),
+    ]
+    try:
+        _wait_ready(f"{mock_url}/__stats")
+        _wait_ready(f"{backend_url}/api/health")
+        yield backend_url
+    finally:
+        # Backend first, so its outbox drains against a still-running mock.
+        for proc in reversed(procs):
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+async def run_all(target: str, args: argparse.Namespace) -> Dict[str, Dict]:
+    factories = build_scenarios(args.photos, args.photo_side)
+    names = args.scenario or list(factories)
+    unknown = [n for n in names if n not in factories]
+    if unknown:
+        raise SystemExit(f"unknown scenario(s): {', '.join(unknown)} (available: {', '.join(factories)})")
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results: Dict[str, Dict] = {}
+    async with httpx.AsyncClient(base_url=target, limits=limits, timeout=args.timeout) as client:
+        for name in names:
+            print(f"running {name} ({args.concurrency} workers, {args.duration:.0f}s)...", file=sys.stderr)
+            results[name] = await run_scenario(client, factories[name](), args.concurrency, args.duration, args.warmup)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="http://127.0.0.1:8080", help="backend base URL")
+    parser.add_argument("--scenario", action="append", help="scenario to run (repeatable; default: all)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15.0, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds before each scenario")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--photos", type=int, default=3, help="files per upload request")
+    parser.add_argument("--photo-side", type=int, default=2048, help="sample photo edge in pixels")
+    parser.add_argument("--json", dest="json_out", help="write results to this file")
+    parser.add_argument("--compare", help="baseline results file from an earlier --json run")
+    parser.add_argument("--max-regression", type=float, help="exit 1 if any p95 is this many percent slower than baseline")
+    parser.add_argument("--spawn", action="store_true", help="start bench.mock_upstream and a backend locally")
+    parser.add_argument("--mock-port", type=int, default=9900)
+    parser.add_argument("--backend-port", type=int, default=8081)
+    parser.add_argument("--mock-args", default="", help="extra bench.mock_upstream options, e.g. \"--latency-ms 40\"")
+    parser.add_argument("--backend-args", default="", help="extra uvicorn options, e.g. \"--workers 4\"")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)["results"]
+
+    if args.spawn:
+        with spawned(args) as target:
+            results = asyncio.run(run_all(target, args))
+    else:
+        results = asyncio.run(run_all(args.target, args))
+
+    print_report(results, baseline)
+    if args.json_out:
+        with open(args.json_out, "w") as fh:
+            json.dump({"created_at": time.time(), "concurrency": args.concurrency, "results": results}, fh, indent=2)
+
+    if baseline is not None and args.max_regression is not None:
+        slower = regressions(results, baseline, args.max_regression)
+        if slower:
+            print("p95 regressions over threshold:\n  " + "\n  ".join(slower), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
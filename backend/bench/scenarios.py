@@ -0,0 +1,123 @@
+"""Benchmark scenarios: one HTTP call against the backend per iteration.
+
+Payloads mirror what the frontend sends for each flow. Scenarios that hit
+`/api/send-*` measure enqueue latency (those routes answer 202 and deliver
+in the background); watch the mock's /__stats for delivery throughput.
+"""
+
+import io
+import os
+import random
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+
+from PIL import Image
+
+
+@dataclass
+class Call:
+    method: str
+    path: str
+    kwargs: Dict[str, Any]
+
+
+Scenario = Callable[[int], Call]
+
+_CONTACT = {
+    "fullName": "Bench User",
+    "email": "bench@example.com",
+    "phone": "+15555550100",
+    "address": "1 Benchmark Way",
+    "consentToText": True,
+}
+_JOBS = [
+    {"id": "tv-mount", "name": "TV mounting", "price": 120},
+    {"id": "shelf", "name": "Shelf install", "price": 80},
+    {"id": "faucet", "name": "Faucet replacement", "price": 150},
+]
+
+
+def _store(form_type: str, meta: Dict[str, Any], **extra: Any) -> Scenario:
+    def build(i: int) -> Call:
+        return Call("POST", "/api/store-request", {"json": {
+            "source": "bench",
+            "form_type": form_type,
+            "session_id": f"bench-{form_type}-{i}",
+            "contact": _CONTACT,
+            "meta": meta,
+            **extra,
+        }})
+    return build
+
+
+def _ai_messages(count: int) -> list:
+    return [
+        {"sender": "user" if n % 2 == 0 else "assistant", "content": f"message {n} " + "lorem ipsum " * 20, "photos_count": 0}
+        for n in range(count)
+    ]
+
+
+def ai_ingest(sessions: int = 50) -> Scenario:
+    """Chat traffic: messages spread over a fixed pool of live sessions."""
+    prefix = uuid.uuid4().hex[:8]
+
+    def build(i: int) -> Call:
+        return Call("POST", "/api/ai/ingest-message", {"json": {
+            "session_id": f"bench-{prefix}-{i % sessions}",
+            "sender": "user" if i % 2 == 0 else "assistant",
+            "content": "How much to mount a 65 inch TV on drywall? " * 3,
+            "photos_count": 0,
+        }})
+    return build
+
+
+def _sample_jpeg(side: int) -> bytes:
+    img = Image.effect_noise((side, side), 64).convert("RGB")
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def upload(photos: int = 3, side: int = 2048) -> Scenario:
+    """Photo upload; every file gets unique trailing bytes so dedup never short-circuits it."""
+    base = _sample_jpeg(side)
+
+    def build(i: int) -> Call:
+        files = [
+            ("files", (f"photo{n}.jpg", base + os.urandom(16), "image/jpeg"))
+            for n in range(photos)
+        ]
+        return Call("POST", "/api/upload", {
+            "data": {"request_id": str(uuid.uuid4()), "origin": "bench", "session_id": f"bench-upload-{i}"},
+            "files": files,
+        })
+    return build
+
+
+def notify_telegram(i: int) -> Call:
+    return Call("POST", "/api/send-telegram", {"json": {"text": f"Bench lead #{i}\n" + "details " * 40}})
+
+
+def notify_sms(i: int) -> Call:
+    return Call("POST", "/api/send-sms", {"json": {"to": "+15555550100", "text": f"Bench lead #{i}"}})
+
+
+def build_scenarios(photos: int, photo_side: int) -> Dict[str, Callable[[], Scenario]]:
+    """Scenario name -> factory (factories do the one-off setup, e.g. sample images)."""
+    return {
+        "store_contact": lambda: _store("contact", {"description": "Leaky faucet in the kitchen"}),
+        "store_hourly": lambda: _store("hourly", {"hourlyPackage": "3h", "description": "Odd jobs around the house"}),
+        "store_dynamic": lambda: _store("dynamic", {
+            "projectDescription": "Bathroom refresh",
+            "timeline": "2 weeks",
+            "mainCategories": ["plumbing", "painting"],
+            "serviceGroups": ["bathroom"],
+            "detailedServices": ["faucet", "paint"],
+        }, jobs=_JOBS),
+        "store_ai": lambda: _store("ai", {"summary": "AI estimate"}, jobs=_JOBS, messages=_ai_messages(random.randint(8, 24))),
+        "ai_ingest": ai_ingest,
+        "upload": lambda: upload(photos, photo_side),
+        "notify_telegram": lambda: notify_telegram,
+        "notify_sms": lambda: notify_sms,
+    }
@@ -0,0 +1,112 @@
+"""CPU cost of one /api/store-request payload through the JSON layer, by size.
+
+Compares the stdlib path (json.loads into `Dict[str, Any]` items, stdlib
+`json=` bodies, jsonable_encoder + json.dumps for the response) with the
+orjson path the backend uses now (orjson.loads into typed items,
+pre-encoded bodies, ORJSONResponse). Row building and network I/O are the
+same for both and left out. Run from backend/:
+
+    python -m bench.serialization --messages 10,100,1000,5000
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import BaseModel
+
+from app.core.serialization import dumps, dumps_canonical
+from app.routes.requests import _child_rows
+from app.schemas import StoreRequestPayload
+from bench.scenarios import _CONTACT, _JOBS
+
+
+class _UntypedPayload(BaseModel):
+    """StoreRequestPayload as it was before the typed items."""
+
+    source: Optional[str] = None
+    form_type: Optional[str] = None
+    session_id: Optional[str] = None
+    contact: Optional[Dict[str, Any]] = None
+    jobs: Optional[List[Dict[str, Any]]] = None
+    messages: Optional[List[Dict[str, Any]]] = None
+    photos: Optional[List[Dict[str, Any]]] = None
+    meta: Optional[Dict[str, Any]] = None
+
+
+def build_payload(messages: int) -> bytes:
+    return json.dumps({
+        "source": "bench",
+        "form_type": "ai",
+        "session_id": "bench-serialization",
+        "contact": _CONTACT,
+        "meta": {"summary": "AI estimate"},
+        "jobs": _JOBS,
+        "messages": [
+            {
+                "sender": "user" if n % 2 == 0 else "ai",
+                "content": f"message {n} " + "lorem ipsum dolor sit amet " * 12,
+                "photos_count": n % 3,
+                "session_id": "bench-serialization",
+            }
+            for n in range(messages)
+        ],
+        "photos": [{"url": f"https://example.com/p{n}.jpg", "name": f"p{n}.jpg", "origin": "ai-message"} for n in range(messages // 10)],
+    }).encode()
+
+
+_RESPONSE = {"ok": True, "stored": True, "request_id": "00000000-0000-0000-0000-000000000000", "children": [
+    {"table": t, "rows": 1, "ok": True} for t in ("ai_messages", "ai_jobs", "request_jobs", "request_messages", "request_photos")
+]}
+
+
+def stdlib_path(raw: bytes, rows: list) -> None:
+    payload = _UntypedPayload.model_validate(json.loads(raw))
+    json.dumps(payload.model_dump(), sort_keys=True, separators=(",", ":"), default=str, ensure_ascii=False).encode()
+    for _, table_rows in rows:
+        json.dumps(table_rows, separators=(",", ":"), ensure_ascii=False).encode()  # what httpx's json= does
+    JSONResponse(jsonable_encoder(_RESPONSE))
+
+
+def orjson_path(raw: bytes, rows: list) -> None:
+    payload = StoreRequestPayload.model_validate(orjson.loads(raw))
+    dumps_canonical(payload.model_dump())
+    for _, table_rows in rows:
+        dumps(table_rows)
+    ORJSONResponse(_RESPONSE)
+
+
+def cpu_per_call(fn: Callable[[], None], min_seconds: float) -> float:
+    """Mean process CPU seconds per call, repeating until `min_seconds` of CPU is spent."""
+    fn()  # warm up
+    calls = 0
+    start = time.process_time()
+    while True:
+        fn()
+        calls += 1
+        spent = time.process_time() - start
+        if spent >= min_seconds:
+            return spent / calls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", default="10,100,1000,5000", help="comma-separated message counts")
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="CPU time spent per measurement")
+    args = parser.parse_args()
+
+    print(f"{'messages':>8} {'payload':>10} {'stdlib µs':>11} {'orjson µs':>11} {'saved':>7}")
+    for count in (int(n) for n in args.messages.split(",")):
+        raw = build_payload(count)
+        rows = _child_rows(StoreRequestPayload.model_validate_json(raw), "00000000-0000-0000-0000-000000000000")
+        before = cpu_per_call(lambda: stdlib_path(raw, rows), args.min_seconds)
+        after = cpu_per_call(lambda: orjson_path(raw, rows), args.min_seconds)
+        print(f"{count:>8} {len(raw) / 1024:>8.1f}KB {before * 1e6:>11.0f} {after * 1e6:>11.0f} {1 - after / before:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
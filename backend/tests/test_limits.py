@@ -0,0 +1,175 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+
+from app.core.config import MB, BodyLimit
+from app.core.limits import BodyLimitMiddleware, MultipartScanner
+
+
+BOUNDARY = b"XyZ123boundary"
+
+
+def part(name: str, body: bytes, filename: str = None) -> bytes:
+    disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+    return (
+        b"--" + BOUNDARY + b"\r\n"
+        + f"Content-Disposition: {disposition}\r\n".encode()
+        + b"Content-Type: application/octet-stream\r\n\r\n"
+        + body + b"\r\n"
+    )
+
+
+def form(*parts: bytes) -> bytes:
+    return b"".join(parts) + b"--" + BOUNDARY + b"--\r\n"
+
+
+def chunks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def scan(data: bytes, limit: BodyLimit, chunk_size: int) -> MultipartScanner:
+    scanner = MultipartScanner(BOUNDARY, limit)
+    for chunk in chunks(data, chunk_size):
+        scanner.feed(chunk)
+    return scanner
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 16, 17, 64, 4096])
+def test_boundaries_split_across_chunks(chunk_size):
+    # File bodies that contain boundary-like bytes must not be split into parts.
+    tricky = b"--" + BOUNDARY[:-1] + b"\r\n--" + BOUNDARY[:5]
+    data = form(
+        part("request_id", b"42"),
+        part("files", b"a" * 100, "a.jpg"),
+        part("files", tricky * 3, "b.jpg"),
+        part("files", b"", "c.jpg"),
+    )
+    scanner = scan(data, BodyLimit(max_body=MB, max_files=3, max_file=100), chunk_size)
+    assert scanner.files == 3
+
+
+def test_only_file_parts_count_against_the_limits():
+    data = form(part("note", b"x" * 500), part("files", b"y" * 100, "a.jpg"))
+    assert scan(data, BodyLimit(max_body=MB, max_files=1, max_file=100), 13).files == 1
+    with pytest.raises(HTTPException):
+        scan(data, BodyLimit(max_body=MB, max_files=1, max_file=99), 13)
+
+
+@pytest.mark.parametrize("chunk_size", [5, 4096])
+def test_too_many_parts(chunk_size):
+    data = form(*(part("files", b"z" * 10, f"{n}.jpg") for n in range(4)))
+    with pytest.raises(HTTPException) as exc:
+        scan(data, BodyLimit(max_body=MB, max_files=3, max_file=MB), chunk_size)
+    assert exc.value.status_code == 413
+    assert "Too many files" in exc.value.detail
+
+
+@pytest.mark.parametrize("chunk_size", [5, 4096])
+def test_oversized_single_part(chunk_size):
+    data = form(part("files", b"ok", "small.jpg"), part("files", b"z" * 1025, "big.jpg"))
+    with pytest.raises(HTTPException) as exc:
+        scan(data, BodyLimit(max_body=MB, max_files=5, max_file=1024), chunk_size)
+    assert exc.value.status_code == 413
+    assert "File too large" in exc.value.detail
+
+
+def test_part_at_the_file_limit_passes():
+    data = form(part("files", b"z" * 1024, "exact.jpg"))
+    assert scan(data, BodyLimit(max_body=MB, max_files=1, max_file=1024), 100).files == 1
+
+
+def test_oversized_part_headers():
+    data = b"--" + BOUNDARY + b"\r\nX-Padding: " + b"h" * (20 * 1024)
+    with pytest.raises(HTTPException) as exc:
+        scan(data, BodyLimit(max_body=MB, max_files=1, max_file=MB), 1024)
+    assert exc.value.status_code == 413
+
+
+# BodyLimitMiddleware, end to end over ASGI
+
+
+def make_app(limits):
+    api = FastAPI()
+    reached = []
+
+    @api.post("/api/upload")
+    async def upload(request: Request):
+        body = await request.body()
+        reached.append(len(body))
+        return {"bytes": len(body)}
+
+    @api.post("/api/other")
+    async def other(request: Request):
+        body = await request.body()
+        reached.append(len(body))
+        return {"bytes": len(body)}
+
+    middleware = BodyLimitMiddleware(api)
+    middleware.limits = limits
+    middleware.default = BodyLimit(max_body=100)
+    return middleware, reached
+
+
+def post(app, path, data: bytes, chunk_size: int, headers=None):
+    sent = []
+
+    async def stream():
+        for chunk in chunks(data, chunk_size):
+            sent.append(len(chunk))
+            yield chunk
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(path, content=stream(), headers=headers)
+
+    return asyncio.run(run()), sent
+
+
+CONTENT_TYPE = {"content-type": f"multipart/form-data; boundary={BOUNDARY.decode()}"}
+
+
+def test_413_partway_through_a_streamed_body():
+    app, reached = make_app({})
+    resp, sent = post(app, "/api/other", b"x" * 1000, 30)
+    assert resp.status_code == 413
+    assert "too large" in resp.json()["detail"]
+    assert reached == []
+    # Rejected as soon as the limit was crossed, not after reading everything.
+    assert sum(sent) < 1000
+
+
+def test_413_partway_through_a_multipart_upload():
+    limit = BodyLimit(max_body=MB, max_files=2, max_file=64)
+    app, reached = make_app({"/api/upload": limit})
+    data = form(part("files", b"a" * 10, "a.jpg"), part("files", b"b" * 500, "b.jpg"), part("files", b"c" * 10, "c.jpg"))
+    resp, sent = post(app, "/api/upload", data, 40, CONTENT_TYPE)
+    assert resp.status_code == 413
+    assert "File too large" in resp.json()["detail"]
+    assert reached == []
+    assert sum(sent) < len(data)
+
+
+def test_declared_content_length_over_the_limit():
+    app, reached = make_app({})
+    resp, _ = post(app, "/api/other", b"x" * 101, 101, {"content-length": "101"})
+    assert resp.status_code == 413
+    assert reached == []
+
+
+def test_bodies_within_the_limits_pass():
+    limit = BodyLimit(max_body=MB, max_files=2, max_file=64)
+    app, reached = make_app({"/api/upload": limit})
+    data = form(part("files", b"a" * 64, "a.jpg"), part("files", b"b" * 64, "b.jpg"))
+    resp, _ = post(app, "/api/upload", data, 7, CONTENT_TYPE)
+    assert resp.status_code == 200
+    assert reached == [len(data)]
+
+
+def test_route_limit_prefix_match():
+    app, _ = make_app({"/api/upload/sessions/*": BodyLimit(max_body=4 * MB), "/api/upload": BodyLimit(max_body=MB)})
+    assert app.route_limit("/api/upload/sessions/abc").max_body == 4 * MB
+    assert app.route_limit("/api/upload").max_body == MB
+    assert app.route_limit("/api/store-request").max_body == 100
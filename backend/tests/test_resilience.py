@@ -0,0 +1,347 @@
+import asyncio
+from typing import Callable, List, Optional
+
+import httpx
+import pytest
+
+from app.core import resilience
+from app.core.config import parse_deadlines
+from app.core.resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    ResilientTransport,
+    hedged,
+)
+
+
+class FakeClock:
+    """Stands in for the `time` module inside resilience; only moves when told to."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(resilience, "time", fake)
+    return fake
+
+
+class FakeTransport(httpx.AsyncBaseTransport):
+    """Answers with `status` after `latency` seconds of fake time, or raises `error`."""
+
+    def __init__(self, clock: FakeClock):
+        self.clock = clock
+        self.status = 200
+        self.latency = 0.0
+        self.error: Optional[Callable[[httpx.Request], Exception]] = None
+        self.calls = 0
+        self.timeouts: List[dict] = []
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        self.timeouts.append(dict(request.extensions.get("timeout") or {}))
+        self.clock.advance(self.latency)
+        if self.error is not None:
+            raise self.error(request)
+        return httpx.Response(self.status, request=request)
+
+
+def make_breaker(**overrides) -> CircuitBreaker:
+    options = dict(
+        failure_rate=0.5, min_calls=4, window=10.0, slow_call=2.0, open_seconds=30.0, half_open_calls=2
+    )
+    options.update(overrides)
+    return CircuitBreaker("test", **options)
+
+
+def get(transport: httpx.AsyncBaseTransport, timeout=5.0, deadline: Optional[float] = None) -> httpx.Response:
+    async def run():
+        if deadline is not None:
+            resilience._deadline.set(deadline)
+        async with httpx.AsyncClient(transport=transport, timeout=timeout) as client:
+            return await client.get("http://upstream.test/x")
+
+    return asyncio.run(run())
+
+
+# CircuitBreaker
+
+
+def test_breaker_opens_half_opens_and_closes(clock):
+    upstream = FakeTransport(clock)
+    breaker = make_breaker()
+    transport = ResilientTransport(upstream, breaker)
+
+    upstream.status = 500
+    for _ in range(3):
+        assert get(transport).status_code == 500
+    assert breaker.state == CLOSED  # below min_calls
+    get(transport)
+    assert breaker.state == OPEN
+
+    # Refused locally while open; the upstream isn't called.
+    with pytest.raises(CircuitOpenError) as exc:
+        get(transport)
+    assert exc.value.retry_after == pytest.approx(30.0)
+    assert upstream.calls == 4
+
+    clock.advance(30.0)
+    upstream.status = 200
+    assert get(transport).status_code == 200
+    assert breaker.state == HALF_OPEN
+    assert get(transport).status_code == 200
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["calls"] == 0
+
+
+def test_half_open_failure_reopens(clock):
+    upstream = FakeTransport(clock)
+    breaker = make_breaker(min_calls=1)
+    transport = ResilientTransport(upstream, breaker)
+    upstream.status = 503
+    get(transport)
+    assert breaker.state == OPEN
+
+    clock.advance(30.0)
+    get(transport)
+    assert breaker.state == OPEN
+    assert breaker.retry_after() == pytest.approx(30.0)
+
+
+def test_half_open_limits_trial_calls(clock):
+    breaker = make_breaker(min_calls=1, half_open_calls=2)
+    breaker.record(True)
+    clock.advance(30.0)
+    breaker.before_call()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    # A trial that ended without an answer frees its slot.
+    breaker.release()
+    breaker.before_call()
+
+
+def test_slow_calls_count_as_failures(clock):
+    upstream = FakeTransport(clock)
+    breaker = make_breaker()
+    transport = ResilientTransport(upstream, breaker)
+    upstream.latency = 2.5
+    for _ in range(4):
+        assert get(transport).status_code == 200
+    assert breaker.state == OPEN
+
+
+def test_failures_leave_the_window(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record(True)
+    clock.advance(11.0)
+    breaker.record(True)
+    assert breaker.state == CLOSED
+    assert breaker.snapshot() == {"state": CLOSED, "calls": 1, "failures": 1, "retry_after": 0.0}
+
+
+def test_failure_rate_below_threshold_stays_closed(clock):
+    breaker = make_breaker()
+    for failed in (False, False, False, True, False, True):
+        breaker.record(failed)
+    assert breaker.state == CLOSED
+    breaker.record(True)
+    breaker.record(True)
+    assert breaker.state == OPEN
+
+
+# Deadlines
+
+
+def test_timeouts_are_clamped_to_the_remaining_budget(clock):
+    upstream = FakeTransport(clock)
+    get(ResilientTransport(upstream, None), timeout=5.0, deadline=clock.now + 2.0)
+    assert upstream.timeouts[-1] == {"connect": 2.0, "read": 2.0, "write": 2.0, "pool": 2.0}
+
+
+def test_shorter_and_unset_timeouts(clock):
+    upstream = FakeTransport(clock)
+    timeout = httpx.Timeout(None, connect=1.0)
+    get(ResilientTransport(upstream, None), timeout=timeout, deadline=clock.now + 3.0)
+    assert upstream.timeouts[-1] == {"connect": 1.0, "read": 3.0, "write": 3.0, "pool": 3.0}
+
+
+def test_no_deadline_leaves_timeouts_alone(clock):
+    upstream = FakeTransport(clock)
+    get(ResilientTransport(upstream, None), timeout=5.0)
+    assert upstream.timeouts[-1] == {"connect": 5.0, "read": 5.0, "write": 5.0, "pool": 5.0}
+
+
+def test_spent_budget_fails_before_calling(clock):
+    upstream = FakeTransport(clock)
+    with pytest.raises(DeadlineExceeded):
+        get(ResilientTransport(upstream, None), deadline=clock.now)
+    assert upstream.calls == 0
+
+
+def test_clamped_timeout_is_a_deadline_not_an_upstream_failure(clock):
+    upstream = FakeTransport(clock)
+    upstream.error = lambda request: httpx.ReadTimeout("timed out", request=request)
+    upstream.latency = 1.0
+    breaker = make_breaker(min_calls=1)
+    with pytest.raises(DeadlineExceeded):
+        get(ResilientTransport(upstream, breaker), deadline=clock.now + 1.0)
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["calls"] == 0
+
+    # Unless the call was slow by the breaker's own standard too.
+    upstream.latency = 2.0
+    with pytest.raises(DeadlineExceeded):
+        get(ResilientTransport(upstream, breaker), deadline=clock.now + 2.0)
+    assert breaker.state == OPEN
+
+
+def test_unclamped_timeout_counts_against_the_upstream(clock):
+    upstream = FakeTransport(clock)
+    upstream.error = lambda request: httpx.ConnectTimeout("timed out", request=request)
+    breaker = make_breaker(min_calls=1)
+    with pytest.raises(httpx.ConnectTimeout):
+        get(ResilientTransport(upstream, breaker), timeout=1.0, deadline=clock.now + 10.0)
+    assert breaker.state == OPEN
+
+
+def test_parse_deadlines():
+    assert parse_deadlines("/api/a=10, /api/b/*=off") == [("/api/a", 10.0), ("/api/b/*", 0.0)]
+    for bad in ("api/a=1", "/api/a", "/api/a=-1", "/api/a=soon"):
+        with pytest.raises(RuntimeError):
+            parse_deadlines(bad)
+
+
+# hedged
+
+
+def test_hedged_cancels_the_slower_attempt():
+    async def run():
+        started, cancelled = [], []
+        release_first = asyncio.Event()
+
+        async def call():
+            attempt = len(started)
+            started.append(attempt)
+            try:
+                if attempt == 0:
+                    await release_first.wait()
+                return attempt
+            except asyncio.CancelledError:
+                cancelled.append(attempt)
+                raise
+
+        result = await hedged(call, 0.01)
+        await asyncio.sleep(0)
+        return result, started, cancelled
+
+    assert asyncio.run(run()) == (1, [0, 1], [0])
+
+
+def test_hedged_fast_first_call_sends_no_copy():
+    async def run():
+        calls = []
+
+        async def call():
+            calls.append(1)
+            return "ok"
+
+        return await hedged(call, 1.0), len(calls)
+
+    assert asyncio.run(run()) == ("ok", 1)
+
+
+def test_hedged_failure_of_one_attempt_lets_the_other_win():
+    async def run():
+        started = []
+        first_may_fail = asyncio.Event()
+
+        async def call():
+            attempt = len(started)
+            started.append(attempt)
+            if attempt == 0:
+                await first_may_fail.wait()
+                raise RuntimeError("first failed")
+            first_may_fail.set()
+            await asyncio.sleep(0.01)
+            return "second"
+
+        return await hedged(call, 0.01)
+
+    assert asyncio.run(run()) == "second"
+
+
+def test_hedged_raises_when_both_attempts_fail():
+    async def run():
+        async def call():
+            await asyncio.sleep(0.02)
+            raise RuntimeError("down")
+
+        await hedged(call, 0.01)
+
+    with pytest.raises(RuntimeError, match="down"):
+        asyncio.run(run())
+
+
+def test_cancelling_the_caller_before_the_hedge_cancels_the_attempt():
+    async def run():
+        started, cancelled = asyncio.Event(), []
+
+        async def call():
+            started.set()
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        caller = asyncio.ensure_future(hedged(call, 10.0))
+        await started.wait()
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.sleep(0)
+        # Copied before asyncio.run() cancels whatever is still left over.
+        return list(cancelled)
+
+    assert asyncio.run(run()) == [True]
+
+
+def test_cancelled_hedge_frees_its_half_open_trial(clock):
+    breaker = make_breaker(min_calls=1, half_open_calls=1)
+    breaker.record(True)
+    clock.advance(30.0)
+
+    class Hanging(httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request):
+            await asyncio.Event().wait()
+
+    async def run():
+        transport = ResilientTransport(Hanging(), breaker)
+        async with httpx.AsyncClient(transport=transport) as client:
+            task = asyncio.ensure_future(client.get("http://upstream.test/x"))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    asyncio.run(run())
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()  # the cancelled call's trial slot is free again
@@ -0,0 +1,101 @@
+import pytest
+
+from app.core.telegram import (
+    DOCUMENT_UPLOAD_MAX_BYTES,
+    DOCUMENT_URL_MAX_BYTES,
+    PHOTO_UPLOAD_MAX_BYTES,
+    PHOTO_URL_MAX_BYTES,
+    MediaItem,
+    classify,
+    plan_groups,
+)
+
+
+def items(kind: str, count: int, prefix: str = "") -> list:
+    return [MediaItem(kind, f"{prefix or kind}{n}") for n in range(count)]
+
+
+def shape(groups):
+    return [(group[0].kind, len(group)) for group in groups]
+
+
+@pytest.mark.parametrize(
+    "count, sizes",
+    [
+        (0, []),
+        (1, [1]),
+        (2, [2]),
+        (10, [10]),
+        (11, [6, 5]),
+        (20, [10, 10]),
+        (21, [7, 7, 7]),
+        (23, [8, 8, 7]),
+    ],
+)
+def test_balanced_split(count, sizes):
+    groups = plan_groups(items("photo", count))
+    assert [len(g) for g in groups] == sizes
+    assert all(len(g) <= 10 for g in groups)
+    # Order is kept across groups.
+    assert [it.filename for g in groups for it in g] == [f"photo{n}" for n in range(count)]
+
+
+@pytest.mark.parametrize(
+    "photos, documents, expected",
+    [
+        (3, 2, [("photo", 3), ("document", 2)]),
+        (11, 1, [("photo", 6), ("photo", 5), ("document", 1)]),
+        (0, 12, [("document", 6), ("document", 6)]),
+        (1, 10, [("photo", 1), ("document", 10)]),
+    ],
+)
+def test_mixed_types_never_share_a_group(photos, documents, expected):
+    mixed = []
+    for n in range(max(photos, documents)):
+        if n < documents:
+            mixed.append(MediaItem("document", f"d{n}"))
+        if n < photos:
+            mixed.append(MediaItem("photo", f"p{n}"))
+    groups = plan_groups(mixed)
+    assert shape(groups) == expected
+    assert all(len({it.kind for it in g}) == 1 for g in groups)
+
+
+def test_unsendable_items_are_left_out():
+    groups = plan_groups([MediaItem("", "huge.bin"), *items("photo", 2)])
+    assert shape(groups) == [("photo", 2)]
+
+
+MB = 1024 * 1024
+
+
+@pytest.mark.parametrize(
+    "content_type, filename, size, by_url, expected",
+    [
+        # Images by content type or extension go as photos.
+        ("image/jpeg", "upload", 100, False, "photo"),
+        ("IMAGE/PNG", "upload", 100, False, "photo"),
+        ("image/webp", "upload", None, False, "photo"),
+        (None, "IMG_1.JPG", 100, False, "photo"),
+        ("application/octet-stream", "a.jpeg", 100, False, "photo"),
+        (None, "a.webp", 100, True, "photo"),
+        # Other formats (incl. other images) go as documents.
+        ("image/gif", "a.gif", 100, False, "document"),
+        ("image/heic", "a.heic", 100, False, "document"),
+        ("application/pdf", "a.pdf", 100, False, "document"),
+        (None, "notes.txt", None, False, "document"),
+        # Photo size limits: 10 MB uploaded, 5 MB by URL.
+        ("image/jpeg", "a.jpg", PHOTO_UPLOAD_MAX_BYTES, False, "photo"),
+        ("image/jpeg", "a.jpg", PHOTO_UPLOAD_MAX_BYTES + 1, False, "document"),
+        ("image/jpeg", "a.jpg", PHOTO_URL_MAX_BYTES, True, "photo"),
+        ("image/jpeg", "a.jpg", PHOTO_URL_MAX_BYTES + 1, True, "document"),
+        # Document size limits: 50 MB uploaded, 20 MB by URL; beyond them nothing.
+        ("image/jpeg", "a.jpg", DOCUMENT_UPLOAD_MAX_BYTES, False, "document"),
+        ("image/jpeg", "a.jpg", DOCUMENT_UPLOAD_MAX_BYTES + 1, False, None),
+        ("application/pdf", "a.pdf", DOCUMENT_URL_MAX_BYTES, True, "document"),
+        ("application/pdf", "a.pdf", DOCUMENT_URL_MAX_BYTES + 1, True, None),
+        ("application/pdf", "a.pdf", 30 * MB, False, "document"),
+    ],
+)
+def test_classify(content_type, filename, size, by_url, expected):
+    assert classify(content_type, filename, size, by_url=by_url) == expected
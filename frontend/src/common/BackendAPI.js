@@ -64,6 +64,24 @@ export const sendTelegramWithPhotos = async (photos = [], caption = '') => {
   return res.json().catch(() => ({}));
 };
 
+// Forward photos already uploaded via uploadPhotos for a request (optionally only some storage paths)
+// so the browser does not upload the same bytes twice.
+export const sendTelegramStoredPhotos = async ({ requestId = null, storagePaths = null, caption = '' }) => {
+  const payload = { text: caption || '' };
+  if (requestId) payload.request_id = String(requestId);
+  if (Array.isArray(storagePaths) && storagePaths.length > 0) payload.storage_paths = storagePaths;
+  const res = await fetch(apiUrl('/api/send-telegram-stored'), {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(payload),
+  });
+  if (!res.ok) {
+    const t = await res.text().catch(() => '');
+    throw new Error(`sendTelegramStoredPhotos failed: ${res.status} ${t}`);
+  }
+  return res.json().catch(() => ({}));
+};
+
 export const sendTelegramDocument = async (blob, filename = 'dialog.txt', caption = '') => {
   const fd = new FormData();
   if (caption) fd.append('caption', caption);
@@ -76,10 +94,47 @@ export const sendTelegramDocument = async (blob, filename = 'dialog.txt', captio
   return res.json().catch(() => ({}));
 };
 
-export const storeRequest = async (payload) => {
-  const res = await fetch(apiUrl('/api/store-request'), {
+// The backend renders the dialog from the messages it already stored for the
+// session, so long chats are not uploaded again.
+export const sendTelegramTranscript = async ({ sessionId, requestId, caption = '', gzip = false }) => {
+  const res = await fetch(apiUrl('/api/send-transcript'), {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ session_id: sessionId, request_id: requestId, caption, gzip }),
+  });
+  if (!res.ok) {
+    const t = await res.text().catch(() => '');
+    throw new Error(`sendTelegramTranscript failed: ${res.status} ${t}`);
+  }
+  return res.json().catch(() => ({}));
+};
+
+// Idempotency-Key shared by every attempt of one logical submission, so the
+// backend replays the first stored response instead of creating duplicates.
+const newIdempotencyKey = () => {
+  if (typeof crypto !== 'undefined' && crypto.randomUUID) return crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+};
+
+const RETRY_DELAYS_MS = [500, 1500];
+
+// Retries network errors and 5xx/429 responses with the same request.
+const fetchWithRetry = async (url, init) => {
+  for (let attempt = 0; ; attempt += 1) {
+    try {
+      const res = await fetch(url, init);
+      if ((res.status < 500 && res.status !== 429) || attempt >= RETRY_DELAYS_MS.length) return res;
+    } catch (e) {
+      if (attempt >= RETRY_DELAYS_MS.length) throw e;
+    }
+    await new Promise((resolve) => setTimeout(resolve, RETRY_DELAYS_MS[attempt]));
+  }
+};
+
+export const storeRequest = async (payload, { idempotencyKey = newIdempotencyKey() } = {}) => {
+  const res = await fetchWithRetry(apiUrl('/api/store-request'), {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKey },
     body: JSON.stringify(payload),
   });
   if (!res.ok) {
@@ -90,29 +145,153 @@ export const storeRequest = async (payload) => {
 };
 
 
-export const uploadPhotos = async ({ requestId, origin, files, sessionId }) => {
-  if (!requestId || !Array.isArray(files) || files.length === 0) return { ok: true, uploaded: 0 };
+const CHUNK_RETRY_DELAYS_MS = [500, 1500, 3000, 5000, 10000];
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+const failIfNotOk = async (res, what) => {
+  if (!res.ok) {
+    const t = await res.text().catch(() => '');
+    throw new Error(`${what} failed: ${res.status} ${t}`);
+  }
+  return res.json().catch(() => ({}));
+};
+
+// PUT the file's remaining chunks at the offsets the server reports.
+const sendChunks = async (sessionUrl, file, created) => {
+  let offset = created.offset || 0;
+  let failures = 0;
+  while (offset < file.size) {
+    try {
+      const res = await fetch(`${sessionUrl}?offset=${offset}`, {
+        method: 'PUT',
+        headers: { 'Content-Type': 'application/octet-stream' },
+        body: file.slice(offset, offset + created.chunk_size),
+      });
+      if (res.ok) {
+        offset = (await res.json()).offset;
+        failures = 0;
+        continue;
+      }
+      // 409: out of sync with the server (e.g. an earlier attempt landed); resync below.
+      if (res.status !== 409 && res.status !== 429 && res.status < 500) await failIfNotOk(res, 'uploadPhotos (chunk)');
+    } catch (e) {
+      if (!(e instanceof TypeError)) throw e; // TypeError = network failure
+    }
+    if (failures >= CHUNK_RETRY_DELAYS_MS.length) throw new Error('uploadPhotos failed: too many interrupted chunks');
+    await sleep(CHUNK_RETRY_DELAYS_MS[failures]);
+    failures += 1;
+    try {
+      const state = await fetch(sessionUrl);
+      if (state.ok) offset = (await state.json()).offset;
+    } catch (e) { /* still offline; retry the same offset */ }
+  }
+};
+
+// One file through a resumable upload session: chunks are PUT at the offset
+// the server reports, so a dropped connection resumes where the server got to
+// instead of starting the file over.
+const uploadFileResumable = async ({ requestId, origin, sessionId, file, name, idempotencyKey }) => {
+  const created = await failIfNotOk(await fetchWithRetry(apiUrl('/api/upload/sessions'), {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({
+      request_id: String(requestId),
+      filename: name,
+      size: file.size,
+      content_type: file.type || null,
+      origin: origin ? String(origin) : '',
+      session_id: sessionId ? String(sessionId) : '',
+    }),
+  }), 'uploadPhotos (create session)');
+  const sessionUrl = apiUrl(`/api/upload/sessions/${created.upload_id}`);
+  try {
+    await sendChunks(sessionUrl, file, created);
+  } catch (e) {
+    // Unfinished sessions count against a per-client cap until they expire;
+    // give this one back (best effort).
+    fetch(sessionUrl, { method: 'DELETE' }).catch(() => {});
+    throw e;
+  }
+  return failIfNotOk(await fetchWithRetry(`${sessionUrl}/complete`, {
+    method: 'POST',
+    headers: { 'Idempotency-Key': idempotencyKey },
+  }), 'uploadPhotos (complete)');
+};
+
+// Files below this go together through one multipart POST /api/upload; only
+// larger ones, where restarting after a dropped connection is expensive, get
+// a resumable session (one chunk is 4 MB by default, so smaller files gain
+// nothing from one).
+const RESUMABLE_MIN_BYTES = 4 * 1024 * 1024;
+// Batches for /api/upload stay well inside its default limits (20 files, 100 MB).
+const UPLOAD_BATCH_FILES = 20;
+const UPLOAD_BATCH_BYTES = 32 * 1024 * 1024;
+// Requests (batches and sessions) in flight at once.
+const UPLOAD_CONCURRENCY = 2;
+
+const uploadBatch = async ({ requestId, origin, sessionId, batch, idempotencyKey }) => {
   const fd = new FormData();
   fd.append('request_id', String(requestId));
   if (origin) fd.append('origin', String(origin));
   if (sessionId) fd.append('session_id', String(sessionId));
-  let appended = 0;
+  batch.forEach(({ file, name }) => fd.append('files', file, name));
+  return failIfNotOk(await fetchWithRetry(apiUrl('/api/upload'), {
+    method: 'POST',
+    headers: { 'Idempotency-Key': idempotencyKey },
+    body: fd,
+  }), 'uploadPhotos');
+};
+
+export const uploadPhotos = async ({ requestId, origin, files, sessionId, idempotencyKey = newIdempotencyKey() }) => {
+  if (!requestId || !Array.isArray(files) || files.length === 0) return { ok: true, uploaded: 0 };
+  const small = [];
+  const large = [];
   files.forEach((p, idx) => {
     const file = p && p.file instanceof File ? p.file : null;
-    if (file) {
-      fd.append('files', file, p.name || `photo-${idx}.jpg`);
-      appended += 1;
+    if (!file || file.size === 0) return;
+    (file.size >= RESUMABLE_MIN_BYTES ? large : small).push({ file, name: p.name || `photo-${idx}.jpg`, idx });
+  });
+
+  const batches = [];
+  let batch = [];
+  let batchBytes = 0;
+  small.forEach((entry) => {
+    if (batch.length >= UPLOAD_BATCH_FILES || (batch.length > 0 && batchBytes + entry.file.size > UPLOAD_BATCH_BYTES)) {
+      batches.push(batch);
+      batch = [];
+      batchBytes = 0;
     }
+    batch.push(entry);
+    batchBytes += entry.file.size;
   });
-  if (appended === 0) return { ok: true, uploaded: 0 };
-  const res = await fetch(apiUrl('/api/upload'), { method: 'POST', body: fd });
-  if (!res.ok) {
-    const t = await res.text().catch(() => '');
-    throw new Error(`uploadPhotos failed: ${res.status} ${t}`);
-  }
-  return res.json().catch(() => ({}));
-};
+  if (batch.length > 0) batches.push(batch);
 
+  // Keyed by each batch's first file index, so the order of items is stable.
+  const results = [];
+  const tasks = [
+    ...batches.map((b) => () => uploadBatch({
+      requestId, origin, sessionId, batch: b, idempotencyKey: `${idempotencyKey}-b${b[0].idx}`,
+    }).then((res) => { results.push([b[0].idx, res]); })),
+    ...large.map(({ file, name, idx }) => () => uploadFileResumable({
+      requestId, origin, sessionId, file, name, idempotencyKey: `${idempotencyKey}-${idx}`,
+    }).then((res) => { results.push([idx, res]); })),
+  ];
+  let next = 0;
+  const worker = async () => {
+    while (next < tasks.length) {
+      const task = tasks[next];
+      next += 1;
+      await task();
+    }
+  };
+  await Promise.all(Array.from({ length: Math.min(UPLOAD_CONCURRENCY, tasks.length) }, worker));
+
+  const items = results
+    .sort((a, b) => a[0] - b[0])
+    .flatMap(([, res]) => (Array.isArray(res.items) ? res.items : []));
+  return { ok: true, uploaded: items.length, items };
+};
 
 // AI realtime persistence
 export const aiEnsureRequest = async ({ sessionId, source = 'website' }) => {
@@ -12,7 +12,7 @@ import AIAssistantOrder from './ai/AIAssistantOrder';
 import FormToggle from './FormToggle';
 import { serviceData } from '../data/serviceData';
 import { buildTelegramMessage } from '../common/MessageFormatter';
-import { sendSms as backendSendSms, sendTelegram as backendSendTelegram, sendTelegramWithPhotos as backendSendTelegramWithPhotos, storeRequest, uploadPhotos } from '../common/BackendAPI';
+import { sendSms as backendSendSms, sendTelegram as backendSendTelegram, sendTelegramWithPhotos as backendSendTelegramWithPhotos, sendTelegramStoredPhotos, storeRequest, uploadPhotos } from '../common/BackendAPI';
 
 const ServiceSelector = () => {
   const [formType, setFormType] = useState('dynamic'); // 'dynamic', 'hourly', or 'ai'
@@ -233,13 +233,11 @@ const ServiceSelector = () => {
               Source: 'ServiceSelector: Hourly',
             });
             try { await backendSendTelegram(tg); } catch (err) { console.warn('Backend telegram text failed:', err); }
-            if (Array.isArray(formData.hourlyPhotos) && formData.hourlyPhotos.length > 0) {
-              try { await backendSendTelegramWithPhotos(formData.hourlyPhotos, 'Hourly form photos'); } catch (err) { console.warn('Backend telegram media failed (hourly):', err); }
-            }
           } catch (err) {
             console.warn('Telegram notify failed (hourly):', err);
           }
-          // Store Hourly
+          // Store Hourly; photos go to Telegram from storage once uploaded
+          let hourlyPhotosForwarded = false;
           try {
             const stored = await storeRequest({
               source: 'website',
@@ -251,9 +249,16 @@ const ServiceSelector = () => {
             });
             const requestId = stored && stored.request_id;
             if (requestId && Array.isArray(formData.hourlyPhotos) && formData.hourlyPhotos.length > 0) {
-              try { await uploadPhotos({ requestId, origin: 'hourly', files: formData.hourlyPhotos, sessionId: sharedSessionId || null }); } catch (e) { console.warn('uploadPhotos failed (hourly):', e); }
+              try {
+                await uploadPhotos({ requestId, origin: 'hourly', files: formData.hourlyPhotos, sessionId: sharedSessionId || null });
+                await sendTelegramStoredPhotos({ requestId, caption: 'Hourly form photos' });
+                hourlyPhotosForwarded = true;
+              } catch (e) { console.warn('uploadPhotos failed (hourly):', e); }
             }
           } catch (e) { console.warn('storeRequest failed (hourly):', e); }
+          if (!hourlyPhotosForwarded && Array.isArray(formData.hourlyPhotos) && formData.hourlyPhotos.length > 0) {
+            try { await backendSendTelegramWithPhotos(formData.hourlyPhotos, 'Hourly form photos'); } catch (err) { console.warn('Backend telegram media failed (hourly):', err); }
+          }
         } else {
           const to = normalizePhone(formData.phone);
           console.log('SMS Debug - formData.phone:', formData.phone, 'normalized to:', to);
@@ -332,13 +337,11 @@ const ServiceSelector = () => {
             
             console.log('TG Message:', tg);
             try { await backendSendTelegram(tg); } catch (err) { console.warn('Backend telegram text failed:', err); }
-            if (Array.isArray(formData.photos) && formData.photos.length > 0) {
-              try { await backendSendTelegramWithPhotos(formData.photos, 'Dynamic form photos'); } catch (err) { console.warn('Backend telegram media failed (dynamic):', err); }
-            }
           } catch (err) {
             console.warn('Telegram notify failed (dynamic):', err);
           }
-          // Store Dynamic
+          // Store Dynamic; photos go to Telegram from storage once uploaded
+          let dynamicPhotosForwarded = false;
           try {
             // Map internal ids to human-readable names for TG and DB
             const labelize = (ids) => {
@@ -392,9 +395,16 @@ const ServiceSelector = () => {
             });
             const requestId = stored && stored.request_id;
             if (requestId && Array.isArray(formData.photos) && formData.photos.length > 0) {
-              try { await uploadPhotos({ requestId, origin: 'dynamic', files: formData.photos, sessionId: sharedSessionId || null }); } catch (e) { console.warn('uploadPhotos failed (dynamic):', e); }
+              try {
+                await uploadPhotos({ requestId, origin: 'dynamic', files: formData.photos, sessionId: sharedSessionId || null });
+                await sendTelegramStoredPhotos({ requestId, caption: 'Dynamic form photos' });
+                dynamicPhotosForwarded = true;
+              } catch (e) { console.warn('uploadPhotos failed (dynamic):', e); }
             }
           } catch (e) { console.warn('storeRequest failed (dynamic):', e); }
+          if (!dynamicPhotosForwarded && Array.isArray(formData.photos) && formData.photos.length > 0) {
+            try { await backendSendTelegramWithPhotos(formData.photos, 'Dynamic form photos'); } catch (err) { console.warn('Backend telegram media failed (dynamic):', err); }
+          }
         }
       }
 
@@ -4,7 +4,7 @@ import * as FiIcons from 'react-icons/fi';
 import SafeIcon from '../../common/SafeIcon';
 import AddressAutocomplete from '../../common/AddressAutocomplete';
 import { buildTelegramMessage } from '../../common/MessageFormatter';
-import { sendSms as backendSendSms, sendTelegram as backendSendTelegram, sendTelegramWithPhotos as backendSendTelegramWithPhotos, sendTelegramDocument as backendSendTelegramDocument, storeRequest, uploadPhotos, aiEnsureRequest, aiIngestMessage } from '../../common/BackendAPI';
+import { sendSms as backendSendSms, sendTelegram as backendSendTelegram, sendTelegramWithPhotos as backendSendTelegramWithPhotos, sendTelegramDocument as backendSendTelegramDocument, sendTelegramTranscript as backendSendTelegramTranscript, storeRequest, uploadPhotos, aiEnsureRequest, aiIngestMessage } from '../../common/BackendAPI';
 
 const { 
   FiSend, FiUpload, FiX, FiMapPin, FiUser, 
@@ -572,17 +572,26 @@ const AIAssistantOrder = ({ formData, onDataChange, onSubmit }) => {
 
       try {
         if (Array.isArray(formData.aiMessages) && formData.aiMessages.length > 0) {
-          const lines = formData.aiMessages.map((m) => {
-            const who = m.sender === 'user' ? 'User' : 'AI';
-            const text = typeof m.content === 'string' ? m.content : '';
-            const photosInfo = Array.isArray(m.photos) && m.photos.length > 0
-              ? ` [photos: ${m.photos.length}]`
-              : '';
-            return `${who}: ${text}${photosInfo}`;
-          });
-          const content = lines.join('\n\n');
-          const blob = new Blob([content], { type: 'text/plain' });
-          try { await backendSendTelegramDocument(blob, 'ai_dialog.txt', 'AI Assistant conversation'); } catch (err) { console.warn('Backend telegram document failed:', err); }
+          let sentByServer = false;
+          try {
+            await backendSendTelegramTranscript({ sessionId: sessionIdRef.current, caption: 'AI Assistant conversation' });
+            sentByServer = true;
+          } catch (err) {
+            console.warn('Backend transcript failed, uploading dialog instead:', err);
+          }
+          if (!sentByServer) {
+            const lines = formData.aiMessages.map((m) => {
+              const who = m.sender === 'user' ? 'User' : 'AI';
+              const text = typeof m.content === 'string' ? m.content : '';
+              const photosInfo = Array.isArray(m.photos) && m.photos.length > 0
+                ? ` [photos: ${m.photos.length}]`
+                : '';
+              return `${who}: ${text}${photosInfo}`;
+            });
+            const content = lines.join('\n\n');
+            const blob = new Blob([content], { type: 'text/plain' });
+            try { await backendSendTelegramDocument(blob, 'ai_dialog.txt', 'AI Assistant conversation'); } catch (err) { console.warn('Backend telegram document failed:', err); }
+          }
         }
       } catch (err) {
         console.warn('Telegram dialog send failed:', err);